@@ -0,0 +1,90 @@
+"""
+Several analyses of one image as separate analyze_image calls (one decode
+and one grayscale/edge pass each) against one analyze_many call (single
+decode, shared features, detectors run concurrently), for a few
+ANALYSIS_WORKERS values.
+
+    python benchmarks/analysis_combined.py
+    python benchmarks/analysis_combined.py --size 4000x3000 --types fracture,organ,lung_nodule --workers 1,2,4
+
+The film is a synthetic PNG; overlays are not encoded (overlay=url). Each
+measurement runs in a fresh process and reports the best of --repeat runs.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_ROOT))
+
+
+def synthetic_film(path: Path, height: int, width: int) -> None:
+    import cv2
+    import numpy as np
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = 120 + 60 * np.sin(x / 97.0) * np.cos(y / 131.0) + rng.normal(0, 12, (height, width))
+    gray = np.clip(base, 0, 255).astype(np.uint8)
+    path.write_bytes(cv2.imencode(".png", cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR))[1].tobytes())
+
+
+def child(path: str, which: str, types: str, repeat: int) -> dict:
+    """Runs in the measuring subprocess; ANALYSIS_WORKERS is set by the parent."""
+    from services.advanced_analysis import MedicalImageAnalyzer
+    data = Path(path).read_bytes()
+    analyzer = MedicalImageAnalyzer()
+    analysis_types = types.split(",")
+    if which == "separate":
+        run = lambda: [analyzer.analyze_image(data, t, overlay="url") for t in analysis_types]
+    else:
+        run = lambda: analyzer.analyze_many(data, analysis_types, overlay="url")
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    return {"s": best}
+
+
+def measure(path: Path, which: str, args, workers: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, __file__, "--child", str(path), which, args.types, str(args.repeat)],
+        capture_output=True, text=True, check=True, cwd=BACKEND_ROOT,
+        env={**os.environ, "ANALYSIS_WORKERS": workers},
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="3000x2500", help="height x width")
+    parser.add_argument("--types", default="fracture,organ,lung_nodule")
+    parser.add_argument("--workers", default="1,4", help="ANALYSIS_WORKERS values to compare")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--child", nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        path, which, types, repeat = args.child
+        print(json.dumps(child(path, which, types, int(repeat))))
+        return
+
+    height, width = (int(v) for v in args.size.lower().split("x"))
+    with tempfile.TemporaryDirectory() as d:
+        path = Path(d) / "film.png"
+        synthetic_film(path, height, width)
+        print(f"{args.types} on a {height}x{width} PNG; {os.cpu_count()} CPUs\n")
+        print(f"{'path':<28} {'seconds':>8}")
+        runs = [("separate calls", "separate", "1")]
+        runs += [(f"analyze_many, {w} workers", "many", w) for w in args.workers.split(",")]
+        for label, which, workers in runs:
+            print(f"{label:<28} {measure(path, which, args, workers)['s']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
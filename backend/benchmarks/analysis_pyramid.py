@@ -0,0 +1,70 @@
+"""
+Time of the /analyze detectors at full resolution (ANALYSIS_MIN_SIDE=0)
+against the pyramid working level (short side >= --min-side, candidate
+boxes refined at full resolution), per analysis type.
+
+    python benchmarks/analysis_pyramid.py
+    python benchmarks/analysis_pyramid.py --size 4000x3000 --min-side 768 --types fracture,brain_tumor
+
+The film is a synthetic PNG (smooth gradients plus noise, so the edge and
+contour detectors have plenty to do); overlays are not encoded
+(overlay=url). Times are the best of --repeat runs, in process.
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_ROOT))
+
+COUNTS = {
+    "fracture": "number_of_fractures", "lung_nodule": "number_of_nodules",
+    "brain_tumor": "number_of_tumors", "retinal": "hemorrhage_percentage", "organ": "abnormality_score",
+}
+
+
+def synthetic_film(height: int, width: int) -> bytes:
+    import cv2
+    import numpy as np
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = 120 + 60 * np.sin(x / 97.0) * np.cos(y / 131.0) + rng.normal(0, 12, (height, width))
+    gray = np.clip(base, 0, 255).astype(np.uint8)
+    return cv2.imencode(".png", cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR))[1].tobytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="3000x2500", help="height x width")
+    parser.add_argument("--min-side", default="1024", help="ANALYSIS_MIN_SIDE for the pyramid runs")
+    parser.add_argument("--types", default=",".join(COUNTS))
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    from services.advanced_analysis import MedicalImageAnalyzer
+    height, width = (int(v) for v in args.size.lower().split("x"))
+    film = synthetic_film(height, width)
+    analyzer = MedicalImageAnalyzer()
+
+    def run(analysis_type: str, min_side: str):
+        os.environ["ANALYSIS_MIN_SIDE"] = min_side
+        best, result = float("inf"), None
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            result = analyzer.analyze_image(film, analysis_type, overlay="url")
+            best = min(best, time.perf_counter() - started)
+        return best, result["findings"][COUNTS[analysis_type]]
+
+    print(f"{height}x{width} PNG; pyramid level short side >= {args.min_side}\n")
+    print(f"{'analysis':<12} {'full s':>8} {'pyramid s':>10} {'speedup':>8}   result (full / pyramid)")
+    for analysis_type in args.types.split(","):
+        full, full_result = run(analysis_type, "0")
+        pyramid, pyramid_result = run(analysis_type, args.min_side)
+        print(f"{analysis_type:<12} {full:>8.2f} {pyramid:>10.2f} {full / pyramid:>7.1f}x   "
+              f"{full_result} / {pyramid_result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Throughput of classifying N uploaded images one request at a time
+(process_* per image: decode, then a forward pass of one) against
+process_*_batch (parallel decode, batched forward passes).
+
+    python benchmarks/batch_prediction.py
+    python benchmarks/batch_prediction.py --modality ultrasound --images 64 --size 1024 --batch 8,32
+
+Models have random weights (only speed is measured) and the prediction
+cache is off. Images are synthetic JPEGs; each measurement runs in a fresh
+process after one warm-up call.
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_ROOT))
+
+
+def synthetic_images(count: int, size: int) -> list:
+    import numpy as np
+    from PIL import Image
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(count):
+        # Smooth gradients plus noise compress like a scan, unlike pure noise
+        base = np.linspace(0, 200, size, dtype=np.float32)[None, :] + rng.normal(0, 20, (size, size))
+        buf = io.BytesIO()
+        Image.fromarray(np.clip(base, 0, 255).astype(np.uint8)).convert("RGB").save(buf, format="JPEG", quality=90)
+        images.append(buf.getvalue())
+    return images
+
+def random_model(modality: str):
+    import torch
+    if modality == "xray":
+        from models.xray_model import CheXNet
+        return "xray", CheXNet().eval()
+    if modality == "ct":
+        from models.ct_model import CTNet2D
+        return "ct2d", CTNet2D().eval()
+    from timm import create_model
+    from models.ultrasound_model import NUM_CLASSES
+    # Same backbone as the USFM classifier, without its checkpoint
+    backbone = create_model("vit_base_patch16_224", pretrained=False, num_classes=NUM_CLASSES)
+    return "ultrasound", torch.nn.Sequential(backbone, torch.nn.Sigmoid()).eval()
+
+
+def child(modality: str, which: str, count: int, size: int) -> dict:
+    """Runs in the measuring subprocess; BATCH_PREDICT_MAX_SIZE is set by the parent."""
+    from services.model_registry import get_model_registry
+    from services import ct_service, ultrasound_service, xray_service
+    single, batch = {
+        "xray": (xray_service.process_xray, xray_service.process_xray_batch),
+        "ct": (lambda image: ct_service.process_ct(image, mode="2d"), ct_service.process_ct_batch),
+        "ultrasound": (ultrasound_service.process_ultrasound, ultrasound_service.process_ultrasound_batch),
+    }[modality]
+    get_model_registry().put(*random_model(modality))
+    images = synthetic_images(count, size)
+    run = (lambda: [single(image) for image in images]) if which == "single" else (lambda: batch(images))
+
+    single(images[0])  # warm-up: first-call allocations and thread start
+    started = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - started
+    return {"s": elapsed, "images_per_s": count / elapsed}
+
+
+def measure(args, which: str, batch_size: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, __file__, "--child", args.modality, which, str(args.images), str(args.size)],
+        capture_output=True, text=True, check=True, cwd=BACKEND_ROOT,
+        env={**os.environ, "PREDICTION_CACHE": "0", "XRAY_BATCHING": "0", "BATCH_PREDICT_MAX_SIZE": batch_size},
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modality", default="xray", choices=["xray", "ct", "ultrasound"])
+    parser.add_argument("--images", type=int, default=32)
+    parser.add_argument("--size", type=int, default=1024, help="square image side in pixels")
+    parser.add_argument("--batch", default="8", help="BATCH_PREDICT_MAX_SIZE values to compare")
+    parser.add_argument("--child", nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        modality, which, count, size = args.child
+        print(json.dumps(child(modality, which, int(count), int(size))))
+        return
+
+    print(f"{args.modality}: {args.images} JPEGs of {args.size}x{args.size}; {os.cpu_count()} CPUs\n")
+    print(f"{'path':<22} {'seconds':>8} {'images/s':>9}")
+    runs = [("per image", "single", "1")] + [(f"batch, size {b}", "batch", b) for b in args.batch.split(",")]
+    for label, which, batch_size in runs:
+        result = measure(args, which, batch_size)
+        print(f"{label:<22} {result['s']:>8.2f} {result['images_per_s']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Decode time and peak memory per upload, full-resolution decoding versus
+decoder-level downscaling (JPEG DCT scaling via PIL draft()).
+
+    python benchmarks/decode.py
+    python benchmarks/decode.py --runs 10 --sizes 4000x4000,2500x2000
+
+Each measurement runs in a fresh process, so peak RSS is that of one
+decode: the high-water mark is reset after start-up (Linux clear_refs) and
+read back from /proc/self/status.
+
+Paths:
+    model      ImagePreprocessor.prepare for a 224x224 model input
+    analyzer   MedicalImageAnalyzer._decode (ANALYSIS_MIN_SIDE, default 1024)
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_ROOT))
+
+
+def synthetic(width, height, mode, fmt) -> bytes:
+    import numpy as np
+    from PIL import Image
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = (127 + 100 * np.sin(x / 37.0) * np.cos(y / 53.0) + rng.normal(0, 12, (height, width))).clip(0, 255)
+    image = Image.fromarray(base.astype(np.uint8), 'L').convert(mode)
+    buf = io.BytesIO()
+    image.save(buf, format=fmt, **({"quality": 90} if fmt == 'JPEG' else {}))
+    return buf.getvalue()
+
+
+def _peak_rss_kb() -> int:
+    for line in Path("/proc/self/status").read_text().splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1])
+    return 0
+
+def child(path: str, pipeline: str, reduced: bool, runs: int) -> dict:
+    """Runs in the measuring subprocess."""
+    from models.preprocessing import ImagePreprocessor, decode_pixels, resize_pixels
+    from services.advanced_analysis import MedicalImageAnalyzer
+
+    data = Path(path).read_bytes()
+    if pipeline == "model":
+        preprocess = ImagePreprocessor((224, 224))
+        run = (lambda: preprocess.prepare(data)) if reduced else \
+              (lambda: resize_pixels(decode_pixels(data), preprocess.size))
+    else:
+        os.environ["ANALYSIS_MIN_SIDE"] = "1024" if reduced else "0"
+        analyzer = MedicalImageAnalyzer()
+        run = lambda: analyzer._decode(data)
+
+    try:
+        Path("/proc/self/clear_refs").write_text("5")  # reset the peak RSS
+    except OSError:
+        pass
+    baseline = _peak_rss_kb()
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        out = run()
+        timings.append((time.perf_counter() - started) * 1000.0)
+    # Resolution the decoder produced (before the model's resize)
+    shape = out[0].shape if pipeline == "analyzer" else \
+        decode_pixels(data, min_size=preprocess.size if reduced else None).shape
+    return {"ms": statistics.median(timings), "peak_mb": (_peak_rss_kb() - baseline) / 1024.0, "shape": shape}
+
+
+def measure(path: Path, pipeline: str, reduced: bool, runs: int) -> dict:
+    out = subprocess.run(
+        [sys.executable, __file__, "--child", str(path), pipeline, "1" if reduced else "0", str(runs)],
+        capture_output=True, text=True, check=True, cwd=BACKEND_ROOT,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--sizes", default="4000x4000,3000x2500,1024x1024")
+    parser.add_argument("--child", nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        path, pipeline, reduced, runs = args.child
+        print(json.dumps(child(path, pipeline, reduced == "1", int(runs))))
+        return
+
+    print(f"median of {args.runs} decodes; peak = RSS high-water mark above the process baseline\n")
+    print(f"{'input':<28} {'path':<9} {'full ms':>8} {'reduced ms':>11} {'full peak MB':>13} "
+          f"{'reduced peak MB':>16} {'decoded at':>12}")
+    with tempfile.TemporaryDirectory() as d:
+        for size in args.sizes.split(","):
+            width, height = (int(v) for v in size.lower().split("x"))
+            for mode, fmt in (("L", "JPEG"), ("RGB", "JPEG"), ("L", "PNG")):
+                path = Path(d) / f"{width}x{height}_{mode}.{fmt.lower()}"
+                path.write_bytes(synthetic(width, height, mode, fmt))
+                for pipeline in ("model", "analyzer"):
+                    full = measure(path, pipeline, False, args.runs)
+                    reduced = measure(path, pipeline, True, args.runs)
+                    decoded = "x".join(str(v) for v in reduced["shape"][1::-1])
+                    print(f"{f'{width}x{height} {mode} {fmt}':<28} {pipeline:<9} {full['ms']:>8.1f} "
+                          f"{reduced['ms']:>11.1f} {full['peak_mb']:>13.1f} {reduced['peak_mb']:>16.1f} {decoded:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Time and peak memory to turn an uploaded DICOM series (one zip) into the
+float32 HU volume the 3D models read: a straightforward sequential decode
+(dcmread each file, pixel_array * slope + intercept, sort, np.stack)
+against load_dicom_series with 1 and several decode threads.
+
+    python benchmarks/dicom_series.py
+    python benchmarks/dicom_series.py --slices 600 --size 512 --workers 1,4,8
+
+The series is synthetic (pydicom, uncompressed 16-bit). Each measurement
+runs in a fresh process; peak = RSS high-water mark above the baseline
+after the zip is read (Linux clear_refs + VmHWM).
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_ROOT))
+
+
+def synthetic_zip(path: Path, slices: int, size: int):
+    import numpy as np
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import CTImageStorage, ExplicitVRLittleEndian, generate_uid
+    rng = np.random.default_rng(0)
+    series_uid = generate_uid()
+    order = rng.permutation(slices)  # archives rarely list slices in position order
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for i in order:
+            meta = FileMetaDataset()
+            meta.MediaStorageSOPClassUID = CTImageStorage
+            meta.MediaStorageSOPInstanceUID = generate_uid()
+            meta.TransferSyntaxUID = ExplicitVRLittleEndian
+            ds = Dataset()
+            ds.file_meta = meta
+            ds.SOPClassUID, ds.SOPInstanceUID = CTImageStorage, meta.MediaStorageSOPInstanceUID
+            ds.SeriesInstanceUID, ds.Modality, ds.InstanceNumber = series_uid, 'CT', int(i) + 1
+            ds.Rows = ds.Columns = size
+            ds.SamplesPerPixel, ds.PhotometricInterpretation = 1, 'MONOCHROME2'
+            ds.BitsAllocated, ds.BitsStored, ds.HighBit, ds.PixelRepresentation = 16, 12, 11, 0
+            ds.ImagePositionPatient = [0.0, 0.0, float(i)]
+            ds.ImageOrientationPatient = [1.0, 0.0, 0.0, 0.0, 1.0, 0.0]
+            ds.PixelSpacing, ds.SliceThickness = [0.7, 0.7], 1.0
+            ds.RescaleSlope, ds.RescaleIntercept = 1.0, -1024.0
+            ds.PixelData = rng.integers(0, 4096, size=(size, size), dtype=np.uint16).tobytes()
+            buf = io.BytesIO()
+            ds.save_as(buf, enforce_file_format=True)
+            archive.writestr(f"series/IM{i:05d}.dcm", buf.getvalue())
+
+
+def _peak_rss_kb() -> int:
+    for line in Path("/proc/self/status").read_text().splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1])
+    return 0
+
+def sequential(data: bytes):
+    import numpy as np
+    import pydicom
+    slices = []
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        for info in archive.infolist():
+            ds = pydicom.dcmread(io.BytesIO(archive.read(info)))
+            hu = ds.pixel_array * float(ds.RescaleSlope) + float(ds.RescaleIntercept)
+            slices.append((float(ds.ImagePositionPatient[2]), hu))
+    slices.sort(key=lambda item: item[0])
+    return np.stack([hu for _, hu in slices]).astype(np.float32)
+
+def child(path: str, which: str) -> dict:
+    """Runs in the measuring subprocess; DECODE_WORKERS is set by the parent."""
+    from models.dicom_io import load_dicom_series
+    data = Path(path).read_bytes()
+    run = (lambda: sequential(data)) if which == "sequential" else (lambda: load_dicom_series([data]).data())
+
+    try:
+        Path("/proc/self/clear_refs").write_text("5")  # reset the peak RSS
+    except OSError:
+        pass
+    baseline = _peak_rss_kb()
+    started = time.perf_counter()
+    volume = run()
+    elapsed = time.perf_counter() - started
+    return {"s": elapsed, "peak_mb": (_peak_rss_kb() - baseline) / 1024.0, "shape": list(volume.shape)}
+
+
+def measure(path: Path, which: str, workers: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, __file__, "--child", str(path), which],
+        capture_output=True, text=True, check=True, cwd=BACKEND_ROOT,
+        env={**os.environ, "DECODE_WORKERS": workers},
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slices", type=int, default=300)
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--workers", default="1,4", help="DECODE_WORKERS values to compare")
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(child(*args.child)))
+        return
+
+    with tempfile.TemporaryDirectory() as d:
+        path = Path(d) / "series.zip"
+        synthetic_zip(path, args.slices, args.size)
+        print(f"{args.slices} slices of {args.size}x{args.size}, uncompressed 16-bit, zipped "
+              f"({path.stat().st_size / 2**20:.0f} MB); {os.cpu_count()} CPUs\n")
+        print(f"{'path':<24} {'seconds':>8} {'peak MB':>9}")
+        runs = [("sequential stack", "sequential", "1")]
+        runs += [(f"load_dicom_series x{w}", "series", w) for w in args.workers.split(",")]
+        for label, which, workers in runs:
+            result = measure(path, which, workers)
+            print(f"{label:<24} {result['s']:>8.2f} {result['peak_mb']:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
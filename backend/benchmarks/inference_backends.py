@@ -0,0 +1,125 @@
+"""
+Latency of each model on each execution backend (eager, TorchScript,
+inductor, ONNX Runtime), with the max output difference from eager.
+
+    python benchmarks/inference_backends.py
+    python benchmarks/inference_backends.py --models xray,ct3d --backends eager,onnxruntime --runs 20
+    python benchmarks/inference_backends.py --batch 8 --threads 4
+
+Models whose weights are not under model_assests/ are benchmarked with
+random initialisation (latency does not depend on the weight values).
+Artifacts are exported to a temporary directory, so nothing next to the real
+checkpoints is touched. The inductor column includes no compile time; that
+is reported separately as its first-call cost.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_ROOT))
+
+import torch
+
+from models import runtime
+from models.xray_model import CheXNet
+from models.ct_model import CTNet2D, CTNet3D
+from models.mri_model import MRINet2D, MRINet3D
+from models.ultrasound_model import load_ultrasound_model
+from models.weight_cache import has_weights
+from export_models import MODELS
+
+
+def random_model(name: str, workdir: Path):
+    if name == 'ultrasound':
+        # The classifier loads its checkpoint in __init__; an empty one leaves it randomly initialised
+        checkpoint = workdir / 'USFM_random.pth'
+        torch.save({}, checkpoint)
+        return load_ultrasound_model(checkpoint_path=checkpoint)
+    return {'xray': CheXNet, 'ct2d': CTNet2D, 'ct3d': CTNet3D, 'mri2d': MRINet2D, 'mri3d': MRINet3D}[name]().eval()
+
+def eager_model(name: str, workdir: Path):
+    weights, loader = MODELS[name]
+    if has_weights(weights):
+        return loader().eval(), "trained"
+    return random_model(name, workdir), "random"
+
+def build(backend: str, model, workdir: Path, name: str, shape):
+    if backend == 'eager':
+        return model
+    if backend == 'inductor':
+        return runtime.compile_inductor(model)
+    path = workdir / f"{name}{runtime.EXPORTED_SUFFIXES[backend]}"
+    if backend == 'torchscript':
+        runtime.export_torchscript(model, torch.zeros(*shape), path)
+        return runtime.load_torchscript(path)
+    runtime.export_onnx(model, torch.zeros(*shape), path)
+    return runtime.load_onnxruntime(path)
+
+def time_ms(model, x, warmup: int, runs: int):
+    """(first call ms, median ms of `runs` calls after `warmup` more)."""
+    with torch.no_grad():
+        started = time.perf_counter()
+        model(x)
+        first = (time.perf_counter() - started) * 1000.0
+        for _ in range(warmup):
+            model(x)
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            model(x)
+            samples.append((time.perf_counter() - started) * 1000.0)
+    return first, statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", default=",".join(MODELS))
+    parser.add_argument("--backends", default=",".join(runtime.BACKENDS))
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=0, help="torch/onnxruntime intra-op threads (0 = default)")
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore")
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    if 'onnxruntime' in backends and runtime.ort is None:
+        print("onnxruntime is not installed; skipping it\n")
+        backends.remove('onnxruntime')
+
+    print(f"batch {args.batch}, {torch.get_num_threads()} threads, median of {args.runs} runs\n")
+    print(f"{'model':<11} {'weights':<8} {'backend':<12} {'median ms':>10} {'speedup':>8} {'first call ms':>14} {'max |diff|':>11}")
+    with tempfile.TemporaryDirectory() as d:
+        workdir = Path(d)
+        for name in [m.strip() for m in args.models.split(",") if m.strip()]:
+            model, kind = eager_model(name, workdir)
+            shape = runtime.EXAMPLE_SHAPES[name]
+            x = torch.randn(args.batch, *shape[1:])
+            with torch.no_grad():
+                reference = model(x)
+            eager_ms = None
+            for backend in backends:
+                try:
+                    served = build(backend, model, workdir, name, shape)
+                    first, median = time_ms(served, x, args.warmup, args.runs)
+                    with torch.no_grad():
+                        diff = float((served(x) - reference).abs().max())
+                except Exception as e:
+                    print(f"{name:<11} {kind:<8} {backend:<12} FAILED: {str(e).splitlines()[0][:80]}")
+                    continue
+                eager_ms = median if backend == 'eager' else eager_ms
+                speedup = f"{eager_ms / median:.2f}x" if eager_ms else "-"
+                print(f"{name:<11} {kind:<8} {backend:<12} {median:>10.1f} {speedup:>8} {first:>14.0f} {diff:>11.2e}")
+            print()
+
+
+if __name__ == "__main__":
+    main()
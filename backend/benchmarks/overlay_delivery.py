@@ -0,0 +1,75 @@
+"""
+Cost of shipping analysis overlays inline (base64 PNG in the JSON) against
+overlay=url (the JSON carries an overlay ID; the overlay is encoded when it
+is fetched, at the requested format and size).
+
+    python benchmarks/overlay_delivery.py
+    python benchmarks/overlay_delivery.py --size 4000x3000 --analysis fracture --max-dim 1024,2048
+
+The film is synthetic (smooth anatomy-like gradients plus noise, PNG). Times
+are the median of --repeat runs, in process.
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_ROOT))
+
+
+def synthetic_film(height: int, width: int) -> bytes:
+    import cv2
+    import numpy as np
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = 120 + 60 * np.sin(x / 97.0) * np.cos(y / 131.0) + rng.normal(0, 12, (height, width))
+    gray = np.clip(base, 0, 255).astype(np.uint8)
+    return cv2.imencode(".png", cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR))[1].tobytes()
+
+def timed(fn, repeat: int):
+    times, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="3000x2500", help="height x width")
+    parser.add_argument("--analysis", default="brain_tumor",
+                        choices=["fracture", "lung_nodule", "brain_tumor", "retinal", "organ"])
+    parser.add_argument("--max-dim", default="1024", help="overlay max_dim values to fetch")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    from services.advanced_analysis import MedicalImageAnalyzer
+    from services.overlay_store import get_overlay_store
+    height, width = (int(v) for v in args.size.lower().split("x"))
+    film = synthetic_film(height, width)
+    analyzer = MedicalImageAnalyzer()
+    store = get_overlay_store()
+
+    print(f"{args.analysis} on a {height}x{width} PNG ({len(film) / 2**20:.1f} MB)\n")
+    print(f"{'step':<34} {'seconds':>8} {'bytes':>11}")
+    for delivery in ("inline", "url"):
+        elapsed, result = timed(lambda: analyzer.analyze_image(film, args.analysis, overlay=delivery), args.repeat)
+        print(f"{'analyze, overlay=' + delivery:<34} {elapsed:>8.3f} {len(json.dumps(result)):>11,}")
+
+    overlay_id = result["visualization"]["overlay_id"]
+    for fmt in ("webp", "jpeg"):
+        for max_dim in [None] + [int(v) for v in args.max_dim.split(",")]:
+            # A fresh store entry per run, so each fetch pays the encode
+            first, data = timed(lambda: store.render(store.put(store.get(overlay_id)), fmt, max_dim), args.repeat)
+            label = f"fetch {fmt}, max_dim {max_dim or 'full'}"
+            print(f"{label:<34} {first:>8.3f} {len(data):>11,}")
+    repeat, data = timed(lambda: store.render(overlay_id, "webp", None), args.repeat)
+    print(f"{'fetch webp, repeat (cached)':<34} {repeat:>8.3f} {len(data):>11,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Per-image preprocessing time: the torchvision Compose the models used to run
+(PIL decode, PIL resize, ToTensor, Normalize) against ImagePreprocessor
+(uint8 decode, OpenCV resize, fused normalization).
+
+    python benchmarks/preprocessing.py
+    python benchmarks/preprocessing.py --runs 50 --batch 16
+
+Inputs are the sample images under data/ plus synthetic scans of typical
+sizes, encoded in memory the way uploads arrive. "batch" is the batcher's
+path: prepare() per image, then one normalize into a reused buffer.
+"""
+import argparse
+import io
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_ROOT))
+
+import numpy as np
+import torch
+from PIL import Image
+from torchvision import transforms
+
+from models.image_io import open_image
+from models.preprocessing import ImagePreprocessor
+
+TORCHVISION = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
+])
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+def synthetic(width, height, mode, fmt) -> bytes:
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    base = (127 + 100 * np.sin(x / 37.0) * np.cos(y / 53.0) + rng.normal(0, 12, (height, width))).clip(0, 255)
+    image = Image.fromarray(base.astype(np.uint8), 'L').convert(mode)
+    buf = io.BytesIO()
+    image.save(buf, format=fmt, **({"quality": 90} if fmt == 'JPEG' else {}))
+    return buf.getvalue()
+
+def inputs() -> list:
+    samples = [(str(p.relative_to(BACKEND_ROOT)), p.read_bytes())
+               for p in sorted((BACKEND_ROOT / 'data').rglob('*')) if p.suffix.lower() in IMAGE_SUFFIXES]
+    samples += [
+        ("synthetic 2048x2048 L PNG (X-ray)", synthetic(2048, 2048, 'L', 'PNG')),
+        ("synthetic 512x512 L PNG (CT slice)", synthetic(512, 512, 'L', 'PNG')),
+        ("synthetic 1280x960 RGB JPEG (ultrasound)", synthetic(1280, 960, 'RGB', 'JPEG')),
+        ("synthetic 3000x2000 RGB JPEG (photo)", synthetic(3000, 2000, 'RGB', 'JPEG')),
+    ]
+    return samples
+
+def median_ms(fn, runs: int) -> float:
+    fn()
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000.0)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=8, help="images per batch for the batched path")
+    args = parser.parse_args()
+
+    preprocess = ImagePreprocessor((224, 224))
+    buffer = torch.empty((args.batch, 3, 224, 224))
+
+    print(f"median of {args.runs} runs, {torch.get_num_threads()} torch threads\n")
+    print(f"{'input':<42} {'torchvision ms':>15} {'fused ms':>9} {'batch ms/img':>13} {'speedup':>8} {'mean |diff|':>12}")
+    for label, data in inputs():
+        before = median_ms(lambda: TORCHVISION(open_image(data)), args.runs)
+        after = median_ms(lambda: preprocess(data), args.runs)
+        batched = median_ms(
+            lambda: preprocess.batch([preprocess.prepare(data) for _ in range(args.batch)], out=buffer), args.runs
+        ) / args.batch
+        diff = float((TORCHVISION(open_image(data)) - preprocess(data)).abs().mean())
+        print(f"{label[:42]:<42} {before:>15.2f} {after:>9.2f} {batched:>13.2f} {before / after:>7.2f}x {diff:>12.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Region extraction in the fracture and brain tumor detectors: the previous
+RETR_TREE contours with cv2.contourArea / cv2.boundingRect called per
+contour, against services.regions (RETR_EXTERNAL contours with NumPy
+statistics for fractures, connectedComponentsWithStats for tumors, area
+filtering in NumPy, overlapping boxes merged).
+
+    python benchmarks/region_extraction.py
+    python benchmarks/region_extraction.py --size 4000x3000 --noise 8,16,32 --merge-iou 0.3
+
+Images are synthetic: smooth gradients plus Gaussian noise of each --noise
+standard deviation. Only region extraction is timed; the edge map and the
+Otsu threshold are computed beforehand. Times are the best of --repeat
+runs, in process.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_ROOT))
+
+import cv2
+import numpy as np
+from services.regions import component_mask, component_regions, contour_stats, merge_overlapping
+
+
+def synthetic_gray(height: int, width: int, noise: float) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = 120 + 60 * np.sin(x / 97.0) * np.cos(y / 131.0) + rng.normal(0, noise, (height, width))
+    return np.clip(base, 0, 255).astype(np.uint8)
+
+
+def fractures_loop(edges, merge_iou):
+    contours, _ = cv2.findContours(edges, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    kept = [c for c in contours if 100 < cv2.contourArea(c) < 5000]
+    return [cv2.boundingRect(c) for c in kept]
+
+def fractures_vectorized(edges, merge_iou):
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    areas, boxes = contour_stats(contours)
+    keep = np.flatnonzero((areas > 100) & (areas < 5000))
+    return merge_overlapping(boxes[keep], areas[keep], merge_iou)[0]
+
+def tumors_loop(thresh, merge_iou):
+    contours, _ = cv2.findContours(thresh, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    kept = [c for c in contours if 50 < cv2.contourArea(c) < 10000]
+    return [cv2.boundingRect(c) for c in kept]
+
+def tumors_vectorized(thresh, merge_iou):
+    labels, ids, boxes, areas = component_regions(thresh, 50, 10000)
+    cv2.findContours(component_mask(labels, ids), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)  # overlay outlines
+    return merge_overlapping(boxes, areas, merge_iou)[0]
+
+
+def best_of(run, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = run()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="3000x2500", help="height x width")
+    parser.add_argument("--noise", default="4,12,32", help="noise standard deviations to compare")
+    parser.add_argument("--merge-iou", type=float, default=0.3)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    height, width = (int(v) for v in args.size.lower().split("x"))
+    print(f"{height}x{width} synthetic images; merge IoU {args.merge_iou}\n")
+    print(f"{'detector':<12} {'noise':>5} {'loop s':>8} {'vector s':>9} {'speedup':>8}   regions (loop / vectorized)")
+    for noise in (float(v) for v in args.noise.split(",")):
+        gray = synthetic_gray(height, width, noise)
+        edges = cv2.Canny(gray, 50, 150, apertureSize=3)
+        thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+        for name, source, loop, vectorized in (("fracture", edges, fractures_loop, fractures_vectorized),
+                                               ("brain_tumor", thresh, tumors_loop, tumors_vectorized)):
+            old, old_boxes = best_of(lambda: loop(source, args.merge_iou), args.repeat)
+            new, new_boxes = best_of(lambda: vectorized(source, args.merge_iou), args.repeat)
+            print(f"{name:<12} {noise:>5.0f} {old:>8.3f} {new:>9.3f} {old / new:>7.1f}x   "
+                  f"{len(old_boxes)} / {len(new_boxes)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Time and peak memory of 3D inference: the whole volume resampled to one
+64x224x224 input against sliding-window inference over full-resolution
+patches, for a few patch batch sizes.
+
+    python benchmarks/sliding_window.py
+    python benchmarks/sliding_window.py --shape 512x512x600 --model mri3d --batches 1,4
+
+Models have random weights (only speed and memory are measured). Each
+measurement runs in a fresh process; peak = RSS high-water mark above the
+baseline after the model is built (Linux clear_refs + VmHWM).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_ROOT))
+
+
+def synthetic(path: Path, shape):
+    import nibabel as nib
+    import numpy as np
+    rng = np.random.default_rng(0)
+    voxels = np.empty(shape, dtype=np.int16)
+    for z in range(shape[0]):
+        voxels[z] = rng.integers(0, 2500, size=shape[1:], dtype=np.int16)
+    image = nib.Nifti1Image(voxels, np.eye(4))
+    image.header.set_slope_inter(1.0, -1024)
+    nib.save(image, str(path))
+
+
+def _peak_rss_kb() -> int:
+    for line in Path("/proc/self/status").read_text().splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1])
+    return 0
+
+def child(path: str, model_name: str) -> dict:
+    """Runs in the measuring subprocess; patching is configured through the environment."""
+    import torch
+    from models.sliding_window import patch_settings
+    if model_name == "ct3d":
+        from models.ct_model import CTNet3D, predict_ct
+        model = CTNet3D().eval()
+        run = lambda: predict_ct(model, path, mode="3d")
+    else:
+        from models.mri_model import MRINet3D, predict_mri
+        model = MRINet3D().eval()
+        run = lambda: predict_mri(model, path, mode="3d")
+
+    try:
+        Path("/proc/self/clear_refs").write_text("5")  # reset the peak RSS
+    except OSError:
+        pass
+    baseline = _peak_rss_kb()
+    started = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - started
+    settings = patch_settings()
+    return {"s": elapsed, "peak_mb": (_peak_rss_kb() - baseline) / 1024.0,
+            "threads": torch.get_num_threads(), "patching": settings is not None}
+
+
+def measure(path: Path, model_name: str, env: dict) -> dict:
+    out = subprocess.run(
+        [sys.executable, __file__, "--child", str(path), model_name],
+        capture_output=True, text=True, check=True, cwd=BACKEND_ROOT, env={**os.environ, **env},
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shape", default="512x512x300", help="in-plane x in-plane x slices")
+    parser.add_argument("--model", default="ct3d", choices=["ct3d", "mri3d"])
+    parser.add_argument("--patch", default="64,224,224")
+    parser.add_argument("--overlap", default="0.25")
+    parser.add_argument("--batches", default="1,2,4", help="VOLUME_PATCH_BATCH values to compare")
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(child(*args.child)))
+        return
+
+    height, width, depth = (int(v) for v in args.shape.lower().split("x"))
+    runs = [("whole volume", {"VOLUME_PATCH_SIZE": ""})]
+    runs += [(f"patches, batch {b}", {"VOLUME_PATCH_SIZE": args.patch, "VOLUME_PATCH_OVERLAP": args.overlap,
+                                      "VOLUME_PATCH_BATCH": b}) for b in args.batches.split(",")]
+    with tempfile.TemporaryDirectory() as d:
+        path = Path(d) / "volume.nii"
+        synthetic(path, (depth, height, width))
+        print(f"{args.model}, {args.shape} int16, patch {args.patch}, overlap {args.overlap}\n")
+        print(f"{'input':<18} {'seconds':>8} {'peak MB':>9}")
+        for label, env in runs:
+            result = measure(path, args.model, env)
+            print(f"{label:<18} {result['s']:>8.1f} {result['peak_mb']:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
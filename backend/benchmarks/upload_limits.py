@@ -0,0 +1,100 @@
+"""
+Peak memory and time to refuse an oversized upload: the old handlers'
+`await file.read()` followed by a size check, against read_upload, which
+reads in chunks and stops at the limit.
+
+    python benchmarks/upload_limits.py
+    python benchmarks/upload_limits.py --upload-mb 500 --limit-mb 50
+
+The upload is a file spooled to disk, as Starlette hands multipart files
+to handlers. Each measurement runs in a fresh process; peak = RSS
+high-water mark above the baseline (Linux clear_refs + VmHWM).
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_ROOT))
+
+
+def _peak_rss_kb() -> int:
+    for line in Path("/proc/self/status").read_text().splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1])
+    return 0
+
+async def buffered(file, max_bytes: int):
+    contents = await file.read()
+    if len(contents) > max_bytes:
+        return "rejected"
+    return "accepted"
+
+async def chunked(file, max_bytes: int):
+    from fastapi import HTTPException
+    from services.uploads import read_upload
+    try:
+        await read_upload(file, max_bytes, ["image/png", "image/jpeg"])
+    except HTTPException as e:
+        return f"rejected ({e.status_code})"
+    return "accepted"
+
+def child(path: str, which: str, limit_mb: str) -> dict:
+    """Runs in the measuring subprocess."""
+    from fastapi import UploadFile
+    run = buffered if which == "buffered" else chunked
+    try:
+        Path("/proc/self/clear_refs").write_text("5")  # reset the peak RSS
+    except OSError:
+        pass
+    baseline = _peak_rss_kb()
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        # size unknown, as for a chunked-encoding request
+        outcome = asyncio.run(run(UploadFile(f, filename="scan.png"), int(limit_mb) * 2**20))
+    elapsed = time.perf_counter() - started
+    return {"s": elapsed, "peak_mb": (_peak_rss_kb() - baseline) / 1024.0, "outcome": outcome}
+
+
+def measure(path: Path, which: str, limit_mb: int) -> dict:
+    out = subprocess.run(
+        [sys.executable, __file__, "--child", str(path), which, str(limit_mb)],
+        capture_output=True, text=True, check=True, cwd=BACKEND_ROOT,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--upload-mb", type=int, default=300)
+    parser.add_argument("--limit-mb", type=int, default=50)
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(child(*args.child)))
+        return
+
+    import cv2
+    import numpy as np
+    with tempfile.TemporaryDirectory() as d:
+        path = Path(d) / "upload.png"
+        with open(path, "wb") as f:
+            f.write(cv2.imencode(".png", np.zeros((64, 64, 3), np.uint8))[1].tobytes())  # a real header
+            for _ in range(args.upload_mb):
+                f.write(os.urandom(2**20))
+        print(f"{args.upload_mb} MB upload, {args.limit_mb} MB limit\n")
+        print(f"{'path':<12} {'seconds':>8} {'peak MB':>9}  outcome")
+        for which in ("buffered", "chunked"):
+            result = measure(path, which, args.limit_mb)
+            print(f"{which:<12} {result['s']:>8.2f} {result['peak_mb']:>9.0f}  {result['outcome']}")
+
+
+if __name__ == "__main__":
+    main()
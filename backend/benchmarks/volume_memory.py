@@ -0,0 +1,119 @@
+"""
+Peak memory and time to turn a NIfTI upload into the 3D model input plus the
+three rendered mid-slices: the previous path (get_fdata() float64 volume,
+windowing with temporaries, np.resize, a second full load for the slices)
+against one memory-mapped NiftiVolume (float32 with the HU window fused into
+the conversion, area + trilinear resampling, slices read on their own).
+
+    python benchmarks/volume_memory.py
+    python benchmarks/volume_memory.py --shape 512x512x600 --runs 3
+
+Each measurement runs in a fresh process; peak = RSS high-water mark above
+the baseline after imports (Linux clear_refs + /proc/self/status VmHWM).
+Mapped file pages count towards RSS while they are resident, so the new
+path's figure includes the int16 pages it reads.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_ROOT))
+
+
+def synthetic(path: Path, shape):
+    """int16 CT-like volume with header scaling, written plane by plane."""
+    import nibabel as nib
+    import numpy as np
+    rng = np.random.default_rng(0)
+    voxels = np.empty(shape, dtype=np.int16)
+    for z in range(shape[0]):
+        voxels[z] = rng.integers(0, 2500, size=shape[1:], dtype=np.int16)
+    image = nib.Nifti1Image(voxels, np.eye(4))
+    image.header.set_data_dtype(np.int16)
+    image.header.set_slope_inter(1.0, -1024)
+    nib.save(image, str(path))
+
+
+def _peak_rss_kb() -> int:
+    for line in Path("/proc/self/status").read_text().splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1])
+    return 0
+
+def before(path: str):
+    from nibabel.loadsave import load as load_nifti
+    import numpy as np
+    from models.ct_model import window_and_normalize
+    volume = np.resize(window_and_normalize(load_nifti(path).get_fdata()), (64, 224, 224))
+    vol = load_nifti(path).get_fdata()
+    z, y, x = [d // 2 for d in vol.shape]
+    slices = [vol[z, :, :], vol[:, y, :], vol[:, :, x]]
+    return volume, [np.array(s) for s in slices]
+
+def after(path: str):
+    from models.ct_model import load_ct_volume
+    from models.volume_io import NiftiVolume
+    handle = NiftiVolume(path)
+    volume = load_ct_volume(handle)
+    return volume, list(handle.mid_slices().values())
+
+def child(path: str, which: str, runs: int) -> dict:
+    """Runs in the measuring subprocess."""
+    import models.ct_model  # noqa: F401  (imports outside the measurement)
+    import models.volume_io  # noqa: F401
+    run = before if which == "before" else after
+
+    try:
+        Path("/proc/self/clear_refs").write_text("5")  # reset the peak RSS
+    except OSError:
+        pass
+    baseline = _peak_rss_kb()
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        run(path)
+        timings.append((time.perf_counter() - started) * 1000.0)
+    return {"ms": statistics.median(timings), "peak_mb": (_peak_rss_kb() - baseline) / 1024.0}
+
+
+def measure(path: Path, which: str, runs: int) -> dict:
+    out = subprocess.run(
+        [sys.executable, __file__, "--child", str(path), which, str(runs)],
+        capture_output=True, text=True, check=True, cwd=BACKEND_ROOT,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shape", default="512x512x600", help="in-plane x in-plane x slices")
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        path, which, runs = args.child
+        print(json.dumps(child(path, which, int(runs))))
+        return
+
+    height, width, depth = (int(v) for v in args.shape.lower().split("x"))
+    with tempfile.TemporaryDirectory() as d:
+        print(f"median of {args.runs} runs; peak = RSS high-water mark above the process baseline\n")
+        print(f"{'input':<26} {'path':<8} {'ms':>9} {'peak MB':>9}")
+        for suffix in (".nii", ".nii.gz"):
+            path = Path(d) / f"volume{suffix}"
+            synthetic(path, (depth, height, width))
+            label = f"{args.shape} int16 {suffix}"
+            for which in ("before", "after"):
+                result = measure(path, which, args.runs)
+                print(f"{label:<26} {which:<8} {result['ms']:>9.0f} {result['peak_mb']:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Per-worker memory of the multi-worker server, with and without shared weights.
+
+Starts start_server.py with --workers N in each mode, waits for the models to
+load, optionally sends a few X-ray predictions, then reports RSS, USS (memory
+unique to the process) and PSS (shared pages split between their users) for
+the parent and every worker.
+
+    python benchmarks/worker_memory.py --workers 4
+    python benchmarks/worker_memory.py --modes independent,prefork --requests 20
+
+Modes:
+    independent   every worker loads its own models (MODEL_WARMUP=all)
+    prefork       the parent loads once, workers share the pages copy-on-write
+    prefork-shm   as prefork, with the weights moved into shared memory
+
+Uses psutil when installed, otherwise reads /proc/<pid>/smaps_rollup (Linux).
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+SAMPLE_XRAY = BACKEND_ROOT / 'data' / 'xray' / 'test1.png'
+
+MODES = {
+    "independent": ["--no-preload"],
+    "prefork": [],
+    "prefork-shm": ["--share-memory"],
+}
+
+
+def children_of(pid: int) -> list:
+    if psutil is not None:
+        return [p.pid for p in psutil.Process(pid).children()]
+    path = Path(f"/proc/{pid}/task/{pid}/children")
+    return [int(p) for p in path.read_text().split()] if path.exists() else []
+
+def memory_of(pid: int) -> dict:
+    """RSS / USS / PSS in bytes."""
+    if psutil is not None:
+        info = psutil.Process(pid).memory_full_info()
+        return {"rss": info.rss, "uss": info.uss, "pss": getattr(info, "pss", 0)}
+    fields = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()[1:]:
+        name, value = line.split(":", 1)
+        fields[name] = int(value.split()[0]) * 1024
+    return {
+        "rss": fields.get("Rss", 0),
+        "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        "pss": fields.get("Pss", 0),
+    }
+
+
+def wait_until_loaded(base_url: str, workers: int, timeout: float) -> int:
+    """Poll /health/models until several answers agree on the resident bytes."""
+    deadline = time.monotonic() + timeout
+    resident, stable = None, 0
+    while time.monotonic() < deadline:
+        try:
+            stats = httpx.get(f"{base_url}/health/models", timeout=5).json()
+        except httpx.HTTPError:
+            time.sleep(0.5)
+            continue
+        if stats["resident_bytes"] > 0 and stats["resident_bytes"] == resident:
+            stable += 1
+            if stable >= workers * 2:
+                return resident
+        else:
+            resident, stable = stats["resident_bytes"], 0
+        time.sleep(0.2)
+    return resident or 0
+
+
+def run_mode(mode: str, args) -> list:
+    env = dict(os.environ)
+    env.setdefault("MODEL_WARMUP", "all")
+    cmd = [sys.executable, "start_server.py", "--workers", str(args.workers),
+           "--port", str(args.port), "--host", "127.0.0.1", "--log-level", "warning", *MODES[mode]]
+    proc = subprocess.Popen(cmd, cwd=BACKEND_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        resident = wait_until_loaded(base_url, args.workers, args.timeout)
+        if resident == 0:
+            raise RuntimeError(f"{mode}: no models loaded (are the weights under model_assests/?)")
+
+        if args.requests and SAMPLE_XRAY.is_file():
+            image = SAMPLE_XRAY.read_bytes()
+            for _ in range(args.requests):
+                httpx.post(f"{base_url}/predict/xray/", files={"file": ("x.png", image, "image/png")}, timeout=60)
+        time.sleep(args.settle)
+
+        rows = [("parent", proc.pid, memory_of(proc.pid))]
+        rows += [(f"worker", pid, memory_of(pid)) for pid in children_of(proc.pid)]
+        return [(mode, role, pid, mem, resident) for role, pid, mem in rows]
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=20)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--requests", type=int, default=10, help="X-ray predictions to send before measuring")
+    parser.add_argument("--settle", type=float, default=1.0, help="seconds to wait before measuring")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    args = parser.parse_args()
+
+    mb = lambda b: f"{b / 2**20:9.1f}"
+    print(f"{'mode':<12} {'process':<8} {'pid':>7} {'RSS MB':>9} {'USS MB':>9} {'PSS MB':>9}")
+    for mode in args.modes.split(","):
+        rows = run_mode(mode.strip(), args)
+        for _, role, pid, mem, _ in rows:
+            print(f"{mode:<12} {role:<8} {pid:>7} {mb(mem['rss'])} {mb(mem['uss'])} {mb(mem['pss'])}")
+        workers = [mem for _, role, _, mem, _ in rows if role == "worker"]
+        total_pss = sum(mem["pss"] for _, _, _, mem, _ in rows)
+        avg_uss = sum(m["uss"] for m in workers) / max(len(workers), 1)
+        print(f"{mode:<12} model parameters {mb(rows[0][4])} MB | avg worker USS {mb(avg_uss)} MB"
+              f" | total PSS {mb(total_pss)} MB\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+One-time conversion of the pickled checkpoints under model_assests/ into
+memory-mappable state dicts (safetensors, or torch's mmap format without it).
+
+Run after adding or replacing weights, e.g. as a build step:
+
+    python convert_weights.py            # convert what is missing or stale
+    python convert_weights.py --force    # rewrite everything
+    python convert_weights.py --verify   # re-hash converted files against the manifest
+
+Models load from the converted copies on later boots. Models also convert
+themselves on first load, so this only moves that cost out of the first request.
+"""
+import argparse
+import os
+import sys
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+
+from models import weight_cache
+from models.ct_model import CT_2D_WEIGHTS_PATH, CT_3D_WEIGHTS_PATH, clean_ct_state_dict
+from models.mri_model import WEIGHT_MRI_2D, WEIGHT_MRI_3D, clean_mri_state_dict
+from models.ultrasound_model import DEFAULT_ULTRASOUND_CHECKPOINT
+from services.xray_service import DEFAULT_WEIGHT_PATH as XRAY_WEIGHTS_PATH
+
+# (name, checkpoint, prepare) - prepare must match what the model loader uses
+CHECKPOINTS = [
+    ("xray", XRAY_WEIGHTS_PATH, lambda ckpt: ckpt["state_dict"]),
+    ("ct2d", CT_2D_WEIGHTS_PATH, lambda ckpt: clean_ct_state_dict(ckpt, "2d")),
+    ("ct3d", CT_3D_WEIGHTS_PATH, lambda ckpt: clean_ct_state_dict(ckpt, "3d")),
+    ("mri2d", WEIGHT_MRI_2D, clean_mri_state_dict),
+    ("mri3d", WEIGHT_MRI_3D, clean_mri_state_dict),
+    ("ultrasound", DEFAULT_ULTRASOUND_CHECKPOINT, lambda ckpt: ckpt),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert model checkpoints for memory-mapped loading.")
+    parser.add_argument("--force", action="store_true", help="reconvert even if the manifest is up to date")
+    parser.add_argument("--verify", action="store_true", help="only check converted files against the manifest")
+    args = parser.parse_args()
+
+    failed = False
+    for name, path, prepare in CHECKPOINTS:
+        if args.verify:
+            if not weight_cache.has_weights(path):
+                print(f"{name:<11} skipped (no checkpoint at {path})")
+                continue
+            ok = weight_cache.verify(path)
+            failed |= not ok
+            print(f"{name:<11} {'ok' if ok else 'MISSING/STALE'}  {path}")
+            continue
+
+        if not path.is_file():
+            print(f"{name:<11} skipped (no checkpoint at {path})")
+            continue
+        started = time.perf_counter()
+        try:
+            target = weight_cache.convert(path, prepare, force=args.force)
+        except Exception as e:
+            failed = True
+            print(f"{name:<11} FAILED: {e}")
+            continue
+        ms = (time.perf_counter() - started) * 1000.0
+        print(f"{name:<11} {target.name}  ({os.path.getsize(target) / 1e6:.1f} MB, {ms:.0f} ms)")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
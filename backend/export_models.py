@@ -0,0 +1,106 @@
+"""
+Export the models to TorchScript and ONNX so the services can run them
+without eager PyTorch (INFERENCE_BACKEND=torchscript / onnxruntime).
+
+    python export_models.py                          # every model with weights, both formats
+    python export_models.py --models xray,ct2d --formats onnx
+    python export_models.py --tolerance 1e-4
+
+Artifacts are written next to each checkpoint as '<weights>.ts' and
+'<weights>.onnx', with a dynamic batch dimension. Each one is reloaded the
+way the services load it and checked against the eager model on a random
+batch of two; the export fails if any output differs by more than
+--tolerance. Re-run after replacing weights: artifacts older than their
+checkpoint are ignored at serving time.
+"""
+import argparse
+import os
+import sys
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+
+import torch
+
+from models import runtime
+from models.xray_model import load_chexnet_model
+from models.ct_model import load_ct_model, CT_2D_WEIGHTS_PATH, CT_3D_WEIGHTS_PATH
+from models.mri_model import load_mri_model, WEIGHT_MRI_2D, WEIGHT_MRI_3D
+from models.ultrasound_model import load_ultrasound_model, DEFAULT_ULTRASOUND_CHECKPOINT
+from models.weight_cache import has_weights
+from services.xray_service import DEFAULT_WEIGHT_PATH as XRAY_WEIGHTS_PATH
+
+# name -> (weights, eager loader)
+MODELS = {
+    'xray': (XRAY_WEIGHTS_PATH, lambda: load_chexnet_model(str(XRAY_WEIGHTS_PATH))),
+    'ct2d': (CT_2D_WEIGHTS_PATH, lambda: load_ct_model(mode='2d')),
+    'ct3d': (CT_3D_WEIGHTS_PATH, lambda: load_ct_model(mode='3d')),
+    'mri2d': (WEIGHT_MRI_2D, lambda: load_mri_model('2d')),
+    'mri3d': (WEIGHT_MRI_3D, lambda: load_mri_model('3d')),
+    'ultrasound': (DEFAULT_ULTRASOUND_CHECKPOINT, load_ultrasound_model),
+}
+
+EXPORTERS = {
+    'torchscript': (runtime.export_torchscript, runtime.load_torchscript),
+    'onnxruntime': (runtime.export_onnx, runtime.load_onnxruntime),
+}
+FORMAT_ALIASES = {'torchscript': 'torchscript', 'ts': 'torchscript', 'onnx': 'onnxruntime', 'onnxruntime': 'onnxruntime'}
+
+
+def max_abs_diff(eager, exported, shape) -> float:
+    """Largest output difference on a random batch of two (exercises the dynamic batch)."""
+    x = torch.randn(2, *shape[1:])
+    with torch.no_grad():
+        return float((eager(x) - exported(x)).abs().max())
+
+def export_one(name: str, model, backend: str, tolerance: float) -> dict:
+    weights, _ = MODELS[name]
+    export, load = EXPORTERS[backend]
+    shape = runtime.EXAMPLE_SHAPES[name]
+    path = runtime.exported_path(weights, backend)
+
+    started = time.perf_counter()
+    export(model, torch.zeros(*shape), path)
+    export_ms = (time.perf_counter() - started) * 1000.0
+    diff = max_abs_diff(model, load(path), shape)
+    if diff > tolerance:
+        path.unlink()
+        raise RuntimeError(f"outputs differ by {diff:.2e} (> {tolerance:.0e}); artifact removed")
+    return {"path": path, "export_ms": export_ms, "max_abs_diff": diff, "mb": os.path.getsize(path) / 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", default=",".join(MODELS))
+    parser.add_argument("--formats", default="torchscript,onnx", help="torchscript and/or onnx")
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="max abs output difference vs eager")
+    args = parser.parse_args()
+
+    backends = [FORMAT_ALIASES[f.strip().lower()] for f in args.formats.split(",") if f.strip()]
+    if 'onnxruntime' in backends and runtime.ort is None:
+        print("onnxruntime is not installed; ONNX exports cannot be checked, skipping them")
+        backends.remove('onnxruntime')
+
+    failed = False
+    for name in [m.strip() for m in args.models.split(",") if m.strip()]:
+        weights, loader = MODELS[name]
+        if not has_weights(weights):
+            print(f"{name:<11} skipped (no weights at {weights})")
+            continue
+        model = loader().eval()
+        for backend in backends:
+            try:
+                r = export_one(name, model, backend, args.tolerance)
+            except Exception as e:
+                failed = True
+                print(f"{name:<11} {backend:<12} FAILED: {e}")
+                continue
+            print(f"{name:<11} {backend:<12} {r['path'].name}  ({r['mb']:.1f} MB, {r['export_ms']:.0f} ms, "
+                  f"max |diff| {r['max_abs_diff']:.2e})")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,13 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Path, APIRouter
+from fastapi import FastAPI, UploadFile, File, HTTPException, Path, Query, APIRouter
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import shutil
+from fastapi.responses import JSONResponse, StreamingResponse
 from contextlib import asynccontextmanager
+import asyncio
 import os
 import re
 import io
 import json
+import zipfile
 import pytesseract
 import numpy as np
 from PIL import Image, ImageEnhance
@@ -25,32 +26,32 @@ from io import BytesIO
 import base64
 
 # Import analysis router
-from routes.analysis import router as analysis_router
-
-# Import your ML model functions for each modality
-from services.xray_service import process_xray, init_xray_model
-# Uncomment when available:
-from services.ct_service import process_ct, init_ct_models
-from services.ultrasound_service import process_ultrasound, init_ultrasound_model
-from services.mri_service import process_mri, init_mri_models
-
-
+from routes.analysis import router as analysis_router, UploadRejected, upload_rejected
 
 # Load environment variables
 load_dotenv()
 
 # Import your ML model functions for each modality
-from services.xray_service import process_xray, init_xray_model
-# Uncomment when available:
-from services.ct_service import process_ct, init_ct_models
-from services.ultrasound_service import process_ultrasound, init_ultrasound_model
-from services.mri_service import process_mri, init_mri_models
-
-# Initialize Google GenAI Client (multimodal)
+# (models are loaded lazily by services/model_registry.py, which owns their lifecycle)
+from services.xray_service import aprocess_xray, process_xray_batch, get_xray_batching_stats, shutdown_xray_batcher, BatchQueueFull
+from services.ct_service import process_ct, process_ct_batch
+from services.ultrasound_service import process_ultrasound, process_ultrasound_batch
+from services.mri_service import process_mri
+from services.uploads import read_upload, scratch_file
+from services.batch_prediction import BatchTooLarge, expand_uploads, image_mime_type, max_batch_bytes, max_batch_files
+from services.prediction_cache import digest_source, get_prediction_cache_stats
+from services.overlay_store import get_overlay_store
+from services.report_cache import get_report_cache, report_cache_key
+from services.executor import run_inference, run_blocking_io, get_pool_stats, shutdown_pools
+from services.model_registry import warm_up_models, get_model_registry_stats, get_startup_report
+from models.volume_io import NiftiVolume, open_volume
+from models.dicom_io import SeriesTooLarge, is_dicom_series, load_dicom_series, max_series_files, max_volume_bytes
+
+# Report generation goes through an async, retrying, circuit-broken client
+# (Google GenAI by default; see services/report_client.py)
 # pip install google-genai
-from google import genai
 from google.genai.types import Part
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+from services.report_client import get_report_client, report_field, templated_report, ReportUnavailable
 
 # Global: store latest predictions for frontend polling
 latest_xray_results: dict = {}
@@ -59,17 +60,18 @@ latest_reports = {}
 # Startup: initialize all models
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    init_xray_model()
-    init_ct_models()
-    init_ultrasound_model()
-    init_mri_models()
+    # Models load on first use; MODEL_WARMUP preloads some (or all) of them
+    warm_up_models()
     yield
     print("Shutting down models...")
+    shutdown_xray_batcher()
+    shutdown_pools()
 
 app = FastAPI(lifespan=lifespan)
 
 # Include analysis router
 app.include_router(analysis_router, prefix="/api/v1")
+app.add_exception_handler(UploadRejected, upload_rejected)
 
 # CORS settings
 origins = ["*"]  # allow all origins for simplicity; adjust as needed
@@ -170,6 +172,58 @@ PROMPT_TEMPLATES = {
         "create a detailed MRI report including key findings, interpretation, and suggested follow‑up."
     ),
 }
+# 3D studies send three rendered mid-slices with these prompts
+CT3D_PROMPT = (
+        '''
+        You are a medical AI assistant specialized in interpreting 3D and 2D CT scan results. 
+        Given a set of AI-generated confidence scores for tumor detection, your task is to:
+
+        1. Identify whether a tumor or no tumor is more likely based on the highest confidence score.
+        2. Clearly mention the detected condition and the confidence score as a percentage (e.g., 92.00%).
+        3. Explain what this result means for the patient in clear, simple language.
+        4. Describe briefly how 3D CT scans assist in detecting tumors by providing detailed cross-sectional views of the body.
+        5. Recommend possible next steps such as further imaging or biopsy for confirmation.
+        6. End with a disclaimer stating that this is an AI-generated preliminary result and must be verified by a certified medical professional.
+        7. Do not begin with "Based on the image and the patient symptoms" or any other introductory phrase.
+        8. Report size should be always between 200 and 300 words.
+        9. Use the following format for the output:
+
+        Output example 
+        Condition Detected: Tumor
+        The AI analysis of your 3D CT scan of the brain indicates a high probability of a tumor, with a confidence score of 92.00%. This suggests there may be an abnormal mass or growth
+        present in the scanned region. 3D CT scans allow doctors to view detailed cross-sectional images of internal tissues, making it easier to identify potential issues like 
+        tumors. While this result is a strong indicator, it is not a confirmed diagnosis. Further testing, such as an MRI or biopsy, may be required. 
+        Disclaimer: This is an AI-generated summary. Please consult a certified doctor or radiologist for medical confirmation and advice.
+        '''
+)
+
+MRI3D_PROMPT = (
+            '''
+                You are a medical specialist in interpreting brain MRI results. 
+                Based on the image and the patient symptoms: {symptoms}, your task is to:
+
+                1. Identify the condition with the highest confidence score from the list: ["No Tumor", "Meningioma", "Glioma", "Pituitary Tumor"].
+                2. Clearly mention the detected condition and the confidence score as a percentage (e.g., 87.45%).
+                3. Explain what this result means for the patient in clear, simple language, based on the detected condition.
+                4. Describe briefly how brain MRI helps in identifying such conditions by providing high-resolution images of soft tissues.
+                5. Suggest possible next steps, such as neurologist consultation, further imaging, or biopsy, depending on the condition.
+                6. End with a disclaimer stating that this is an AI-generated preliminary result and must be verified by a certified medical professional.
+                7. Do not begin with "Based on the image and the patient symptoms" or any other introductory phrase.
+                8. Report size should be always between 200 and 300 words.
+                9. create a detailed MRI report including key findings, interpretation, and suggested follow‑up
+                9. Use the following format for the output:
+
+                Condition Detected: Glioma
+                The AI analysis of your brain MRI scan suggests a high probability of Glioma, with a confidence score of 89.00%. Gliomas are tumors that originate in the glial cells of the brain or spinal cord. They can affect brain function depending on their location, size, and growth rate, potentially causing symptoms such as headaches, seizures, or neurological changes.
+
+                MRI scans are highly effective for detecting such tumors, as they offer detailed images of soft brain tissues. This allows for accurate visualization of the tumor's structure and position, which is crucial for early diagnosis and treatment planning.
+
+                Although this result indicates a strong likelihood of Glioma, it is not a confirmed medical diagnosis. You should consult a neurologist or oncologist for further evaluation. Additional tests like a contrast-enhanced MRI or biopsy may be recommended to validate the finding.
+
+                Disclaimer: This is an AI-generated result. Please seek advice from a certified medical professional.
+            '''
+)
+
 # A generic fallback if you ever get an unexpected modality:
 FALLBACK_TEMPLATE = (
     "You are a medical report assistant. Based on the image and patient symptoms: {symptoms}, "
@@ -180,8 +234,8 @@ def extract_top_symptoms(predictions: List[Tuple[str, float]], top_k: int = 3) -
     sorted_preds = sorted(predictions, key=lambda x: x[1], reverse=True)
     return [label for label, _ in sorted_preds[:top_k]]
 
-# Generate report using multimodal Gemini
-def generate_medical_report(symptoms: List[str], image_bytes: bytes, modality: str, mime_type: Optional[str] = None) -> str:
+# Build the multimodal request (contents + cache key) for a 2D report
+def build_report_request(symptoms: List[str], image_bytes: bytes, modality: str, mime_type: Optional[str] = None):
     # Prepare prompt
     template = PROMPT_TEMPLATES.get(modality.lower(), FALLBACK_TEMPLATE)
     prompt = template.format(symptoms=", ".join(symptoms))
@@ -194,25 +248,194 @@ def generate_medical_report(symptoms: List[str], image_bytes: bytes, modality: s
     
 
     contents = []
+    image_digest = None
     # Only wrap image if we actually have bytes and a valid mime_type
     if image_bytes is not None and mime_type and mime_type.startswith("image/"):
-        from google.genai.types import Part
         image_part = Part.from_bytes(data=image_bytes, mime_type=mime_type)
         contents.append(image_part)
+        image_digest = digest_source(image_bytes)  # read_upload already hashed batch uploads
 
     # Always add the prompt
     contents.append(prompt)
 
-    # Generate content with image part and prompt
-    response = client.models.generate_content(
-        model="models/gemini-2.0-flash",
-        contents=contents
+    return contents, report_cache_key(modality.lower(), template, symptoms, image_digest)
+
+# Generate report using multimodal Gemini
+async def generate_medical_report(symptoms: List[str], image_bytes: bytes, modality: str, mime_type: Optional[str] = None,
+                                  predictions: Optional[List[Tuple[str, float]]] = None) -> str:
+    contents, key = build_report_request(symptoms, image_bytes, modality, mime_type)
+    # Identical (template, symptoms, image) requests share one cached upstream call
+    try:
+        return await get_report_cache().aget_or_generate(key, lambda: get_report_client().generate(contents))
+    except ReportUnavailable as e:
+        # Upstream down or circuit open: answer from the model scores instead
+        print(f"Warning: falling back to templated report: {e}")
+        return templated_report(modality, predictions or [(s, None) for s in symptoms])
+
+
+async def generate_volume_report(report_key: str, prompt: str, image_parts: list, symptoms: List[str],
+                                 volume_digest: str, predictions: List[Tuple[str, Any]]) -> str:
+    """Gemini report for a 3D study from its rendered mid-slices, cached per uploaded volume."""
+    key = report_cache_key(report_key, prompt, symptoms, volume_digest)
+    try:
+        return await get_report_cache().aget_or_generate(
+            key, lambda: get_report_client().generate([*image_parts, prompt])
+        )
+    except ReportUnavailable as e:
+        print(f"Warning: falling back to templated report: {e}")
+        return templated_report(report_key, predictions)
+
+
+def predictions_json(predictions: List[Tuple[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {"label": label, "probability": float(prob) if isinstance(prob, (int, float, np.floating)) else prob}
+        for label, prob in predictions
+    ]
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_report_events(predictions_payload: dict, contents: list, cache_key: str,
+                               fallback, finalize):
+    """
+    Server-sent events for a report: `predictions` first (the model output is
+    already known), then `token` events as the report streams in, then `done`
+    with whatever `finalize(report)` returns (the parsed disease etc.).
+
+    A cached report is sent as a single token. If upstream is unavailable before
+    any text arrives, `fallback()` supplies a templated report; a failure midway
+    ends the stream with an `error` event.
+    """
+    yield sse_event("predictions", predictions_payload)
+
+    cache = get_report_cache()
+    report = cache.get(cache_key)
+    if report is not None:
+        yield sse_event("token", {"text": report})
+    else:
+        chunks = []
+        try:
+            async for text in get_report_client().stream(contents):
+                chunks.append(text)
+                yield sse_event("token", {"text": text})
+            report = "".join(chunks)
+            cache.put(cache_key, report)
+        except ReportUnavailable as e:
+            if chunks:
+                yield sse_event("error", {"detail": str(e)})
+                return
+            print(f"Warning: falling back to templated report: {e}")
+            report = fallback()
+            yield sse_event("token", {"text": report})
+
+    yield sse_event("done", finalize(report))
+
+def sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    if not response or not hasattr(response, 'text') or response.text is None:
-        raise HTTPException(status_code=500, detail="Empty response from Gemini API.")
-    return response.text
 
+def extract_condition(report: str) -> str:
+    """
+    Robustly pull the text immediately following 'Condition Detected:' 
+    up to the first non‑empty line, ignoring case/extra whitespace.
+    """
+    if not report:
+        return "Unknown"
+
+    lower = report.lower()
+    keyword = "condition detected"
+    start = lower.find(keyword)
+    if start == -1:
+        return "Unknown"
+
+    # Find the colon after the keyword
+    colon = report.find(":", start + len(keyword))
+    if colon == -1:
+        return "Unknown"
+
+    # Grab everything after the colon
+    tail = report[colon+1:]
+
+    # Split into lines, return the first non-blank one
+    for line in tail.splitlines():
+        line = line.strip()
+        if line:
+            return line
 
+    return "Unknown"
+
+def extract_field(report: str, field: str) -> str:
+    match = re.search(rf"{field}:\s*(.+)", report)
+    return match.group(1).strip() if match else "Unknown"
+
+
+
+
+def render_mid_slice_parts(volume) -> list:
+    """
+    Return the axial/coronal/sagittal mid-slices of a NIfTI volume (a path or
+    an opened NiftiVolume) as PNG Parts. Only the three planes are read.
+    """
+    slices = open_volume(volume).mid_slices()
+
+    image_parts = []
+    for name, sl in slices.items():
+        # normalize slice to [0,255]
+        sl_norm = ((sl - sl.min())/(sl.max()-sl.min()) * 255).astype(np.uint8)
+        pil = Image.fromarray(sl_norm).convert("L").resize((224,224))
+        buf = io.BytesIO()
+        pil.save(buf, format="PNG")
+        image_parts.append(Part.from_bytes(data=buf.getvalue(), mime_type="image/png"))
+    return image_parts
+
+
+@asynccontextmanager
+async def uploaded_volume(file: Optional[UploadFile], files: Optional[List[UploadFile]]):
+    """
+    Open a 3D upload as (Volume, content digest). A NIfTI file is staged
+    under a unique scratch name (nibabel needs a file) and memory-mapped; a
+    DICOM series, as a .zip or as the slice files themselves, is decoded
+    straight into memory.
+    """
+    uploads = [u for u in [file, *(files or [])] if u is not None]
+    if not uploads:
+        raise HTTPException(status_code=400, detail="No volume uploaded.")
+    if len(uploads) > max_series_files():
+        raise HTTPException(status_code=413, detail=f"At most {max_series_files()} files per series.")
+    # Uploads as sent share one byte budget; read_upload stops at what is left of it
+    received, budget = [], max_volume_bytes()
+    for u in uploads:
+        try:
+            upload = await read_upload(u, budget)
+        except HTTPException as e:
+            if e.status_code == 413:
+                raise HTTPException(status_code=413,
+                                    detail=f"Volume too large. Maximum size is {max_volume_bytes() // 2**20}MB of uploads.")
+            raise
+        budget -= len(upload)
+        received.append(upload)
+    blobs = [upload.data for upload in received]
+
+    if is_dicom_series(blobs):
+        try:
+            volume = await run_blocking_io(load_dicom_series, blobs)
+        except SeriesTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="Unreadable zip archive.")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        yield volume, volume.digest
+        return
+
+    if len(blobs) > 1:
+        raise HTTPException(status_code=400, detail="Upload one NIfTI file, or the slices of one DICOM series.")
+    nifti = received[0]  # hashed while it was read
+    with scratch_file(nifti.data, nifti.filename) as volume_path:
+        yield await run_blocking_io(NiftiVolume, volume_path, digest=nifti.digest), nifti.digest
 
 
 @app.post("/predict/xray/")
@@ -220,20 +443,58 @@ async def predict_xray(file: UploadFile = File(...)):
     if file.content_type not in ["image/jpeg", "image/png", "image/bmp"]:
         raise HTTPException(status_code=400, detail="Unsupported file type.")
 
-    temp_path = f"temp_{file.filename}"
-    with open(temp_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    img_bytes = await file.read()
 
     try:
-        predictions = process_xray(temp_path, device="cpu")
-        os.remove(temp_path)
+        predictions = await aprocess_xray(img_bytes, device="cpu")
         global latest_xray_results
         latest_xray_results = {label: float(prob) for label, prob in predictions}
         return JSONResponse(content={"predictions": predictions})
+    except BatchQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except HTTPException:  # PoolSaturated, ModelDisabled
+        raise
     except Exception as e:
-        os.remove(temp_path)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/health/pools")
+async def pools_health():
+    """Utilisation and backpressure metrics for the inference and I/O worker pools."""
+    return get_pool_stats()
+
+@app.get("/health/startup")
+async def startup_health():
+    return get_startup_report()
+
+@app.get("/health/models")
+async def models_health():
+    return get_model_registry_stats()
+
+@app.get("/health/prediction-cache")
+async def prediction_cache_health():
+    """Hit/miss counters for the content-hash prediction cache."""
+    return get_prediction_cache_stats()
+
+@app.get("/health/report-cache")
+async def report_cache_health():
+    """Hit/miss and single-flight counters for the Gemini report cache."""
+    return get_report_cache().stats()
+
+@app.get("/health/report-client")
+async def report_client_health():
+    """Concurrency, retry and circuit-breaker state of the report-generation client."""
+    return get_report_client().stats()
+
+@app.get("/health/overlay-store")
+async def overlay_store_health():
+    """Size and render/hit counters for the analysis overlay store."""
+    return get_overlay_store().stats()
+
+@app.get("/health/xray-batching")
+async def xray_batching_health():
+    """Queue depth and batch size metrics for the X-ray micro-batcher."""
+    return get_xray_batching_stats()
+
 @app.get("/get_latest_results/")
 async def get_latest_results():
     if not latest_xray_results:
@@ -252,24 +513,19 @@ async def generate_report(
     if file.content_type not in ["image/jpeg", "image/png", "image/bmp"]:
         raise HTTPException(status_code=400, detail="Unsupported file type.")
 
-    temp_path = f"temp_{modality}_{file.filename}"
-    with open(temp_path, "wb") as buf:
-        shutil.copyfileobj(file.file, buf)
+    # Read the upload once; the same bytes feed inference and the report
+    img_bytes = await file.read()
     try:
         # Inference dispatch
         if modality == "xray":
-            raw_preds = process_xray(temp_path, device="cpu")
-        # elif modality == "ct": raw_preds = process_ct(temp_path, device="cpu")
-        # elif modality == "ultrasound": raw_preds = process_ultrasound(temp_path, device="cpu")
-        # else: raw_preds = process_mri(temp_path, device="cpu")
+            raw_preds = await aprocess_xray(img_bytes, device="cpu")
+        # elif modality == "ct": raw_preds = process_ct(img_bytes, device="cpu")
+        # elif modality == "ultrasound": raw_preds = process_ultrasound(img_bytes, device="cpu")
+        # else: raw_preds = process_mri(img_bytes, device="cpu")
 
         symptoms = extract_top_symptoms(raw_preds)
-        # Read bytes
-        with open(temp_path, "rb") as f:
-            img_bytes = f.read()
-        os.remove(temp_path)
 
-        report = generate_medical_report(symptoms, img_bytes, modality)
+        report = await generate_medical_report(symptoms, img_bytes, modality, predictions=raw_preds)
         # Extract the disease from the report
         match = re.search(r"Disease Expected:\s*(.+)", report)
         disease = match.group(1).strip() if match else "Unknown"
@@ -282,10 +538,8 @@ async def generate_report(
         }
         return JSONResponse(content={"symptoms": symptoms, "disease": disease ,"report": report})
     except HTTPException:
-        os.remove(temp_path)
         raise
     except Exception as e:
-        if os.path.exists(temp_path): os.remove(temp_path)
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/get-latest-report/{modality}/")
@@ -306,23 +560,16 @@ async def generate_report_ct2d(file: UploadFile = File(...)):
     if file.content_type not in ["image/jpeg", "image/png", "image/bmp"]:
         raise HTTPException(status_code=400, detail="Unsupported file type for CT2D.")
 
-    temp_path = f"temp_ct2d_{file.filename}"
-    with open(temp_path, "wb") as buf:
-        shutil.copyfileobj(file.file, buf)
+    img_bytes = await file.read()
 
     try:
         # Inference
-        raw_preds = process_ct(temp_path, mode=mode, device="cpu")
+        raw_preds = await run_inference(process_ct, img_bytes, mode=mode, device="cpu")
         symptoms = extract_top_symptoms(raw_preds)
 
-        # Read image bytes before deleting temp
-        with open(temp_path, "rb") as f:
-            img_bytes = f.read()
-        os.remove(temp_path)
-
         # Generate report using correct MIME type
-        report = generate_medical_report(
-            symptoms, img_bytes, modality=modality, mime_type=file.content_type
+        report = await generate_medical_report(
+            symptoms, img_bytes, modality=modality, mime_type=file.content_type, predictions=raw_preds
         )
 
         # Extract disease
@@ -343,84 +590,35 @@ async def generate_report_ct2d(file: UploadFile = File(...)):
         })
 
     except HTTPException:
-        if os.path.exists(temp_path): os.remove(temp_path)
         raise
     except Exception as e:
-        if os.path.exists(temp_path): os.remove(temp_path)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 
 ## 3d route 
 @app.post("/predict/ct/3d/")
-async def generate_report_ct3d(file: UploadFile = File(...)):
-    # 1) Save upload to disk
-    temp_path = f"temp_ct3d_{file.filename}"
-    with open(temp_path, "wb") as buf:
-        shutil.copyfileobj(file.file, buf)
-
+async def generate_report_ct3d(file: Optional[UploadFile] = File(None),
+                               files: Optional[List[UploadFile]] = File(None)):
     try:
-        # 2) Run your 3D model to get symptoms label(s)
-        raw_preds = process_ct(temp_path, mode="3d", device="cpu")
-        label, prob = raw_preds[0] # type: ignore
-        symptoms = [label]
-
-        # 3) Load volume and pick mid-slices
-        img = load(temp_path)
-        vol = img.get_fdata() #type: ignore
-        z, y, x = [d // 2 for d in vol.shape]
-        slices = {
-            "axial":   vol[z, :, :],
-            "coronal": vol[:, y, :],
-            "sagittal":vol[:, :, x],
-        }
+        # 1) Open the upload: a NIfTI file, or a DICOM series (zip or slice files)
+        async with uploaded_volume(file, files) as (volume, volume_digest):
+            # 2) Run your 3D model to get symptoms label(s); one handle serves the model and the slices
+            raw_preds = await run_inference(process_ct, volume, mode="3d", device="cpu")
+            label, prob = raw_preds[0] # type: ignore
+            symptoms = [label]
 
-        # 4) Convert each slice to PNG bytes
-        image_parts = []
-        for name, sl in slices.items():
-            # normalize slice to [0,255]
-            sl_norm = ((sl - sl.min())/(sl.max()-sl.min()) * 255).astype(np.uint8)
-            pil = Image.fromarray(sl_norm).convert("L").resize((224,224))
-            buf = io.BytesIO()
-            pil.save(buf, format="PNG")
-            image_parts.append(Part.from_bytes(data=buf.getvalue(), mime_type="image/png"))
+            # 3) Load volume, pick mid-slices and convert each to PNG bytes
+            image_parts = await run_inference(render_mid_slice_parts, volume)
 
-        os.remove(temp_path)
+        # 4) Build prompt & send all three images + prompt
+        prompt = CT3D_PROMPT
 
-        # 5) Build prompt & send all three images + prompt
-        prompt = (
-        '''
-        You are a medical AI assistant specialized in interpreting 3D and 2D CT scan results. 
-        Given a set of AI-generated confidence scores for tumor detection, your task is to:
-
-        1. Identify whether a tumor or no tumor is more likely based on the highest confidence score.
-        2. Clearly mention the detected condition and the confidence score as a percentage (e.g., 92.00%).
-        3. Explain what this result means for the patient in clear, simple language.
-        4. Describe briefly how 3D CT scans assist in detecting tumors by providing detailed cross-sectional views of the body.
-        5. Recommend possible next steps such as further imaging or biopsy for confirmation.
-        6. End with a disclaimer stating that this is an AI-generated preliminary result and must be verified by a certified medical professional.
-        7. Do not begin with "Based on the image and the patient symptoms" or any other introductory phrase.
-        8. Report size should be always between 200 and 300 words.
-        9. Use the following format for the output:
-
-        Output example 
-        Condition Detected: Tumor
-        The AI analysis of your 3D CT scan of the brain indicates a high probability of a tumor, with a confidence score of 92.00%. This suggests there may be an abnormal mass or growth
-        present in the scanned region. 3D CT scans allow doctors to view detailed cross-sectional images of internal tissues, making it easier to identify potential issues like 
-        tumors. While this result is a strong indicator, it is not a confirmed diagnosis. Further testing, such as an MRI or biopsy, may be required. 
-        Disclaimer: This is an AI-generated summary. Please consult a certified doctor or radiologist for medical confirmation and advice.
-        '''
-        )
-
-        response = client.models.generate_content(
-            model="models/gemini-2.0-flash",
-            contents=[*image_parts, prompt]
-        )
-        report = response.text or "<empty>"
+        report = await generate_volume_report("ct3d", prompt, image_parts, symptoms, volume_digest, raw_preds)
         match = re.search(r"Condition Detected:\s*(.+)", report)
         disease = match.group(1).strip() if match else "Unknown"
 
-        # 6) Store & return
+        # 5) Store & return
         latest_reports["ct3d"] = {
             "Symptom": label,
             "disease": disease,
@@ -428,8 +626,9 @@ async def generate_report_ct3d(file: UploadFile = File(...)):
         }
         return JSONResponse(latest_reports["ct3d"])
 
+    except HTTPException:
+        raise
     except Exception as e:
-        if os.path.exists(temp_path): os.remove(temp_path)
         raise HTTPException(status_code=500, detail=str(e))
     
 
@@ -446,85 +645,36 @@ async def get_latest_report_ct3d():
     return latest_reports["ct3d"]
 
 @app.post("/predict/mri/3d/")
-async def generate_report_mri3d(file: UploadFile = File(...)):  
-    # 1) Save upload to disk
-    temp_path = f"temp_mri3d_{file.filename}"
-    with open(temp_path, "wb") as buf:
-        shutil.copyfileobj(file.file, buf)
+async def generate_report_mri3d(file: Optional[UploadFile] = File(None),
+                                files: Optional[List[UploadFile]] = File(None)):
     try:
-        # 2) Run your 3D model to get symptoms label(s)
-        raw_preds = process_mri(temp_path, mode='3d', device="cpu")
-        label, prob = raw_preds[0]
-        symptoms = [label]
-
-        # 3) Load volume and pick mid-slices
-        img = load(temp_path)
-        vol = img.get_fdata() #type: ignore
-        z, y, x = [d // 2 for d in vol.shape]
-        slices = {
-            "axial":   vol[z, :, :],
-            "coronal": vol[:, y, :],
-            "sagittal":vol[:, :, x],
-        }
-
-        # 4) Convert each slice to PNG bytes
-        image_parts = []
-        for name, sl in slices.items():
-            # normalize slice to [0,255]
-            sl_norm = ((sl - sl.min())/(sl.max()-sl.min()) * 255).astype(np.uint8)
-            pil = Image.fromarray(sl_norm).convert("L").resize((224,224))
-            buf = io.BytesIO()
-            pil.save(buf, format="PNG")
-            image_parts.append(Part.from_bytes(data=buf.getvalue(), mime_type="image/png"))
-
-        os.remove(temp_path)
+        # 1) Open the upload: a NIfTI file, or a DICOM series (zip or slice files)
+        async with uploaded_volume(file, files) as (volume, volume_digest):
+            # 2) Run your 3D model to get symptoms label(s)
+            raw_preds = await run_inference(process_mri, volume, mode='3d', device="cpu")
+            label, prob = raw_preds[0]
+            symptoms = [label]
 
-        # 5) Build prompt & send all three images + prompt
-        prompt = (
-            '''
-                You are a medical specialist in interpreting brain MRI results. 
-                Based on the image and the patient symptoms: {symptoms}, your task is to:
+            # 3) Load volume, pick mid-slices and convert each to PNG bytes
+            image_parts = await run_inference(render_mid_slice_parts, volume)
 
-                1. Identify the condition with the highest confidence score from the list: ["No Tumor", "Meningioma", "Glioma", "Pituitary Tumor"].
-                2. Clearly mention the detected condition and the confidence score as a percentage (e.g., 87.45%).
-                3. Explain what this result means for the patient in clear, simple language, based on the detected condition.
-                4. Describe briefly how brain MRI helps in identifying such conditions by providing high-resolution images of soft tissues.
-                5. Suggest possible next steps, such as neurologist consultation, further imaging, or biopsy, depending on the condition.
-                6. End with a disclaimer stating that this is an AI-generated preliminary result and must be verified by a certified medical professional.
-                7. Do not begin with "Based on the image and the patient symptoms" or any other introductory phrase.
-                8. Report size should be always between 200 and 300 words.
-                9. create a detailed MRI report including key findings, interpretation, and suggested follow‑up
-                9. Use the following format for the output:
+        # 4) Build prompt & send all three images + prompt
+        prompt = MRI3D_PROMPT.format(symptoms=symptoms)
 
-                Condition Detected: Glioma
-                The AI analysis of your brain MRI scan suggests a high probability of Glioma, with a confidence score of 89.00%. Gliomas are tumors that originate in the glial cells of the brain or spinal cord. They can affect brain function depending on their location, size, and growth rate, potentially causing symptoms such as headaches, seizures, or neurological changes.
-
-                MRI scans are highly effective for detecting such tumors, as they offer detailed images of soft brain tissues. This allows for accurate visualization of the tumor's structure and position, which is crucial for early diagnosis and treatment planning.
-
-                Although this result indicates a strong likelihood of Glioma, it is not a confirmed medical diagnosis. You should consult a neurologist or oncologist for further evaluation. Additional tests like a contrast-enhanced MRI or biopsy may be recommended to validate the finding.
-
-                Disclaimer: This is an AI-generated result. Please seek advice from a certified medical professional.
-            '''
-        ).format(symptoms=symptoms)
-
-
-        response = client.models.generate_content(
-            model="models/gemini-2.0-flash",
-            contents=[*image_parts, prompt]
-        )
-        report = response.text or "<empty>"
+        report = await generate_volume_report("mri3d", prompt, image_parts, symptoms, volume_digest, raw_preds)
         match = re.search(r"Condition Detected:\s*(.+)", report)
         disease = match.group(1).strip() if match else "Unknown"
 
-        # 6) Store & return
+        # 5) Store & return
         latest_reports["mri3d"] = {
             "Symptom": label,
             "disease": disease,
             "report": report
         }
         return JSONResponse(latest_reports["mri3d"])
+    except HTTPException:
+        raise
     except Exception as e:
-        if os.path.exists(temp_path): os.remove(temp_path)
         raise HTTPException(status_code=500, detail=str(e))
 @app.get("/predict/mri/3d/")
 async def get_latest_report_mri3d():
@@ -540,79 +690,34 @@ async def generate_report_ultrasound(file: UploadFile = File(...)):
     if file.content_type not in ["image/jpeg", "image/png", "image/bmp"]:
         raise HTTPException(status_code=400, detail="Unsupported file type.")
 
-    # 2) Save upload to disk
-    temp_path = f"temp_{modality}_{file.filename}"
-    with open(temp_path, "wb") as buf:
-        shutil.copyfileobj(file.file, buf)
+    # 2) Read the upload once; the same bytes feed inference and the report
+    img_bytes = await file.read()
 
     try:
         # 3) Run your ultrasound model to get symptom labels
-        raw_preds = process_ultrasound(temp_path, device="cpu")
+        raw_preds = await run_inference(process_ultrasound, img_bytes, device="cpu")
         symptoms = extract_top_symptoms(raw_preds)
 
-        # 4) Read bytes for report generation
-        with open(temp_path, "rb") as f:
-            img_bytes = f.read()
-
-        # remove temp file ASAP
-        os.remove(temp_path)
-
-        # 5) Generate the Gemini‐based medical report
-        report = generate_medical_report(symptoms, img_bytes, modality=modality)
-
-        def extract_condition(report: str) -> str:
-            """
-            Robustly pull the text immediately following 'Condition Detected:' 
-            up to the first non‑empty line, ignoring case/extra whitespace.
-            """
-            if not report:
-                return "Unknown"
-
-            lower = report.lower()
-            keyword = "condition detected"
-            start = lower.find(keyword)
-            if start == -1:
-                return "Unknown"
-
-            # Find the colon after the keyword
-            colon = report.find(":", start + len(keyword))
-            if colon == -1:
-                return "Unknown"
-
-            # Grab everything after the colon
-            tail = report[colon+1:]
-
-            # Split into lines, return the first non-blank one
-            for line in tail.splitlines():
-                line = line.strip()
-                if line:
-                    return line
-
-            return "Unknown"
+        # 4) Generate the Gemini‐based medical report
+        report = await generate_medical_report(symptoms, img_bytes, modality=modality, predictions=raw_preds)
 
         disease = extract_condition(report)
-        # 7) Store in global for frontend polling if needed
+        # 5) Store in global for frontend polling if needed
         latest_reports[modality] = {
             "disease":  disease,
             "symptoms": symptoms,
             "report":   report,
         }
 
-        # 8) Return JSON
+        # 6) Return JSON
         return JSONResponse(
             content={"symptoms": symptoms, "disease": disease, "report": report}
         )
 
     except HTTPException:
-        # Already an HTTPException—nothing extra to clean up
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
         raise
 
     except Exception as e:
-        # Catch‐all: ensure temp file is removed
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
         raise HTTPException(status_code=500, detail=str(e))
         
 @app.get("/predict/ultrasound/")
@@ -621,6 +726,209 @@ async def get_latest_report_ultrasound():
         raise HTTPException(status_code=404, detail="No ultrasound report available.")
     return latest_reports["ultrasound"]
 
+
+# Batch prediction: many images of one modality per request, as separate
+# files and/or zip archives. Images are decoded in parallel and classified in
+# batched forward passes; each file gets its own result (or error), in order.
+BATCH_PROCESSORS = {"xray": process_xray_batch, "ct": process_ct_batch, "ultrasound": process_ultrasound_batch}
+
+@app.post("/predict/{modality}/batch")
+async def predict_batch(
+    modality: str = Path(..., description="One of: xray, ct (2D slices), ultrasound"),
+    files: List[UploadFile] = File(...),
+    report: bool = Query(True, description="Generate a Gemini report per image; false returns predictions only"),
+):
+    modality = modality.lower()
+    if modality not in BATCH_PROCESSORS:
+        raise HTTPException(status_code=400, detail="Invalid modality.")
+
+    if len(files) > max_batch_files():
+        raise BatchTooLarge(f"At most {max_batch_files()} images per batch.")
+    # Uploads as sent share one byte budget; read_upload stops at what is left of it
+    received, budget = [], max_batch_bytes()
+    for f in files:
+        try:
+            upload = await read_upload(f, budget)
+        except HTTPException as e:
+            if e.status_code == 413:
+                raise BatchTooLarge(f"Batch too large. Maximum size is {max_batch_bytes() // 2**20}MB of uploads.")
+            raise
+        budget -= len(upload)
+        received.append((upload.filename, upload.data))
+    try:
+        uploads = expand_uploads(received)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Unreadable zip archive.")
+    if not uploads:
+        raise HTTPException(status_code=400, detail="No images uploaded.")
+
+    try:
+        raw_preds = await run_inference(BATCH_PROCESSORS[modality], [data for _, data in uploads], device="cpu")
+    except BatchQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except HTTPException:  # PoolSaturated, ModelDisabled
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    results = []
+    for (filename, _), preds in zip(uploads, raw_preds):
+        if preds is None:
+            results.append({"filename": filename, "error": "Unsupported or unreadable image."})
+        else:
+            results.append({"filename": filename, "predictions": predictions_json(preds),
+                            "symptoms": extract_top_symptoms(preds)})
+
+    if report:
+        async def add_report(result, img_bytes, preds):
+            text = await generate_medical_report(result["symptoms"], img_bytes, modality,
+                                                 mime_type=image_mime_type(img_bytes), predictions=preds)
+            result["disease"] = extract_field(text, report_field(modality))
+            result["report"] = text
+
+        # Reports go through the shared report client, which bounds upstream concurrency
+        await asyncio.gather(*(
+            add_report(result, data, preds)
+            for result, (_, data), preds in zip(results, uploads, raw_preds) if preds is not None
+        ))
+
+    return JSONResponse({"modality": modality, "count": len(results), "results": results})
+
+
+# Streaming (SSE) variants of the report routes.
+# Inference runs before the response starts, so the `predictions` event goes
+# out as soon as the model is done; report tokens follow as Gemini emits them
+# and the parsed `disease` arrives last in the `done` event.
+
+def _report_finalizer(store_key: str, field: str, **extra):
+    def finalize(report: str) -> dict:
+        disease = extract_field(report, field)
+        latest_reports[store_key] = {**extra, "disease": disease, "report": report}
+        return latest_reports[store_key]
+    return finalize
+
+async def _stream_2d_report(store_key: str, field: str, modality: str, raw_preds, img_bytes: bytes,
+                            mime_type: Optional[str] = None) -> StreamingResponse:
+    symptoms = extract_top_symptoms(raw_preds)
+    contents, key = build_report_request(symptoms, img_bytes, modality, mime_type)
+    events = stream_report_events(
+        {"symptoms": symptoms, "predictions": predictions_json(raw_preds)},
+        contents,
+        key,
+        fallback=lambda: templated_report(modality, raw_preds),
+        finalize=_report_finalizer(store_key, field, symptoms=symptoms),
+    )
+    return sse_response(events)
+
+async def _stream_3d_report(store_key: str, process, prompt_for, file: Optional[UploadFile],
+                            files: Optional[List[UploadFile]] = None) -> StreamingResponse:
+    async with uploaded_volume(file, files) as (volume, volume_digest):
+        raw_preds = await run_inference(process, volume, mode="3d", device="cpu")
+        label, prob = raw_preds[0]
+        image_parts = await run_inference(render_mid_slice_parts, volume)
+
+    symptoms = [label]
+    prompt = prompt_for(symptoms)
+    events = stream_report_events(
+        {"Symptom": label, "predictions": predictions_json(raw_preds)},
+        [*image_parts, prompt],
+        report_cache_key(store_key, prompt, symptoms, volume_digest),
+        fallback=lambda: templated_report(store_key, raw_preds),
+        finalize=_report_finalizer(store_key, "Condition Detected", Symptom=label),
+    )
+    return sse_response(events)
+
+@app.post("/generate-report/{modality}/stream/")
+async def generate_report_stream(
+    modality: str = Path(..., description="One of: xray, ct, ultrasound, mri"),
+    file: UploadFile = File(...)
+):
+    modality = modality.lower()
+    if modality not in ["xray", "ct", "ultrasound", "mri"]:
+        raise HTTPException(status_code=400, detail="Invalid modality.")
+    if modality != "xray":
+        raise HTTPException(status_code=400, detail="Streaming reports are only available for xray on this route.")
+    if file.content_type not in ["image/jpeg", "image/png", "image/bmp"]:
+        raise HTTPException(status_code=400, detail="Unsupported file type.")
+
+    img_bytes = await file.read()
+    try:
+        raw_preds = await aprocess_xray(img_bytes, device="cpu")
+        return await _stream_2d_report(modality, "Disease Expected", modality, raw_preds, img_bytes)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/predict/ct/2d/stream/")
+async def generate_report_ct2d_stream(file: UploadFile = File(...)):
+    if file.content_type not in ["image/jpeg", "image/png", "image/bmp"]:
+        raise HTTPException(status_code=400, detail="Unsupported file type for CT2D.")
+
+    img_bytes = await file.read()
+    try:
+        raw_preds = await run_inference(process_ct, img_bytes, mode="2d", device="cpu")
+        return await _stream_2d_report("ct2d", "Condition Detected", "ct", raw_preds, img_bytes,
+                                       mime_type=file.content_type)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/predict/ct/3d/stream/")
+async def generate_report_ct3d_stream(file: Optional[UploadFile] = File(None),
+                                      files: Optional[List[UploadFile]] = File(None)):
+    try:
+        return await _stream_3d_report("ct3d", process_ct, lambda symptoms: CT3D_PROMPT, file, files)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/predict/mri/3d/stream/")
+async def generate_report_mri3d_stream(file: Optional[UploadFile] = File(None),
+                                       files: Optional[List[UploadFile]] = File(None)):
+    try:
+        return await _stream_3d_report(
+            "mri3d", process_mri, lambda symptoms: MRI3D_PROMPT.format(symptoms=symptoms), file, files
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/predict/ultrasound/stream/")
+async def generate_report_ultrasound_stream(file: UploadFile = File(...)):
+    if file.content_type not in ["image/jpeg", "image/png", "image/bmp"]:
+        raise HTTPException(status_code=400, detail="Unsupported file type.")
+
+    img_bytes = await file.read()
+    try:
+        raw_preds = await run_inference(process_ultrasound, img_bytes, device="cpu")
+        symptoms = extract_top_symptoms(raw_preds)
+        contents, key = build_report_request(symptoms, img_bytes, "ultrasound")
+
+        def finalize(report: str) -> dict:
+            latest_reports["ultrasound"] = {
+                "disease": extract_condition(report),
+                "symptoms": symptoms,
+                "report": report,
+            }
+            return latest_reports["ultrasound"]
+
+        events = stream_report_events(
+            {"symptoms": symptoms, "predictions": predictions_json(raw_preds)},
+            contents,
+            key,
+            fallback=lambda: templated_report("ultrasound", raw_preds),
+            finalize=finalize,
+        )
+        return sse_response(events)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Blood Sugar Report Analysis
 
 # Store analysis results
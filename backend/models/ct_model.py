@@ -1,11 +1,14 @@
 import torch
 import torch.nn as nn
-from torchvision import models, transforms
+from torchvision import models
 from PIL import Image
 import numpy as np
-from nibabel.loadsave import load as load_nifti
 from pathlib import Path
 import os
+from .preprocessing import ImagePreprocessor
+from .sliding_window import patch_settings, sliding_window_logits
+from .volume_io import open_volume, resample_volume
+from .weight_cache import has_weights, load_state_dict
 
 BACKEND_ROOT = Path(__file__).resolve().parents[1]
 CT_2D_WEIGHTS_PATH = BACKEND_ROOT / 'model_assests' / 'ct' / '2d' / 'ResNet50.pt'
@@ -22,22 +25,34 @@ class CTNet2D(nn.Module):
     def forward(self, x):
         return self.model(x)
 
-ct_transforms_2d = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                         std=[0.229, 0.224, 0.225])
-])
+ct_transforms_2d = ImagePreprocessor((224, 224))
 
 
 # 3D CNN
-def window_and_normalize(volume, hu_min=-150, hu_max=350):
-    vol = np.clip(volume, hu_min, hu_max)
-    return (vol - hu_min) / (hu_max - hu_min)
-
-def preprocess_ct_3d(vol):
-    vol = window_and_normalize(vol)
-    return np.resize(vol, (64,224,224))
+HU_WINDOW = (-150, 350)
+CT_3D_SHAPE = (64, 224, 224)
+
+def window_and_normalize(volume, hu_min=HU_WINDOW[0], hu_max=HU_WINDOW[1], out=None):
+    if out is None:
+        vol = np.clip(volume, hu_min, hu_max)
+        return (vol - hu_min) / (hu_max - hu_min)
+    # In place: no temporaries the size of the volume
+    np.clip(volume, hu_min, hu_max, out=out)
+    out -= hu_min
+    out *= 1.0 / (hu_max - hu_min)
+    return out
+
+def preprocess_ct_3d(vol, spacing=None, inplace=False):
+    vol = window_and_normalize(vol, out=vol if inplace else None)
+    return resample_volume(vol, CT_3D_SHAPE, spacing)
+
+def load_ct_volume(source) -> np.ndarray:
+    """
+    Model input for a NIfTI volume (path or NiftiVolume): HU-windowed while
+    it is converted to float32, then resampled to CT_3D_SHAPE.
+    """
+    volume = open_volume(source)
+    return resample_volume(volume.data(window=HU_WINDOW), CT_3D_SHAPE, volume.zooms)
 
 class CTNet3D(nn.Module):
     def __init__(self, num_classes=2):
@@ -50,26 +65,9 @@ class CTNet3D(nn.Module):
         x = self.conv(x)
         return self.fc(x.view(x.size(0),-1))
 
-ct_transforms_2d = transforms.Compose([
-    transforms.Resize((224,224)), transforms.ToTensor(),
-    transforms.Normalize([0.485,0.456,0.406],[0.229,0.224,0.225])
-])
-
 # Load
-def load_ct_model(mode="2d", device="cpu"):
-    if mode == "2d":
-        model = CTNet2D()
-        weights_path = CT_2D_WEIGHTS_PATH
-    elif mode == "3d":
-        model = CTNet3D()
-        weights_path = CT_3D_WEIGHTS_PATH
-    else:
-        raise ValueError("Mode must be '2d' or '3d'.")
-
-    if not os.path.exists(weights_path):
-        raise FileNotFoundError(f"CT weights not found at {weights_path}")
-
-    checkpoint = torch.load(weights_path, map_location=device, weights_only=False)
+def clean_ct_state_dict(checkpoint, mode="2d"):
+    """Strip DataParallel prefixes and, for 2D, move backbone keys under self.model."""
     raw_sd = checkpoint.get('state_dict', checkpoint)
 
     clean_sd = {}
@@ -84,36 +82,67 @@ def load_ct_model(mode="2d", device="cpu"):
         else:
             nk2 = nk
         clean_sd[nk2] = v
+    return clean_sd
 
-    model.load_state_dict(clean_sd, strict=False)
+def load_ct_model(mode="2d", device="cpu"):
+    if mode == "2d":
+        model = CTNet2D()
+        weights_path = CT_2D_WEIGHTS_PATH
+    elif mode == "3d":
+        model = CTNet3D()
+        weights_path = CT_3D_WEIGHTS_PATH
+    else:
+        raise ValueError("Mode must be '2d' or '3d'.")
+
+    if not has_weights(weights_path):
+        raise FileNotFoundError(f"CT weights not found at {weights_path}")
+
+    # Cleaned once, then memory-mapped from the converted copy on later boots
+    clean_sd = load_state_dict(weights_path, lambda ckpt: clean_ct_state_dict(ckpt, mode))
+
+    model.load_state_dict(clean_sd, strict=False, assign=True)
     model.to(device)
     model.eval()
     return model
 
 # Predict
-def predict_ct(model, image_path, mode="2d", device="cpu",
+def predict_ct_2d_batch(model, batch, device="cpu"):
+    """2D CT on an (N, 3, 224, 224) batch in one forward pass; the top (class, prob) per image, as predict_ct."""
+    classes = ["No Tumor", "Tumor"]
+    with torch.no_grad():
+        probs = torch.softmax(model(batch.to(device)), dim=1).cpu().numpy()
+    return [[(classes[int(np.argmax(row))], float(np.max(row)))] for row in probs]
+
+
+def predict_ct(model, image, mode="2d", device="cpu",
                thresh_low: float = 0.35,
                thresh_high: float = 0.65):
     """
+    `image` is a path, bytes, file-like or PIL image for 2D, and a NIfTI path
+    (or an opened NiftiVolume) for 3D.
+
     For 2D: returns list of (class, prob).
-    For 3D: applies HU windowing, predicts, then classifies:
+    For 3D: applies HU windowing, predicts (on the resampled volume, or on
+    overlapping full-resolution patches when VOLUME_PATCH_SIZE is set), then classifies:
       prob_tumor > thresh_high    => 'Tumor'
       prob_tumor < thresh_low     => 'No Tumor'
       otherwise                   => 'Indeterminate'
     """
     if mode == "2d":
-        image = Image.open(image_path).convert("RGB")
         input_tensor = ct_transforms_2d(image).unsqueeze(0).to(device)
     elif mode == "3d":
-        nifti_img = load_nifti(image_path)
-        volume = nifti_img.get_fdata()  # type: ignore
-        volume = preprocess_ct_3d(volume)
-        input_tensor = torch.from_numpy(volume).unsqueeze(0).unsqueeze(0).float().to(device)
+        patching = patch_settings()
+        if patching is None:
+            volume = load_ct_volume(image)
+            input_tensor = torch.from_numpy(volume).unsqueeze(0).unsqueeze(0).float().to(device)
     else:
         raise ValueError("Mode must be '2d' or '3d'.")
 
     with torch.no_grad():
-        output = model(input_tensor)
+        if mode == "3d" and patching is not None:
+            output = sliding_window_logits(model, open_volume(image), HU_WINDOW, device=device, **patching)[None]
+        else:
+            output = model(input_tensor)
         probs = torch.softmax(output, dim=1).squeeze().cpu().numpy()
 
     classes = ["No Tumor", "Tumor"]
@@ -0,0 +1,163 @@
+import hashlib
+import io
+import os
+import zipfile
+from contextlib import ExitStack
+from functools import partial
+import numpy as np
+import pydicom
+from .image_io import get_decode_pool
+from .volume_io import ArrayVolume
+
+
+def is_dicom(data) -> bool:
+    """DICOM Part 10 file: 128-byte preamble, then 'DICM'."""
+    return bytes(data[128:132]) == b'DICM'
+
+def is_zip(data) -> bool:
+    return bytes(data[:4]) in (b'PK\x03\x04', b'PK\x05\x06')  # an entry, or an empty archive
+
+def is_dicom_series(uploads) -> bool:
+    """True if the uploaded files are DICOM slices or a zip archive of them."""
+    return any(is_zip(data) or is_dicom(data) for data in uploads)
+
+
+def max_series_files() -> int:
+    """Most files one series upload may carry, zip members included (DICOM_MAX_FILES, default 4096)."""
+    return int(os.getenv("DICOM_MAX_FILES", "4096"))
+
+def max_slice_bytes() -> int:
+    """Largest single file in a series, zip members included (DICOM_MAX_SLICE_MB, default 64)."""
+    return int(float(os.getenv("DICOM_MAX_SLICE_MB", "64")) * 2**20)
+
+def max_volume_bytes() -> int:
+    """
+    Most bytes one volume upload may carry (VOLUME_UPLOAD_MAX_MB, default
+    1024): the uploads as sent, and again a series' files once unzipped.
+    """
+    return int(float(os.getenv("VOLUME_UPLOAD_MAX_MB", "1024")) * 2**20)
+
+
+class SeriesTooLarge(ValueError):
+    """Raised when a series upload exceeds the file count or size limits."""
+
+
+def series_files(uploads) -> list:
+    """
+    The DICOM files in `uploads`: each upload is a slice file or a zip of
+    them (folders allowed).
+
+    Raises SeriesTooLarge past max_series_files(), max_slice_bytes() or
+    max_volume_bytes(). Zip members are checked against the sizes in the
+    archives' directories, across all uploads, before any is decompressed.
+    """
+    max_files, max_slice, max_total = max_series_files(), max_slice_bytes(), max_volume_bytes()
+
+    entries, total = [], 0
+    with ExitStack() as stack:
+        for data in uploads:
+            if is_zip(data):
+                archive = stack.enter_context(zipfile.ZipFile(io.BytesIO(data)))
+                members = [(info.filename, info.file_size, partial(archive.read, info))
+                           for info in archive.infolist() if not info.is_dir()]
+            elif is_dicom(data):
+                members = [(None, len(data), lambda data=data: data)]
+            else:
+                continue
+            if len(entries) + len(members) > max_files:
+                raise SeriesTooLarge(f"At most {max_files} files per series.")
+            for name, size, _ in members:
+                if size > max_slice:
+                    raise SeriesTooLarge(f"{name or 'A slice'} is too large. "
+                                         f"Maximum size is {max_slice // 2**20}MB per file.")
+                total += size
+            if total > max_total:
+                raise SeriesTooLarge(f"Series too large. Maximum size is {max_total // 2**20}MB unzipped.")
+            entries += members
+        return [member for member in (read() for _, _, read in entries) if is_dicom(member)]
+
+def _read_header(data) -> dict:
+    """Geometry and rescaling of one slice, without touching its pixel data; None if it has no image."""
+    ds = pydicom.dcmread(io.BytesIO(data), stop_before_pixels=True)
+    if 'Rows' not in ds or 'Columns' not in ds:
+        return None  # DICOMDIR, structured reports, ...
+    if int(ds.get('NumberOfFrames', 1) or 1) > 1:
+        raise ValueError("Multi-frame DICOM files are not supported; upload the series as single-slice files.")
+
+    position = ds.get('ImagePositionPatient')
+    orientation = ds.get('ImageOrientationPatient')
+    if position is not None and orientation is not None:
+        # Distance along the slice normal, which orders slices whatever the patient orientation
+        normal = np.cross(np.asarray(orientation[:3], float), np.asarray(orientation[3:], float))
+        location = float(np.dot(normal, np.asarray(position, float)))
+    elif 'SliceLocation' in ds:
+        location = float(ds.SliceLocation)
+    else:
+        location = float(ds.get('InstanceNumber', 0) or 0)
+
+    return {
+        "series": str(ds.get('SeriesInstanceUID', '')),
+        "shape": (int(ds.Rows), int(ds.Columns)),
+        "location": location,
+        "slope": float(ds.get('RescaleSlope', 1) or 1),
+        "intercept": float(ds.get('RescaleIntercept', 0) or 0),
+        "pixel_spacing": tuple(float(v) for v in ds.get('PixelSpacing', (1.0, 1.0))),
+        "thickness": float(ds.get('SliceThickness', 0) or 0),
+        "sha256": hashlib.sha256(data).digest(),
+    }
+
+def _decode_into(data, out: np.ndarray, slope: float, intercept: float) -> None:
+    """Decode one slice's pixels straight into its plane of the volume, in HU."""
+    pixels = pydicom.dcmread(io.BytesIO(data)).pixel_array
+    if slope != 1:
+        np.multiply(pixels, np.float32(slope), out=out, casting='unsafe')
+    else:
+        np.copyto(out, pixels, casting='unsafe')
+    if intercept != 0:
+        out += np.float32(intercept)
+
+def load_dicom_series(uploads) -> ArrayVolume:
+    """
+    Assemble a DICOM series into a float32 volume with rescale
+    slope/intercept applied, i.e. HU for CT. Axes and zooms are in NIfTI
+    order (columns, rows, slices), so the 3D predictors and the mid-slice
+    previews see a series the same whether it was uploaded as DICOM or
+    NIfTI.
+
+    `uploads` are raw bytes of slice files and/or zip archives. Headers are
+    parsed first (in parallel, without pixel data) to pick the series, order
+    the slices along the slice normal and size the volume; pixel data is
+    then decoded in parallel directly into each slice's plane, so no
+    per-slice float copies or intermediate NIfTI are made. When an archive
+    holds several series, the one with the most slices is used.
+    """
+    files = series_files(uploads)
+    pool = get_decode_pool()
+    headers = [(h, data) for h, data in zip(pool.map(_read_header, files), files) if h is not None]
+    if not headers:
+        raise ValueError("No DICOM images found in the upload.")
+
+    groups = {}
+    for header, data in headers:
+        groups.setdefault((header["series"], header["shape"]), []).append((header, data))
+    slices = sorted(max(groups.values(), key=len), key=lambda item: item[0]["location"])
+
+    rows, columns = slices[0][0]["shape"]
+    volume = np.empty((len(slices), rows, columns), dtype=np.float32)
+    decodes = [
+        pool.submit(_decode_into, data, volume[i], header["slope"], header["intercept"])
+        for i, (header, data) in enumerate(slices)
+    ]
+    for decode in decodes:
+        decode.result()
+
+    gaps = np.abs(np.diff([header["location"] for header, _ in slices]))
+    gaps = gaps[gaps > 0]
+    spacing = float(np.median(gaps)) if len(gaps) else (slices[0][0]["thickness"] or 1.0)
+    row_spacing, column_spacing = slices[0][0]["pixel_spacing"]
+
+    # Same series whether it came zipped or as separate files, in any order
+    digest = hashlib.sha256(b"".join(header["sha256"] for header, _ in slices)).hexdigest()
+    # Decoded slice by slice into contiguous planes; the (x, y, z) view is
+    # Fortran-ordered, like voxels read from a NIfTI file
+    return ArrayVolume(volume.transpose(2, 1, 0), zooms=(column_spacing, row_spacing, spacing), digest=digest)
@@ -0,0 +1,51 @@
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from PIL import Image
+
+_decode_pool = None
+_decode_pool_lock = threading.Lock()
+
+
+def open_image(source, mode: str = 'RGB') -> Image.Image:
+    """
+    Decode an image from any of the sources the prediction pipeline accepts.
+
+    Args:
+        source: Filesystem path (str/Path), raw encoded bytes, a binary
+            file-like object, or an already-decoded PIL image.
+        mode: PIL mode to convert to, or None to keep the decoded mode.
+    """
+    if isinstance(source, Image.Image):
+        image = source
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        image = Image.open(io.BytesIO(source))
+    elif isinstance(source, (str, Path)):
+        image = Image.open(source)
+    elif hasattr(source, 'read'):
+        image = Image.open(source)
+    else:
+        raise TypeError(f"Unsupported image source: {type(source).__name__}")
+
+    return image if mode is None or image.mode == mode else image.convert(mode)
+
+
+def is_path(source) -> bool:
+    return isinstance(source, (str, Path))
+
+
+def get_decode_pool() -> ThreadPoolExecutor:
+    """
+    Threads shared by everything that decodes many images for one request
+    (DICOM series, batch uploads); DECODE_WORKERS, default up to 8. One pool
+    keeps concurrent requests from each starting their own. OpenCV, PIL's
+    JPEG/zlib decoders and numpy copies release the GIL, so decodes overlap.
+    """
+    global _decode_pool
+    with _decode_pool_lock:
+        if _decode_pool is None:
+            workers = int(os.getenv("DECODE_WORKERS", str(min(8, os.cpu_count() or 1))))
+            _decode_pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="decode")
+        return _decode_pool
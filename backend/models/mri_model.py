@@ -1,10 +1,13 @@
 import torch
 import torch.nn as nn
-from torchvision import models, transforms
+from torchvision import models
 from PIL import Image
 import numpy as np
-from nibabel.loadsave import load as load_nifti
 from pathlib import Path
+from .preprocessing import ImagePreprocessor
+from .sliding_window import patch_settings, sliding_window_logits
+from .volume_io import open_volume, resample_volume
+from .weight_cache import has_weights, load_state_dict
 
 # Resolve backend root (one level up from models/)
 BACKEND_ROOT = Path(__file__).resolve().parents[1]
@@ -16,12 +19,10 @@ WEIGHT_MRI_3D = BACKEND_ROOT / 'model_assests' / 'mri' / '3d' / 'resnet_200.pth'
 MRI_CLASSES_2D = ['No Tumor', 'Meningioma', 'Glioma', 'Pituitary Tumor']
 
 # 2D preprocessing
-mri_transforms = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406],
-                         [0.229, 0.224, 0.225])
-])
+mri_transforms = ImagePreprocessor((224, 224))
+
+# 3D model input (depth, height, width)
+MRI_3D_SHAPE = (64, 224, 224)
 
 # 2D model definition
 class MRINet2D(nn.Module):
@@ -49,47 +50,60 @@ class MRINet3D(nn.Module):
         return self.dec(self.enc(x))
 
 # Model loader
+def clean_mri_state_dict(ckpt):
+    sd = ckpt.get('state_dict', ckpt)
+    # Clean up key names if loaded from DataParallel
+    return {k.replace('module.', ''): v for k, v in sd.items()}
+
 def load_mri_model(mode='3d', device='cpu'):
     if mode == '2d':
-        if not WEIGHT_MRI_2D.is_file():
+        if not has_weights(WEIGHT_MRI_2D):
             raise FileNotFoundError(f"MRI 2D weights not found at {WEIGHT_MRI_2D}")
         model = MRINet2D()
-        ckpt = torch.load(str(WEIGHT_MRI_2D), map_location=device, weights_only=False)
-        sd = ckpt.get('state_dict', ckpt)
+        weights_path = WEIGHT_MRI_2D
 
     elif mode == '3d':
-        if not WEIGHT_MRI_3D.is_file():
+        if not has_weights(WEIGHT_MRI_3D):
             raise FileNotFoundError(f"MRI 3D weights not found at {WEIGHT_MRI_3D}")
         model = MRINet3D()
-        ckpt = torch.load(str(WEIGHT_MRI_3D), map_location=device, weights_only=False)
-        sd = ckpt.get('state_dict', ckpt)
+        weights_path = WEIGHT_MRI_3D
 
     else:
         raise ValueError("Mode must be '2d' or '3d'")
 
-    # Clean up key names if loaded from DataParallel
-    clean_sd = {k.replace('module.', ''): v for k, v in sd.items()}
-    model.load_state_dict(clean_sd, strict=False)
+    # Cleaned once, then memory-mapped from the converted copy on later boots
+    clean_sd = load_state_dict(weights_path, clean_mri_state_dict)
+    model.load_state_dict(clean_sd, strict=False, assign=True)
     return model.to(device).eval()
 
 # Prediction helper
 def predict_mri(model, path, mode='3d', device='cpu', top_k=2):
+    """
+    `path` is a path, bytes, file-like or PIL image for 2D, and a NIfTI path
+    (or an opened NiftiVolume) for 3D. 3D volumes are resampled to the model
+    input, or run as overlapping full-resolution patches when
+    VOLUME_PATCH_SIZE is set.
+    """
     if mode == '2d':
-        img = Image.open(path).convert('RGB')
-        inp = mri_transforms(img).unsqueeze(0).to(device)
+        inp = mri_transforms(path).unsqueeze(0).to(device)
         with torch.no_grad():
             outputs = model(inp)
             probs = torch.softmax(outputs, dim=1).cpu().numpy()[0]
 
     else:
-        volume = load_nifti(path).get_fdata() #type: ignore
-        # normalize & resize
-        vol = (volume - volume.min()) / (volume.max() - volume.min())
-        vol_resized = np.resize(vol, (64, 224, 224))
-        inp = torch.from_numpy(vol_resized).unsqueeze(0).unsqueeze(0).float().to(device)
-        with torch.no_grad():
-            logits = model(inp).mean(dim=[2, 3, 4])
-            probs = torch.softmax(logits, dim=1).cpu().numpy()[0]
+        # min-max normalized (over the whole volume) while converting to float32
+        volume = open_volume(path)
+        patching = patch_settings()
+        if patching is not None:
+            logits = sliding_window_logits(model, volume, volume.intensity_range(), device=device, **patching)
+            probs = torch.softmax(logits, dim=0).numpy()
+        else:
+            vol = volume.data(window=volume.intensity_range())
+            vol_resized = resample_volume(vol, MRI_3D_SHAPE, volume.zooms)
+            inp = torch.from_numpy(vol_resized).unsqueeze(0).unsqueeze(0).float().to(device)
+            with torch.no_grad():
+                logits = model(inp).mean(dim=[2, 3, 4])
+                probs = torch.softmax(logits, dim=1).cpu().numpy()[0]
 
     preds = [(MRI_CLASSES_2D[i], float(probs[i])) for i in range(len(probs))]
     return sorted(preds, key=lambda x: x[1], reverse=True)[:top_k]
@@ -0,0 +1,158 @@
+import io
+from pathlib import Path
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+from .image_io import open_image
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+def _encoded_bytes(source):
+    """Raw encoded bytes for paths, bytes and file-likes; None for anything else."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return source
+    if isinstance(source, (str, Path)):
+        with open(source, 'rb') as f:
+            return f.read()
+    if hasattr(source, 'read') and not isinstance(source, Image.Image):
+        return source.read()
+    return None
+
+def _is_gray_alpha_png(data) -> bool:
+    # IHDR: bit depth at byte 24, colour type at byte 25 (4 = grayscale + alpha)
+    return bytes(data[:8]) == b'\x89PNG\r\n\x1a\n' and len(data) > 25 and data[24] == 8 and data[25] == 4
+
+def is_jpeg(data) -> bool:
+    return bytes(data[:3]) == b'\xff\xd8\xff'
+
+def draft_jpeg(data, min_size):
+    """
+    Decode a JPEG at the smallest DCT scale (1/2, 1/4 or 1/8) that still
+    covers `min_size` (height, width), so the full-resolution image is never
+    materialized. Returns (PIL image in L or RGB, reduction factor), or None
+    when the JPEG is not at least twice `min_size` and no scale applies.
+    """
+    image = Image.open(io.BytesIO(data))
+    width, height = image.size
+    if width < 2 * min_size[1] or height < 2 * min_size[0]:
+        return None
+    # draft() picks the largest scale whose result is still >= the requested size
+    image.draft('L' if image.mode == 'L' else 'RGB', (min_size[1], min_size[0]))
+    if image.mode not in ('L', 'RGB'):
+        image = image.convert('RGB')
+    image.load()
+    return image, width / image.size[0]
+
+def _decode(source, min_size=None):
+    """
+    Decode to uint8 pixels, as (array, is_bgr). Large JPEGs are decoded at a
+    reduced scale when `min_size` says how much resolution is needed. PNG has
+    no scaled decoding, so it is decoded in full, but in its own channel count.
+    OpenCV decodes straight into a numpy array; PIL (other formats, 16-bit
+    images, PIL inputs) needs an extra copy out of the image, so it is the fallback.
+    """
+    if isinstance(source, np.ndarray):
+        return source, False
+    data = _encoded_bytes(source)
+    if data is not None:
+        if min_size is not None and is_jpeg(data):
+            drafted = draft_jpeg(data, min_size)
+            if drafted is not None:
+                return np.asarray(drafted[0]), False
+        # OpenCV expands gray+alpha PNGs to BGRA; ask for grayscale so they stay one channel
+        flags = cv2.IMREAD_GRAYSCALE if _is_gray_alpha_png(data) else cv2.IMREAD_UNCHANGED
+        pixels = cv2.imdecode(np.frombuffer(data, np.uint8), flags)
+        if pixels is not None and pixels.dtype == np.uint8:
+            if pixels.ndim == 3 and pixels.shape[2] == 4:
+                pixels = pixels[:, :, :3]  # drop alpha, as PIL's RGBA -> RGB does
+            return pixels, pixels.ndim == 3
+        source = data
+
+    image = open_image(source, mode=None)
+    if image.mode == 'LA':
+        image = image.convert('L')  # what RGB conversion would replicate into each channel
+    elif image.mode not in ('L', 'RGB'):
+        image = image.convert('RGB')
+    return np.asarray(image), False
+
+def _to_rgb(pixels: np.ndarray, is_bgr: bool) -> np.ndarray:
+    return cv2.cvtColor(pixels, cv2.COLOR_BGR2RGB) if is_bgr else pixels
+
+def decode_pixels(source, min_size=None) -> np.ndarray:
+    """
+    Decode `source` (path, bytes, file-like, PIL image or uint8 array) to a
+    uint8 array: HxW for grayscale images, HxWx3 RGB otherwise. With
+    `min_size` (height, width), large JPEGs come back reduced but no smaller.
+
+    Grayscale stays single-channel so it is resized once instead of three
+    times; the channels are broadcast when the tensor is written.
+    """
+    return _to_rgb(*_decode(source, min_size))
+
+def resize_pixels(pixels: np.ndarray, size) -> np.ndarray:
+    """
+    Antialiased resize to `size` (height, width). Large shrinks go through an
+    integer-factor area reduction first (OpenCV's fast path), then bilinear
+    for the remaining < 2x, which is what PIL does with reducing_gap.
+    """
+    height, width = size
+    if pixels.shape[:2] == (height, width):
+        return pixels
+    factor = min(pixels.shape[0] // height, pixels.shape[1] // width)
+    if factor >= 2:
+        # fx/fy (not a target size) keep the scale an exact integer for the fast path
+        pixels = cv2.resize(pixels, None, fx=1.0 / factor, fy=1.0 / factor, interpolation=cv2.INTER_AREA)
+        return cv2.resize(pixels, (width, height), interpolation=cv2.INTER_LINEAR)
+    shrinking = pixels.shape[0] > height or pixels.shape[1] > width
+    return cv2.resize(pixels, (width, height), interpolation=cv2.INTER_AREA if shrinking else cv2.INTER_LINEAR)
+
+
+class ImagePreprocessor:
+    """
+    Resize + ToTensor + Normalize in one pass over uint8 pixels.
+
+    Calling the preprocessor returns a new (3, H, W) float32 tensor, like the
+    torchvision Compose it replaces. For batches, `prepare` (decode + resize,
+    uint8) and `batch` (normalize into a reusable buffer) split the work so
+    only the cheap fused step touches float32 memory.
+    """
+
+    def __init__(self, size=(224, 224), mean=IMAGENET_MEAN, std=IMAGENET_STD):
+        self.size = tuple(size)  # (height, width)
+        # (x / 255 - mean) / std  ==  x * scale - shift
+        self.scale = torch.tensor([1.0 / (255.0 * s) for s in std], dtype=torch.float32).view(3, 1, 1)
+        self.shift = torch.tensor([m / s for m, s in zip(mean, std)], dtype=torch.float32).view(3, 1, 1)
+
+    def prepare(self, source) -> np.ndarray:
+        """Decoded and resized uint8 pixels (HxW or HxWx3 RGB)."""
+        # Decode no larger than needed for the model's input size
+        pixels, is_bgr = _decode(source, min_size=self.size)
+        # Channel order does not matter to the resize, so swap on the small image
+        return _to_rgb(resize_pixels(pixels, self.size), is_bgr)
+
+    def normalize_into(self, pixels: np.ndarray, out: torch.Tensor) -> torch.Tensor:
+        """Write prepared pixels into `out` (3, H, W float32) as a normalized tensor."""
+        # PIL-backed arrays are read-only; torch only reads them, but warns
+        source = torch.from_numpy(pixels if pixels.flags.writeable else pixels.copy())
+        source = source.unsqueeze(0).expand(3, -1, -1) if source.dim() == 2 else source.permute(2, 0, 1)
+        out.copy_(source)  # uint8 -> float32 and HWC -> CHW in one copy
+        return out.mul_(self.scale).sub_(self.shift)
+
+    def batch(self, prepared, out: torch.Tensor = None) -> torch.Tensor:
+        """
+        Normalize prepared images into slots of `out` (N, 3, H, W), allocated
+        if missing or too small, and return the filled slots.
+        """
+        n = len(prepared)
+        if out is None or out.shape[0] < n or tuple(out.shape[2:]) != self.size:
+            out = torch.empty((n, 3, *self.size), dtype=torch.float32)
+        for slot, pixels in zip(out, prepared):
+            self.normalize_into(pixels, slot)
+        return out[:n]
+
+    def __call__(self, source) -> torch.Tensor:
+        out = torch.empty((3, *self.size), dtype=torch.float32)
+        return self.normalize_into(self.prepare(source), out)
@@ -0,0 +1,102 @@
+import copy
+import os
+import warnings
+from pathlib import Path
+import torch
+import torch.nn as nn
+from .weight_cache import record_read
+
+# How each 2D model is quantized: the conv nets statically with FX graph
+# mode (needs calibration), the Linear-heavy ViT dynamically (no calibration).
+QUANTIZATION_MODES = {
+    'xray': 'static',
+    'ct2d': 'static',
+    'mri2d': 'static',
+    'ultrasound': 'dynamic',
+}
+
+EXAMPLE_SHAPE = (1, 3, 224, 224)
+
+
+def quantization_enabled(name: str) -> bool:
+    """QUANTIZE is a comma-separated list of model names, or 'all'."""
+    if name not in QUANTIZATION_MODES:
+        return False
+    raw = os.getenv("QUANTIZE", "").strip().lower()
+    if raw in ("all", "1", "true", "yes"):
+        return True
+    return name in [n.strip() for n in raw.split(",") if n.strip()]
+
+def quantized_path(weights_path) -> Path:
+    """Calibrated INT8 state dict, stored next to the fp32 checkpoint."""
+    weights_path = Path(weights_path)
+    return weights_path.with_name(f"{weights_path.name}.int8.pt")
+
+def quantization_variant(name: str, weights_path=None) -> str:
+    """'int8' when `name` will be served quantized, else 'fp32'."""
+    if not quantization_enabled(name):
+        return 'fp32'
+    if QUANTIZATION_MODES[name] == 'static' and (weights_path is None or not quantized_path(weights_path).is_file()):
+        return 'fp32'
+    return 'int8'
+
+
+def _qconfig_mapping():
+    from torch.ao.quantization import get_default_qconfig_mapping
+    return get_default_qconfig_mapping(torch.backends.quantized.engine)
+
+def quantize_dynamic(model: nn.Module) -> nn.Module:
+    """INT8 weights for every nn.Linear; activations are quantized on the fly."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        return torch.ao.quantization.quantize_dynamic(copy.deepcopy(model).eval(), {nn.Linear}, dtype=torch.qint8)
+
+def prepare_static(model: nn.Module, example_shape=EXAMPLE_SHAPE) -> nn.Module:
+    """Insert observers with FX graph mode; run calibration batches through the result."""
+    from torch.ao.quantization.quantize_fx import prepare_fx
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return prepare_fx(copy.deepcopy(model).eval(), _qconfig_mapping(), (torch.zeros(*example_shape),))
+
+def convert_static(prepared: nn.Module) -> nn.Module:
+    from torch.ao.quantization.quantize_fx import convert_fx
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return convert_fx(prepared)
+
+def calibrate_static(model: nn.Module, batches, example_shape=EXAMPLE_SHAPE) -> nn.Module:
+    """Quantize `model` statically, using `batches` (input tensors) for the activation ranges."""
+    prepared = prepare_static(model, example_shape)
+    with torch.no_grad():
+        for batch in batches:
+            prepared(batch)
+    return convert_static(prepared)
+
+def load_static(model: nn.Module, state_path, example_shape=EXAMPLE_SHAPE) -> nn.Module:
+    """
+    Rebuild the quantized graph for `model` and load calibrated parameters
+    (weights, scales and zero points) saved by the calibration command.
+    """
+    quantized = convert_static(prepare_static(model, example_shape))
+    record_read(state_path)
+    quantized.load_state_dict(torch.load(str(state_path), map_location='cpu', weights_only=False))
+    return quantized.eval()
+
+
+def maybe_quantize(name: str, model: nn.Module, weights_path=None) -> nn.Module:
+    """
+    Return the INT8 version of `model` if QUANTIZE asks for it, else `model`.
+
+    Static quantization needs a calibrated state dict from
+    quantize_models.py; without one the fp32 model is served.
+    """
+    if not quantization_enabled(name):
+        return model
+    if QUANTIZATION_MODES[name] == 'dynamic':
+        return quantize_dynamic(model)
+
+    state_path = quantized_path(weights_path) if weights_path is not None else None
+    if state_path is None or not state_path.is_file():
+        print(f"Warning: no calibrated INT8 weights for '{name}' (run quantize_models.py); serving fp32")
+        return model
+    return load_static(model, state_path)
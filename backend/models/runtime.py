@@ -0,0 +1,187 @@
+import os
+import threading
+import warnings
+from pathlib import Path
+import torch
+import torch.nn as nn
+from .quantization import maybe_quantize, quantization_variant
+from .weight_cache import record_read
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+# Execution backends the services can serve a model with. 'torchscript' and
+# 'onnxruntime' need an artifact from export_models.py; 'inductor' compiles
+# the eager model in-process (on its first forward pass, i.e. at warm-up).
+BACKENDS = ('eager', 'torchscript', 'inductor', 'onnxruntime')
+EXPORTED_SUFFIXES = {'torchscript': '.ts', 'onnxruntime': '.onnx'}
+
+# Input the exporters trace with; the batch dimension stays dynamic
+EXAMPLE_SHAPES = {
+    'xray': (1, 3, 224, 224),
+    'ct2d': (1, 3, 224, 224),
+    'ct3d': (1, 1, 64, 224, 224),
+    'mri2d': (1, 3, 224, 224),
+    'mri3d': (1, 1, 64, 224, 224),
+    'ultrasound': (1, 3, 224, 224),
+}
+
+ONNX_OPSET = 17
+
+
+def requested_backend(name: str) -> str:
+    """
+    Backend asked for by INFERENCE_BACKEND: a default backend and/or
+    per-model overrides, e.g. 'onnxruntime' or 'torchscript,ct3d=eager'.
+    """
+    raw = os.getenv("INFERENCE_BACKEND", "").strip().lower()
+    backend = 'eager'
+    for part in (p.strip() for p in raw.split(",")):
+        if not part:
+            continue
+        if "=" in part:
+            key, value = (s.strip() for s in part.split("=", 1))
+            if key == name:
+                return value
+        else:
+            backend = part
+    return backend
+
+def exported_path(weights_path, backend: str) -> Path:
+    """Exported artifact for `backend`, stored next to the fp32 checkpoint."""
+    weights_path = Path(weights_path)
+    return weights_path.with_name(f"{weights_path.name}{EXPORTED_SUFFIXES[backend]}")
+
+def _unavailable(backend: str, weights_path) -> str:
+    """Why `backend` cannot serve this model, or '' if it can."""
+    if backend not in BACKENDS:
+        return f"unknown backend '{backend}' (choose from {', '.join(BACKENDS)})"
+    if backend == 'onnxruntime' and ort is None:
+        return "onnxruntime is not installed"
+    if backend in EXPORTED_SUFFIXES:
+        if weights_path is None:
+            return "no weights path to find the exported model by"
+        artifact = exported_path(weights_path, backend)
+        if not artifact.is_file():
+            return f"{artifact.name} not found (run export_models.py)"
+        source = Path(weights_path)
+        if source.is_file() and source.stat().st_mtime > artifact.stat().st_mtime:
+            return f"{artifact.name} is older than the weights (re-run export_models.py)"
+    return ''
+
+def serving_backend(name: str, weights_path=None, device: str = 'cpu') -> str:
+    """The backend `name` is actually served with: the requested one, or eager if it is unavailable."""
+    backend = requested_backend(name)
+    if backend == 'eager' or device != 'cpu' or _unavailable(backend, weights_path):
+        return 'eager'
+    return backend
+
+def serving_variant(name: str, weights_path=None) -> str:
+    """Prediction-cache variant: the backend, or the eager precision ('fp32'/'int8')."""
+    backend = serving_backend(name, weights_path)
+    return quantization_variant(name, weights_path) if backend == 'eager' else backend
+
+
+class ExportedModel(nn.Module):
+    """
+    Module front for a model run outside eager PyTorch, so the services and
+    the registry (warm-up, .to()/.eval(), memory accounting) handle it like
+    the eager one. `weight_bytes` stands in for the parameters it hides.
+    """
+
+    def __init__(self, run, backend: str, weight_bytes: int):
+        super().__init__()
+        self._run = run
+        self.backend = backend
+        self.weight_bytes = weight_bytes
+
+    def forward(self, x):
+        return self._run(x)
+
+
+def export_torchscript(model: nn.Module, example: torch.Tensor, path) -> Path:
+    # torch.jit is deprecated upstream but still the lightest eager-free runtime here
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        traced = torch.jit.trace(model.eval(), example)
+        torch.jit.save(traced, str(path))
+    return Path(path)
+
+def export_onnx(model: nn.Module, example: torch.Tensor, path, opset: int = ONNX_OPSET) -> Path:
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        torch.onnx.export(
+            model.eval(), (example,), str(path),
+            input_names=["input"], output_names=["output"],
+            dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}},
+            opset_version=opset, dynamo=False,
+        )
+    return Path(path)
+
+def load_torchscript(path) -> ExportedModel:
+    record_read(path)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        module = torch.jit.load(str(path), map_location='cpu').eval()
+        # Freezing inlines the weights and folds conv/batch-norm for CPU inference
+        module = torch.jit.optimize_for_inference(torch.jit.freeze(module))
+    return ExportedModel(module, 'torchscript', os.path.getsize(path))
+
+def load_onnxruntime(path) -> ExportedModel:
+    """
+    The session is created on the first forward pass rather than here, so a
+    prefork parent never starts onnxruntime's thread pool before forking.
+    """
+    if ort is None:
+        raise RuntimeError("onnxruntime is not installed")
+    record_read(path)
+    state = {}
+    lock = threading.Lock()
+
+    def session():
+        with lock:
+            if "session" not in state:
+                options = ort.SessionOptions()
+                options.intra_op_num_threads = torch.get_num_threads()
+                state["session"] = ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+                state["input"] = state["session"].get_inputs()[0].name
+            return state["session"], state["input"]
+
+    def run(x):
+        sess, input_name = session()
+        feed = {input_name: x.detach().cpu().contiguous().numpy()}
+        return torch.from_numpy(sess.run(None, feed)[0])
+
+    return ExportedModel(run, 'onnxruntime', os.path.getsize(path))
+
+def compile_inductor(model: nn.Module) -> nn.Module:
+    return torch.compile(model.eval(), backend="inductor")
+
+
+def load_for_serving(name: str, load_eager, weights_path=None, device: str = 'cpu'):
+    """
+    Build `name` for the backend INFERENCE_BACKEND selects. `load_eager()`
+    returns the eager model and is skipped when an exported artifact is used.
+
+    Unavailable backends (no artifact, stale artifact, onnxruntime missing)
+    fall back to eager with a warning. Non-eager backends and opt-in INT8
+    (QUANTIZE) apply on CPU only; INT8 applies to the eager backend.
+    """
+    backend = requested_backend(name)
+    if device != 'cpu':
+        return load_eager()
+    if backend != 'eager':
+        problem = _unavailable(backend, weights_path)
+        if problem:
+            print(f"Warning: cannot serve '{name}' with {backend}: {problem}; serving eager")
+            backend = 'eager'
+
+    if backend == 'torchscript':
+        return load_torchscript(exported_path(weights_path, backend))
+    if backend == 'onnxruntime':
+        return load_onnxruntime(exported_path(weights_path, backend))
+    if backend == 'inductor':
+        return compile_inductor(load_eager())
+    return maybe_quantize(name, load_eager(), weights_path)
@@ -0,0 +1,120 @@
+import itertools
+import os
+import numpy as np
+import torch
+import torch.nn.functional as F
+from .volume_io import resample_variant
+
+DEFAULT_PATCH_OVERLAP = 0.25
+DEFAULT_PATCH_BATCH = 2
+GAUSSIAN_SIGMA_SCALE = 1.0 / 8  # sigma as a fraction of the patch side
+
+
+def patch_settings():
+    """
+    Sliding-window settings from the environment, or None when 3D volumes
+    are resampled to the model input as a whole (the default).
+
+        VOLUME_PATCH_SIZE     patch shape in voxels, e.g. '64,224,224'; enables patching
+        VOLUME_PATCH_OVERLAP  fraction of a patch shared with its neighbour (default 0.25)
+        VOLUME_PATCH_BATCH    patches run at once, which bounds memory (default 2)
+    """
+    raw = os.getenv("VOLUME_PATCH_SIZE", "").strip()
+    if not raw or raw == "0":
+        return None
+    patch_size = tuple(int(v) for v in raw.split(","))
+    if len(patch_size) == 1:
+        patch_size *= 3
+    overlap = float(os.getenv("VOLUME_PATCH_OVERLAP", str(DEFAULT_PATCH_OVERLAP)))
+    batch_size = int(os.getenv("VOLUME_PATCH_BATCH", str(DEFAULT_PATCH_BATCH)))
+    if len(patch_size) != 3 or min(patch_size) < 1 or not 0 <= overlap < 1 or batch_size < 1:
+        raise ValueError(
+            f"Invalid sliding-window settings: VOLUME_PATCH_SIZE='{raw}', "
+            f"VOLUME_PATCH_OVERLAP={overlap}, VOLUME_PATCH_BATCH={batch_size}"
+        )
+    return {"patch_size": patch_size, "overlap": overlap, "batch_size": batch_size}
+
+def volume_variant() -> str:
+    """Prediction-cache tag for how a 3D volume becomes model input."""
+    settings = patch_settings()
+    if settings is None:
+        return resample_variant()
+    # The batch size changes memory use, not the result
+    return f"patch={'x'.join(map(str, settings['patch_size']))},overlap={settings['overlap']:g}"
+
+
+def patch_starts(length: int, patch: int, overlap: float) -> list:
+    """Patch offsets along one axis: evenly spaced, the last one flush with the end."""
+    if length <= patch:
+        return [0]
+    step = max(1, int(patch * (1 - overlap)))
+    count = -(-(length - patch) // step) + 1
+    return [int(round(i * (length - patch) / (count - 1))) for i in range(count)]
+
+def _gaussian(patch: int) -> np.ndarray:
+    centre = (patch - 1) / 2
+    sigma = max(patch * GAUSSIAN_SIGMA_SCALE, 1e-6)
+    g = np.exp(-0.5 * ((np.arange(patch) - centre) / sigma) ** 2)
+    return np.maximum(g / g.max(), 1e-3)  # edge voxels keep some weight where only one patch covers them
+
+def blend_weights(length: int, patch: int, starts) -> list:
+    """
+    Per-patch voxel weights along one axis: the patch's Gaussian divided by
+    the sum of every patch's Gaussian at that voxel, so the weights of all
+    patches covering a voxel add up to 1. Patch positions form a grid, so
+    the 3D weights are the product of the per-axis ones; no accumulator the
+    size of the volume is needed.
+    """
+    g = _gaussian(patch)
+    total = np.zeros(length)
+    for start in starts:
+        total[start:start + patch] += g
+    return [g / total[start:start + patch] for start in starts]
+
+
+def sliding_window_logits(model, volume, window=None, patch_size=(64, 224, 224),
+                          overlap: float = DEFAULT_PATCH_OVERLAP, batch_size: int = DEFAULT_PATCH_BATCH,
+                          device: str = 'cpu') -> torch.Tensor:
+    """
+    Run `model` over overlapping patches of a Volume at its own resolution
+    and return the logits averaged over the volume, shape (C,).
+
+    Patches are read (from the memory-mapped file, for NIfTI) one batch at a time and
+    windowed on the way in, so memory is bounded by `batch_size` patches.
+    Along axes shorter than `patch_size` the patch shrinks to the volume
+    rather than being padded (ONNX models exported for a fixed input shape
+    therefore need volumes at least that large). Outputs are blended
+    with Gaussian weights: per-patch class logits (N, C) count for the
+    voxels they were computed from, dense logits (N, C, D, H, W) voxel by
+    voxel, the way the whole-volume path takes their spatial mean.
+    """
+    shape = volume.shape[:3]
+    patch_size = tuple(min(p, n) for p, n in zip(patch_size, shape))
+    starts = [patch_starts(n, p, overlap) for n, p in zip(shape, patch_size)]
+    weights = [dict(zip(s, blend_weights(n, p, s))) for n, p, s in zip(shape, patch_size, starts)]
+    buffer = torch.empty((batch_size, 1, *patch_size), dtype=torch.float32)
+
+    total = None
+    grid = list(itertools.product(*starts))
+    for first in range(0, len(grid), batch_size):
+        corners = grid[first:first + batch_size]
+        for slot, corner in zip(buffer, corners):
+            index = tuple(slice(c, c + p) for c, p in zip(corner, patch_size))
+            volume.region(index, window, out=slot[0].numpy())
+
+        with torch.no_grad():
+            output = model(buffer[:len(corners)].to(device)).float().cpu()
+        for logits, corner in zip(output, corners):
+            wz, wy, wx = (torch.from_numpy(w[c]).float() for w, c in zip(weights, corner))
+            if logits.dim() == 1:
+                # One prediction for the patch: weighted by its share of the voxels
+                contribution = logits * (wz.sum() * wy.sum() * wx.sum())
+            else:
+                weight = wz[:, None, None] * wy[None, :, None] * wx[None, None, :]
+                if tuple(logits.shape[1:]) != patch_size:
+                    # Output on another grid than the input: move the weights onto it, keeping their sum
+                    resized = F.interpolate(weight[None, None], size=tuple(logits.shape[1:]), mode='trilinear')[0, 0]
+                    weight = resized * (weight.sum() / resized.sum().clamp_min(1e-12))
+                contribution = (logits * weight).sum(dim=(1, 2, 3))
+            total = contribution if total is None else total + contribution
+    return total / float(np.prod(shape))
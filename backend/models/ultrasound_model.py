@@ -1,10 +1,11 @@
 import torch
 import torch.nn as nn
 from timm import create_model
-from torchvision import transforms
 from PIL import Image
 import os
 from pathlib import Path
+from .preprocessing import ImagePreprocessor
+from .weight_cache import has_weights, load_state_dict
 
 # Resolve project root and checkpoint path
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
@@ -15,13 +16,14 @@ NUM_CLASSES = len(CLASS_NAMES)
 class USFMUltrasoundClassifier(nn.Module):
     def __init__(self, checkpoint_path: Path = DEFAULT_ULTRASOUND_CHECKPOINT, device: str = 'cpu'):
         super().__init__()
-        if not checkpoint_path.is_file():
+        if not has_weights(checkpoint_path):
             raise FileNotFoundError(f"Ultrasound weights not found at {checkpoint_path}")
         self.backbone = create_model(
             'vit_base_patch16_224', pretrained=False, num_classes=0, global_pool=''
         )
-        ckpt = torch.load(str(checkpoint_path), map_location='cpu', weights_only=False)
-        self.backbone.load_state_dict(ckpt, strict=False)
+        # Memory-mapped from the converted copy after the first load
+        ckpt = load_state_dict(checkpoint_path, lambda ckpt: ckpt)
+        self.backbone.load_state_dict(ckpt, strict=False, assign=True)
         embed_dim = self.backbone.embed_dim
         self.head = nn.Sequential(
             nn.LayerNorm(embed_dim),
@@ -36,18 +38,20 @@ class USFMUltrasoundClassifier(nn.Module):
         cls = feats['cls'] if isinstance(feats, dict) else feats[:, 0]
         return self.head(cls)
 
-ultrasound_transforms = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-])
+ultrasound_transforms = ImagePreprocessor((224, 224))
 
 def load_ultrasound_model(device: str = 'cpu', checkpoint_path: Path = DEFAULT_ULTRASOUND_CHECKPOINT):
     return USFMUltrasoundClassifier(checkpoint_path=checkpoint_path, device=device)
 
-def predict_ultrasound(model, image_path: str, device: str = 'cpu', top_k: int = 2):
-    img = Image.open(image_path).convert('RGB')
-    tensor = ultrasound_transforms(img).unsqueeze(0).to(device)
-    with torch.no_grad(): probs = model(tensor)[0].cpu().numpy()
-    preds = [(CLASS_NAMES[i], float(probs[i])) for i in range(NUM_CLASSES)]
-    return sorted(preds, key=lambda x: x[1], reverse=True)[:top_k]
\ No newline at end of file
+def predict_ultrasound_batch(model, batch, device: str = 'cpu', top_k: int = 2):
+    """One forward pass over an (N, 3, 224, 224) batch; one sorted top-k list per image."""
+    with torch.no_grad(): probs = model(batch.to(device)).cpu().numpy()
+    results = []
+    for row in probs:
+        preds = [(CLASS_NAMES[i], float(row[i])) for i in range(NUM_CLASSES)]
+        results.append(sorted(preds, key=lambda x: x[1], reverse=True)[:top_k])
+    return results
+
+def predict_ultrasound(model, image, device: str = 'cpu', top_k: int = 2):
+    tensor = ultrasound_transforms(image).unsqueeze(0)
+    return predict_ultrasound_batch(model, tensor, device=device, top_k=top_k)[0]
\ No newline at end of file
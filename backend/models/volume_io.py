@@ -0,0 +1,220 @@
+import os
+import numpy as np
+import torch
+import torch.nn.functional as F
+from nibabel.loadsave import load as load_nifti
+
+
+class Volume:
+    """
+    Voxels shared by everything that reads a study (the 3D model input and
+    the rendered mid-slices), kept in their stored dtype and converted to
+    float32 with `slope`/`inter` applied only when read.
+
+    Subclasses provide `raw()`, `shape`, `zooms`, `slope` and `inter`.
+    """
+
+    chunk_slices = 32
+    slope = 1.0
+    inter = 0.0
+
+    def raw(self) -> np.ndarray:
+        raise NotImplementedError
+
+    def _scaled(self, raw: np.ndarray, out: np.ndarray = None, slope=None, inter=None) -> np.ndarray:
+        """raw * slope + inter in float32; the volume's own scaling by default."""
+        slope = self.slope if slope is None else slope
+        inter = self.inter if inter is None else inter
+        if out is None:
+            out = np.empty(raw.shape, dtype=np.float32)
+        if slope != 1:
+            np.multiply(raw, np.float32(slope), out=out, casting='unsafe')
+        else:
+            np.copyto(out, raw, casting='unsafe')
+        if inter != 0:
+            out += np.float32(inter)
+        return out
+
+    def intensity_range(self) -> tuple:
+        """(min, max) of the scaled voxels, computed on the stored dtype."""
+        raw = self.raw()
+        ends = [float(v) * self.slope + self.inter for v in (raw.min(), raw.max())]
+        return min(ends), max(ends)
+
+    def data(self, window=None) -> np.ndarray:
+        """
+        The whole volume as a new float32 array, which the caller owns (and
+        may modify in place). Converted `chunk_slices` planes at a time along
+        the axis that is outermost in memory (the last one for NIfTI, whose
+        voxels are Fortran-ordered), so each chunk is one contiguous run of
+        the file; the result keeps the stored memory order.
+
+        With `window` (lo, hi), values are mapped from [lo, hi] to [0, 1] and
+        clipped in the same pass: scaling and windowing fold into one
+        multiply-add per voxel.
+        """
+        raw = self.raw()
+        out = np.empty_like(raw, dtype=np.float32)  # same memory order as raw
+        axis = int(np.argmax(raw.strides))
+        selector = [slice(None)] * raw.ndim
+        for start in range(0, raw.shape[axis], self.chunk_slices):
+            selector[axis] = slice(start, start + self.chunk_slices)
+            self.region(tuple(selector), window, out=out[tuple(selector)])
+        return out
+
+    def region(self, index, window=None, out: np.ndarray = None) -> np.ndarray:
+        """
+        Voxels `raw()[index]` as float32, read straight from storage and
+        windowed like `data`; written into `out` when given.
+        """
+        slope, inter = float(self.slope), float(self.inter)
+        if window is not None:
+            lo, hi = window
+            scale = 1.0 / (hi - lo) if hi > lo else 0.0
+            slope, inter = slope * scale, (inter - lo) * scale
+        out = self._scaled(self.raw()[index], out, slope, inter)
+        if window is not None:
+            np.clip(out, 0.0, 1.0, out=out)
+        return out
+
+    def slice(self, axis: int, index: int) -> np.ndarray:
+        """One plane as float32, reading only that plane."""
+        selector = [slice(None)] * len(self.shape)
+        selector[axis] = index
+        return self._scaled(self.raw()[tuple(selector)])
+
+    def mid_slices(self) -> dict:
+        """The central plane along each of the first three axes."""
+        z, y, x = [d // 2 for d in self.shape[:3]]
+        return {
+            "axial": self.slice(0, z),
+            "coronal": self.slice(1, y),
+            "sagittal": self.slice(2, x),
+        }
+
+
+class NiftiVolume(Volume):
+    """
+    One opened NIfTI file.
+
+    The header is parsed once and the voxels stay on disk until asked for:
+    uncompressed .nii files are memory-mapped, so `slice` reads just the
+    pages of one plane and `data` streams through the file in chunks.
+    Compressed .nii.gz files cannot be mapped; their raw voxels are
+    decompressed once, in the file's own dtype, and kept on the object.
+
+    Voxels are returned as float32 with the header's scaling applied, never
+    as nibabel's float64 `get_fdata()` copy. The object is os.PathLike, so
+    code that reopens the file can take it in place of the path; `digest`,
+    when the upload was already hashed, spares the prediction cache from
+    hashing the file again.
+    """
+
+    def __init__(self, path, chunk_slices: int = 32, digest: str = None):
+        self.path = os.fspath(path)
+        self.chunk_slices = chunk_slices
+        self.digest = digest
+        self.image = load_nifti(self.path, mmap=True)
+        self.shape = self.image.shape
+        self.slope, self.inter = float(self.image.dataobj.slope), float(self.image.dataobj.inter)
+        self._raw = None
+
+    def __fspath__(self) -> str:
+        return self.path
+
+    @property
+    def zooms(self) -> tuple:
+        """Voxel spacing of the three spatial axes, in mm."""
+        return tuple(float(z) for z in self.image.header.get_zooms()[:3])
+
+    def raw(self) -> np.ndarray:
+        """Unscaled voxels in the file's dtype; a memmap for uncompressed files."""
+        if self._raw is None:
+            self._raw = self.image.dataobj.get_unscaled()
+        return self._raw
+
+
+class ArrayVolume(Volume):
+    """
+    A volume already in memory, e.g. a DICOM series assembled slice by
+    slice. `digest` is the content hash of the upload it came from, which
+    stands in for a file to hash in the prediction cache.
+    """
+
+    def __init__(self, voxels: np.ndarray, zooms=(1.0, 1.0, 1.0), digest: str = None):
+        self._voxels = voxels
+        self.shape = voxels.shape
+        self.zooms = tuple(float(z) for z in zooms)
+        self.digest = digest
+
+    def raw(self) -> np.ndarray:
+        return self._voxels
+
+
+def target_spacing():
+    """
+    Voxel spacing (mm per voxel along the three array axes) volumes are
+    resampled to before they are fitted to the model input, from
+    VOLUME_SPACING, e.g. '3,1.5,1.5'. None (the default) stretches the
+    whole volume to the model input instead.
+    """
+    raw = os.getenv("VOLUME_SPACING", "").strip()
+    if not raw:
+        return None
+    spacing = tuple(float(v) for v in raw.split(","))
+    if len(spacing) == 1:
+        spacing *= 3
+    if len(spacing) != 3 or min(spacing) <= 0:
+        raise ValueError(f"VOLUME_SPACING must be one or three positive numbers, got '{raw}'")
+    return spacing
+
+def resample_variant() -> str:
+    """Prediction-cache tag for how 3D inputs are resampled."""
+    spacing = target_spacing()
+    return "fit" if spacing is None else "spacing=" + "x".join(f"{s:g}" for s in spacing)
+
+def _center_fit(volume: np.ndarray, shape) -> np.ndarray:
+    """Center-crop or zero-pad each axis of `volume` to `shape`."""
+    out = np.zeros(shape, dtype=volume.dtype)
+    src, dst = [], []
+    for have, want in zip(volume.shape, shape):
+        n = min(have, want)
+        src.append(slice((have - n) // 2, (have - n) // 2 + n))
+        dst.append(slice((want - n) // 2, (want - n) // 2 + n))
+    out[tuple(dst)] = volume[tuple(src)]
+    return out
+
+def resample_volume(volume: np.ndarray, shape, spacing=None) -> np.ndarray:
+    """
+    Resample a 3D volume to `shape`, in float32. Whole-number
+    shrink factors are area-averaged first (so thin structures are not
+    skipped over), then trilinear interpolation covers the remaining < 2x,
+    the same split resize_pixels uses for images.
+
+    With VOLUME_SPACING set and the volume's voxel `spacing` known, the
+    volume is resampled to that spacing instead, keeping its physical
+    proportions, then center-cropped or zero-padded to `shape`.
+    """
+    target = target_spacing() if spacing is not None else None
+    shape = tuple(shape)
+    size = shape if target is None else tuple(
+        max(1, round(n * have / want)) for n, have, want in zip(volume.shape, spacing, target)
+    )
+    # NIfTI data is Fortran-ordered: resample its C-ordered transpose rather than copy it
+    flip = volume.flags.f_contiguous and not volume.flags.c_contiguous
+    x = torch.from_numpy(np.ascontiguousarray(volume.T if flip else volume, dtype=np.float32))[None, None]
+    x_size = size[::-1] if flip else size
+    with torch.no_grad():
+        factors = tuple(max(1, n // m) for n, m in zip(x.shape[2:], x_size))
+        if max(factors) > 1:
+            x = F.avg_pool3d(x, kernel_size=factors)
+        if tuple(x.shape[2:]) != x_size:
+            x = F.interpolate(x, size=x_size, mode='trilinear', align_corners=False)
+    resampled = x[0, 0].numpy()
+    if flip:
+        resampled = np.ascontiguousarray(resampled.T)
+    return resampled if size == shape else _center_fit(resampled, shape)
+
+def open_volume(source) -> Volume:
+    """`source` itself if it is already an opened Volume, else open the NIfTI path."""
+    return source if isinstance(source, Volume) else NiftiVolume(source)
@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+import torch
+
+# Converted state dicts are written next to the original checkpoint as
+# '<name>.converted.safetensors' (or '.converted.pt' when safetensors is not
+# installed), and recorded in 'weights_manifest.json' in the same directory.
+MANIFEST_NAME = 'weights_manifest.json'
+CONVERTED_MARKER = '.converted.'
+
+try:
+    from safetensors.torch import load_file as _st_load_file, save_file as _st_save_file
+except ImportError:
+    _st_load_file = _st_save_file = None
+
+
+_reads = threading.local()
+
+@contextmanager
+def recording_reads():
+    """
+    Collect the weight files opened on this thread inside the block (the
+    converted copy when one is mapped, the pickle when it is read); yields
+    the list of their paths.
+    """
+    previous = getattr(_reads, "paths", None)
+    _reads.paths = paths = []
+    try:
+        yield paths
+    finally:
+        _reads.paths = previous
+
+def record_read(path) -> None:
+    """Note a weight file opened by a loader, for recording_reads."""
+    paths = getattr(_reads, "paths", None)
+    if paths is not None:
+        paths.append(Path(path))
+
+
+def cache_enabled() -> bool:
+    return os.getenv("WEIGHT_CACHE", "1").lower() not in ("0", "false", "no")
+
+def is_derived_file(path) -> bool:
+    """True for files this module writes (converted weights and manifests)."""
+    name = Path(path).name
+    return name == MANIFEST_NAME or CONVERTED_MARKER in name
+
+def file_sha256(path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _preferred_format() -> str:
+    fmt = os.getenv("WEIGHT_CACHE_FORMAT", "safetensors" if _st_save_file is not None else "torch").lower()
+    if fmt == "safetensors" and _st_save_file is None:
+        fmt = "torch"
+    return fmt
+
+def _converted_path(source: Path, fmt: str) -> Path:
+    ext = 'safetensors' if fmt == 'safetensors' else 'pt'
+    return source.with_name(f"{source.name}{CONVERTED_MARKER}{ext}")
+
+def _read_manifest(directory: Path) -> dict:
+    try:
+        with open(directory / MANIFEST_NAME) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_atomic(path: Path, write) -> None:
+    # Write to a temp file in the same directory, then rename, so concurrent
+    # workers never see a half-written file
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def _update_manifest(directory: Path, key: str, entry: dict) -> None:
+    manifest = _read_manifest(directory)
+    manifest[key] = entry
+
+    def write(tmp):
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+    _write_atomic(directory / MANIFEST_NAME, write)
+
+
+def _source_matches(source: Path, entry: dict) -> bool:
+    """
+    Cheap check (size + mtime) first; fall back to the recorded SHA-256.
+    A hash match records the new mtime, so the pickle is hashed only once
+    after e.g. a fresh checkout or copy touched it.
+    """
+    if not source.is_file():
+        # Converted-only deployments may ship without the original pickle
+        return True
+    st = source.stat()
+    if st.st_size != entry.get("source_size"):
+        return False
+    if st.st_mtime_ns == entry.get("source_mtime_ns"):
+        return True
+    if file_sha256(source) != entry.get("source_sha256"):
+        return False
+    try:
+        _update_manifest(source.parent, source.name, {**entry, "source_mtime_ns": st.st_mtime_ns})
+    except OSError:
+        pass  # read-only model directory: hash again next time
+    return True
+
+def _cached_entry(source: Path):
+    manifest = _read_manifest(source.parent)
+    entry = manifest.get(source.name)
+    if not entry:
+        return None
+    converted = source.parent / entry["converted"]
+    if not converted.is_file() or not _source_matches(source, entry):
+        return None
+    return entry, converted
+
+def _load_pickle(source: Path):
+    record_read(source)
+    return torch.load(str(source), map_location="cpu", weights_only=False)
+
+def _load_converted(path: Path, fmt: str) -> dict:
+    record_read(path)
+    if fmt == "safetensors":
+        if _st_load_file is None:
+            raise ImportError("safetensors is required to read " + str(path))
+        return _st_load_file(str(path), device="cpu")
+    return torch.load(str(path), map_location="cpu", mmap=True, weights_only=True)
+
+def _save_converted(state_dict: dict, source: Path, fmt: str) -> Path:
+    tensors = {k: v.detach().contiguous() for k, v in state_dict.items() if isinstance(v, torch.Tensor)}
+    if fmt == "safetensors" and len(tensors) == len(state_dict):
+        target = _converted_path(source, "safetensors")
+        try:
+            _write_atomic(target, lambda tmp: _st_save_file(tensors, tmp, metadata={"format": "pt"}))
+            return target
+        except (RuntimeError, ValueError):
+            # e.g. tensors sharing storage; the torch format handles those
+            pass
+    target = _converted_path(source, "torch")
+    _write_atomic(target, lambda tmp: torch.save(state_dict, tmp))
+    return target
+
+
+def has_weights(source) -> bool:
+    """The original checkpoint exists, or a valid converted copy does."""
+    source = Path(source)
+    return source.is_file() or (cache_enabled() and _cached_entry(source) is not None)
+
+def convert(source, prepare, force: bool = False) -> Path:
+    """
+    Load a pickled checkpoint, turn it into a clean state dict with
+    `prepare(checkpoint)`, and write it next to the original in a
+    memory-mappable format. Returns the converted file's path.
+    """
+    source = Path(source)
+    if not force:
+        cached = _cached_entry(source)
+        if cached is not None:
+            return cached[1]
+    if not source.is_file():
+        raise FileNotFoundError(f"Checkpoint not found at {source}")
+
+    checkpoint = _load_pickle(source)
+    state_dict = prepare(checkpoint)
+    target = _save_converted(state_dict, source, _preferred_format())
+    fmt = "safetensors" if target.suffix == ".safetensors" else "torch"
+
+    st = source.stat()
+    _update_manifest(source.parent, source.name, {
+        "source_size": st.st_size,
+        "source_mtime_ns": st.st_mtime_ns,
+        "source_sha256": file_sha256(source),
+        "converted": target.name,
+        "converted_sha256": file_sha256(target),
+        "format": fmt,
+        "created": time.time(),
+    })
+    return target
+
+def load_state_dict(source, prepare) -> dict:
+    """
+    Return the cleaned state dict for the checkpoint at `source`.
+
+    Uses the converted copy when the manifest says it still matches the
+    original; its tensors are memory-mapped, so loading is near zero-copy and
+    processes loading the same file share its pages. Otherwise the pickle is
+    read, cleaned with `prepare(checkpoint)` and converted for next time (if
+    the directory is writable). WEIGHT_CACHE=0 always reads the pickle.
+    """
+    source = Path(source)
+    if not cache_enabled():
+        return prepare(_load_pickle(source))
+
+    cached = _cached_entry(source)
+    if cached is not None:
+        entry, converted = cached
+        return _load_converted(converted, entry["format"])
+
+    if not source.is_file():
+        raise FileNotFoundError(f"Checkpoint not found at {source}")
+    try:
+        convert(source, prepare, force=True)
+    except OSError as e:
+        # Read-only model directory: serve from the pickle this time
+        print(f"Warning: could not write converted weights for {source}: {e}")
+        return prepare(_load_pickle(source))
+    entry, converted = _cached_entry(source)
+    return _load_converted(converted, entry["format"])
+
+
+def verify(source) -> bool:
+    """Re-hash the converted file and compare with the manifest."""
+    source = Path(source)
+    entry = _read_manifest(source.parent).get(source.name)
+    if not entry:
+        return False
+    converted = source.parent / entry["converted"]
+    return converted.is_file() and file_sha256(converted) == entry["converted_sha256"]
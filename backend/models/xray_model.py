@@ -2,10 +2,12 @@
 
 import torch
 import torch.nn as nn
-from torchvision import models, transforms
+from torchvision import models
 from PIL import Image
 import os
 import sys
+from .preprocessing import ImagePreprocessor
+from .weight_cache import has_weights, load_state_dict
 
 # ensure we can import backend modules
 sys.path.append(os.path.abspath(os.path.dirname(__file__) + '/../..'))
@@ -33,23 +35,19 @@ def load_chexnet_model(weight_path: str, device: str = "cpu"):
         weight_path: Absolute or relative path to .pth.tar file
         device: torch device string
     """
-    if not os.path.isfile(weight_path):
+    if not has_weights(weight_path):
         raise FileNotFoundError(f"Weights not found at {weight_path}")
 
     model = CheXNet(num_classes=14)
-    checkpoint = torch.load(weight_path, map_location=device, weights_only=False)
-    model.load_state_dict(checkpoint["state_dict"])
+    # Memory-mapped from the converted copy after the first load
+    state_dict = load_state_dict(weight_path, lambda checkpoint: checkpoint["state_dict"])
+    model.load_state_dict(state_dict, assign=True)
     model.to(device)
     model.eval()
     return model
 
-# Preprocessing transforms
-xray_transforms = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406],
-                         [0.229, 0.224, 0.225])
-])
+# Preprocessing: resize to 224x224 + ImageNet normalization
+xray_transforms = ImagePreprocessor((224, 224))
 
 # Class labels
 class_names = [
@@ -59,16 +57,34 @@ class_names = [
 ]
 
 
-def predict_xray(model, image_path: str, top_k: int = 3, device: str = "cpu"):
+def predict_xray_batch(model, input_tensors, top_k=None, device: str = "cpu"):
     """
-    Predict top-k conditions for the given X-ray image.
+    Run a single batched forward pass over already-preprocessed X-ray tensors,
+    given as a sequence or as one (N, 3, 224, 224) batch tensor.
+
+    Returns one list of (class, probability) tuples per input, sorted by
+    probability. Pass top_k=None to keep the full distribution.
     """
-    image = Image.open(image_path).convert('RGB')
-    input_tensor = xray_transforms(image).unsqueeze(0).to(device)
+    batch = input_tensors if torch.is_tensor(input_tensors) else torch.stack(list(input_tensors))
+    batch = batch.to(device)
 
     with torch.no_grad():
-        outputs = model(input_tensor)
-        probs = torch.sigmoid(outputs)[0].cpu().numpy()
+        outputs = model(batch)
+        probs = torch.sigmoid(outputs).cpu().numpy()
+
+    results = []
+    for row in probs:
+        preds = [(class_names[i], float(row[i])) for i in range(len(class_names))]
+        preds = sorted(preds, key=lambda x: x[1], reverse=True)
+        results.append(preds if top_k is None else preds[:top_k])
+    return results
+
 
-    preds = [(class_names[i], float(probs[i])) for i in range(len(class_names))]
-    return sorted(preds, key=lambda x: x[1], reverse=True)[:top_k]
+def predict_xray(model, image, top_k: int = 3, device: str = "cpu"):
+    """
+    Predict top-k conditions for the given X-ray image.
+
+    `image` may be a path, raw bytes, a file-like object or a PIL image.
+    """
+    input_tensor = xray_transforms(image)
+    return predict_xray_batch(model, [input_tensor], top_k=top_k, device=device)[0]
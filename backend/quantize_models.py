@@ -0,0 +1,178 @@
+"""
+Calibrate INT8 versions of the 2D classifiers and report their accuracy
+delta against fp32, so each model can be switched on (QUANTIZE=...) only if
+the loss is acceptable.
+
+    python quantize_models.py                     # all 2D models with weights present
+    python quantize_models.py --models xray,ct2d  # a subset
+    python quantize_models.py --data /path/to/images --augment 8
+
+Static (FX) models are calibrated on the sample images under data/<modality>/
+(plus flipped/cropped variants) and saved as '<weights>.int8.pt' next to the
+fp32 checkpoint. The ViT is quantized dynamically and needs no calibration.
+Agreement and probability deltas are measured on the same images unless
+--eval-data points at a held-out set. The report is printed and written to
+model_assests/quantization_report.json.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+
+import torch
+from torchvision import transforms
+
+from models.image_io import open_image
+from models import quantization
+from models.xray_model import load_chexnet_model, xray_transforms
+from models.ct_model import load_ct_model, ct_transforms_2d, CT_2D_WEIGHTS_PATH
+from models.mri_model import load_mri_model, mri_transforms, WEIGHT_MRI_2D
+from models.ultrasound_model import load_ultrasound_model, ultrasound_transforms, DEFAULT_ULTRASOUND_CHECKPOINT
+from models.weight_cache import has_weights
+from services.xray_service import DEFAULT_WEIGHT_PATH as XRAY_WEIGHTS_PATH
+
+DATA_DIR = Path(current_dir) / 'data'
+REPORT_PATH = Path(current_dir) / 'model_assests' / 'quantization_report.json'
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.bmp')
+
+# name -> (weights, loader, preprocessing, output -> probabilities, sample directory)
+MODELS = {
+    'xray': (XRAY_WEIGHTS_PATH, lambda: load_chexnet_model(str(XRAY_WEIGHTS_PATH)),
+             xray_transforms, torch.sigmoid, 'xray'),
+    'ct2d': (CT_2D_WEIGHTS_PATH, lambda: load_ct_model(mode='2d'),
+             ct_transforms_2d, lambda out: torch.softmax(out, dim=1), 'ct/2d'),
+    'mri2d': (WEIGHT_MRI_2D, lambda: load_mri_model('2d'),
+              mri_transforms, lambda out: torch.softmax(out, dim=1), 'mri/2d'),
+    # USFM's head already ends in a sigmoid
+    'ultrasound': (DEFAULT_ULTRASOUND_CHECKPOINT, load_ultrasound_model,
+                   ultrasound_transforms, lambda out: out, 'ultrasound'),
+}
+
+
+def sample_images(directory: Path) -> list:
+    if not directory.is_dir():
+        return []
+    return sorted(p for p in directory.rglob('*') if p.suffix.lower() in IMAGE_SUFFIXES)
+
+def calibration_batches(paths, preprocess, augment: int, seed: int = 0) -> list:
+    """Each image, its mirror and `augment` random crops, as 1-image batches."""
+    rng = random.Random(seed)
+    batches = []
+    for path in paths:
+        image = open_image(path)
+        variants = [image, image.transpose(0)]  # 0 = FLIP_LEFT_RIGHT
+        for _ in range(augment):
+            scale = rng.uniform(0.7, 1.0)
+            crop = transforms.RandomResizedCrop(image.size[::-1], scale=(scale, scale))
+            torch.manual_seed(rng.randrange(1 << 30))
+            variants.append(crop(image))
+        batches.extend(preprocess(v).unsqueeze(0) for v in variants)
+    return batches
+
+def state_dict_mb(model) -> float:
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 1e6
+
+def mean_latency_ms(model, batches, repeats: int = 3) -> float:
+    with torch.no_grad():
+        model(batches[0])
+        started = time.perf_counter()
+        for _ in range(repeats):
+            for batch in batches:
+                model(batch)
+    return (time.perf_counter() - started) * 1000.0 / (repeats * len(batches))
+
+def compare(fp32, int8, batches, to_probs) -> dict:
+    agree, diffs = 0, []
+    with torch.no_grad():
+        for batch in batches:
+            p32, p8 = to_probs(fp32(batch)), to_probs(int8(batch))
+            agree += int(p32.argmax(dim=1).eq(p8.argmax(dim=1)).all())
+            diffs.append((p32 - p8).abs().flatten())
+    diffs = torch.cat(diffs)
+    return {
+        "top1_agreement": round(agree / len(batches), 4),
+        "mean_abs_prob_delta": round(float(diffs.mean()), 6),
+        "max_abs_prob_delta": round(float(diffs.max()), 6),
+    }
+
+
+def quantize_one(name: str, args) -> dict:
+    weights, loader, preprocess, to_probs, sample_dir = MODELS[name]
+    mode = quantization.QUANTIZATION_MODES[name]
+    calib_paths = sample_images(Path(args.data) / sample_dir if args.data else DATA_DIR / sample_dir)
+    eval_paths = sample_images(Path(args.eval_data) / sample_dir) if args.eval_data else calib_paths
+    if not calib_paths and mode == 'static':
+        raise RuntimeError(f"no calibration images under {sample_dir}/")
+    if not eval_paths:
+        raise RuntimeError(f"no evaluation images under {sample_dir}/")
+
+    fp32 = loader().eval()
+    calib = calibration_batches(calib_paths, preprocess, args.augment)
+    if mode == 'static':
+        int8 = quantization.calibrate_static(fp32, calib)
+        torch.save(int8.state_dict(), quantization.quantized_path(weights))
+    else:
+        int8 = quantization.quantize_dynamic(fp32)
+
+    evaluation = calibration_batches(eval_paths, preprocess, args.augment, seed=1)
+    fp32_ms = mean_latency_ms(fp32, evaluation)
+    int8_ms = mean_latency_ms(int8, evaluation)
+    return {
+        "mode": mode,
+        "engine": torch.backends.quantized.engine,
+        "calibration_images": len(calib) if mode == 'static' else 0,
+        "eval_images": len(evaluation),
+        "held_out": bool(args.eval_data),
+        **compare(fp32, int8, evaluation, to_probs),
+        "fp32_ms": round(fp32_ms, 3),
+        "int8_ms": round(int8_ms, 3),
+        "speedup": round(fp32_ms / int8_ms, 3) if int8_ms else None,
+        "fp32_mb": round(state_dict_mb(fp32), 2),
+        "int8_mb": round(state_dict_mb(int8), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", default=",".join(MODELS))
+    parser.add_argument("--data", help="calibration image root (default: backend/data)")
+    parser.add_argument("--eval-data", help="held-out image root with the same layout")
+    parser.add_argument("--augment", type=int, default=4, help="random crops per calibration image")
+    parser.add_argument("--report", default=str(REPORT_PATH))
+    args = parser.parse_args()
+
+    report = {}
+    for name in [m.strip() for m in args.models.split(",") if m.strip()]:
+        weights = MODELS[name][0]
+        if not has_weights(weights):
+            print(f"{name:<11} skipped (no weights at {weights})")
+            continue
+        try:
+            report[name] = quantize_one(name, args)
+        except Exception as e:
+            print(f"{name:<11} FAILED: {e}")
+            continue
+        r = report[name]
+        print(f"{name:<11} {r['mode']:<8} top-1 agree {r['top1_agreement']:.2%}  "
+              f"mean |dp| {r['mean_abs_prob_delta']:.4f}  max |dp| {r['max_abs_prob_delta']:.4f}  "
+              f"{r['fp32_ms']:.1f} -> {r['int8_ms']:.1f} ms ({r['speedup']}x)  "
+              f"{r['fp32_mb']:.1f} -> {r['int8_mb']:.1f} MB")
+
+    if report:
+        Path(args.report).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.report}. Enable the models you accept with QUANTIZE=<name,...>")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,217 +1,162 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
-from services.advanced_analysis import MedicalImageAnalyzer
-import base64
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
+from fastapi.responses import JSONResponse, Response
+from typing import List, Optional
+from services.advanced_analysis import ANALYSIS_TYPES, MedicalImageAnalyzer
+from services.overlay_store import OVERLAY_FORMATS, get_overlay_store
+from services.executor import run_inference
+from services.uploads import Upload, read_upload
+import traceback
 
 router = APIRouter()
 analyzer = MedicalImageAnalyzer()
 
-@router.post("/analyze/fracture")
-async def analyze_fracture(file: UploadFile = File(...)):
+OVERLAY_QUERY = Query(None, pattern="^(inline|url)$",
+                      description="'inline': base64 PNG in the JSON; 'url': an overlay_id/overlay_url to fetch it from")
+
+class UploadRejected(Exception):
+    """An upload over the size limit or of an unsupported type; see upload_rejected."""
+
+async def upload_rejected(request: Request, exc: UploadRejected) -> JSONResponse:
+    # Same shape and status as every other error from this router
+    return JSONResponse(status_code=400, content={"error": str(exc)})
+
+def analysis_upload(max_mb: int, allowed_types: List[str]):
     """
-    Analyze an X-ray or CT scan for bone fractures.
+    Dependency reading the `file` field with read_upload: in chunks, rejected
+    as soon as it passes the size limit or its first bytes show a type
+    outside `allowed_types` (sniffed, not the declared type).
+    """
+    async def dependency(file: UploadFile = File(...)) -> Upload:
+        try:
+            return await read_upload(file, max_mb * 2**20, allowed_types)
+        except HTTPException as e:
+            raise UploadRejected(e.detail)
+    return dependency
+
+ANALYSIS_UPLOAD = analysis_upload(50, ["image/jpeg", "image/png", "application/dicom"])
+RETINAL_UPLOAD = analysis_upload(20, ["image/jpeg", "image/png"])
+
+def with_overlay_url(request: Request, result: dict) -> dict:
+    visualization = result.get("visualization") or {}
+    if "overlay_id" in visualization:
+        visualization["overlay_url"] = str(request.url_for("get_overlay", overlay_id=visualization["overlay_id"]))
+    return result
+
+@router.get("/overlays/{overlay_id}", name="get_overlay")
+async def get_overlay(
+    overlay_id: str,
+    format: str = Query("webp", pattern="^(webp|jpeg|png)$"),
+    max_dim: Optional[int] = Query(None, ge=16, le=16384, description="Longest side in pixels; larger overlays are shrunk"),
+    quality: int = Query(80, ge=1, le=100, description="WebP/JPEG quality"),
+):
     """
+    An overlay from an analysis run with overlay=url. It is encoded on the
+    first fetch of each format/size/quality and kept for repeat fetches;
+    overlays expire after OVERLAY_STORE_TTL seconds or when the store is full.
+    """
+    data = await run_inference(get_overlay_store().render, overlay_id, format, max_dim, quality)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Overlay not found or expired.")
+    return Response(content=data, media_type=OVERLAY_FORMATS[format][1],
+                    headers={"Cache-Control": "private, max-age=600"})
+
+async def run_analysis(request: Request, upload: Upload, analysis_type: str, overlay: Optional[str]):
     try:
-        # Validate file type
-        allowed_types = ["image/jpeg", "image/png", "image/dicom", "application/dicom", "application/octet-stream"]
-        if file.content_type not in allowed_types:
-            return JSONResponse(
-                status_code=400,
-                content={"error": f"Unsupported file type: {file.content_type}. Supported types: {', '.join(allowed_types)}"}
-            )
-            
-        # Read and validate file size (max 50MB)
-        contents = await file.read()
-        if len(contents) > 50 * 1024 * 1024:  # 50MB
-            return JSONResponse(
-                status_code=400,
-                content={"error": "File too large. Maximum size is 50MB."}
-            )
-            
         # Process the image
-        result = analyzer.analyze_image(contents, 'fracture')
-        
+        result = await run_inference(analyzer.analyze_image, upload.data, analysis_type, overlay=overlay)
+
         # Check for errors in the analysis
         if "error" in result:
             return JSONResponse(
                 status_code=500,
                 content={"error": f"Analysis failed: {result['error']}"}
             )
-            
-        return JSONResponse(content=result)
-        
+
+        return JSONResponse(content=with_overlay_url(request, result))
+
+    except HTTPException:
+        raise
     except Exception as e:
-        import traceback
         print(f"Error processing image: {str(e)}\n{traceback.format_exc()}")
         return JSONResponse(
             status_code=500,
             content={"error": f"Failed to process image: {str(e)}"}
         )
 
-@router.post("/analyze/lung-nodule")
-async def analyze_lung_nodule(file: UploadFile = File(...)):
+@router.post("/analyze")
+async def analyze_combined(
+    request: Request,
+    upload: Upload = Depends(ANALYSIS_UPLOAD),
+    types: List[str] = Query(..., description=f"Analyses to run, repeated or comma-separated: {', '.join(ANALYSIS_TYPES)}"),
+    overlay: Optional[str] = OVERLAY_QUERY,
+):
     """
-    Analyze a chest CT scan for lung nodules.
+    Run several analyses on one upload. The image is decoded once and the
+    detectors share its grayscale/HSV/edge maps, running concurrently.
     """
+    # Route names use dashes (lung-nodule, brain-tumor); accept either spelling
+    analysis_types = [t.strip().replace('-', '_') for value in types for t in value.split(',') if t.strip()]
+    unknown = [t for t in analysis_types if t not in ANALYSIS_TYPES]
+    if not analysis_types or unknown:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Unsupported analysis type: {', '.join(unknown) or '(none)'}. Supported types: {', '.join(ANALYSIS_TYPES)}"}
+        )
+
     try:
-        # Validate file type
-        allowed_types = ["image/jpeg", "image/png", "image/dicom", "application/dicom", "application/octet-stream"]
-        if file.content_type not in allowed_types:
-            return JSONResponse(
-                status_code=400,
-                content={"error": f"Unsupported file type: {file.content_type}. Supported types: {', '.join(allowed_types)}"}
-            )
-            
-        # Read and validate file size (max 50MB)
-        contents = await file.read()
-        if len(contents) > 50 * 1024 * 1024:  # 50MB
-            return JSONResponse(
-                status_code=400,
-                content={"error": "File too large. Maximum size is 50MB."}
-            )
-            
-        # Process the image
-        result = analyzer.analyze_image(contents, 'lung_nodule')
-        
-        # Check for errors in the analysis
-        if "error" in result:
-            return JSONResponse(
-                status_code=500,
-                content={"error": f"Analysis failed: {result['error']}"}
-            )
-            
-        return JSONResponse(content=result)
-        
+        results = await run_inference(analyzer.analyze_many, upload.data, analysis_types, overlay=overlay)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": f"Analysis failed: {str(e)}"})
+    except HTTPException:
+        raise
     except Exception as e:
-        import traceback
         print(f"Error processing image: {str(e)}\n{traceback.format_exc()}")
         return JSONResponse(
             status_code=500,
             content={"error": f"Failed to process image: {str(e)}"}
         )
 
+    return JSONResponse(content={
+        "status": "success",
+        "results": {name: with_overlay_url(request, result) for name, result in results.items()},
+    })
+
+@router.post("/analyze/fracture")
+async def analyze_fracture(request: Request, upload: Upload = Depends(ANALYSIS_UPLOAD),
+                           overlay: Optional[str] = OVERLAY_QUERY):
+    """
+    Analyze an X-ray or CT scan for bone fractures.
+    """
+    return await run_analysis(request, upload, 'fracture', overlay)
+
+@router.post("/analyze/lung-nodule")
+async def analyze_lung_nodule(request: Request, upload: Upload = Depends(ANALYSIS_UPLOAD),
+                              overlay: Optional[str] = OVERLAY_QUERY):
+    """
+    Analyze a chest CT scan for lung nodules.
+    """
+    return await run_analysis(request, upload, 'lung_nodule', overlay)
+
 @router.post("/analyze/brain-tumor")
-async def analyze_brain_tumor(file: UploadFile = File(...)):
+async def analyze_brain_tumor(request: Request, upload: Upload = Depends(ANALYSIS_UPLOAD),
+                              overlay: Optional[str] = OVERLAY_QUERY):
     """
     Analyze an MRI scan for brain tumors.
     """
-    try:
-        # Validate file type
-        allowed_types = ["image/jpeg", "image/png", "image/dicom", "application/dicom", "application/octet-stream"]
-        if file.content_type not in allowed_types:
-            return JSONResponse(
-                status_code=400,
-                content={"error": f"Unsupported file type: {file.content_type}. Supported types: {', '.join(allowed_types)}"}
-            )
-            
-        # Read and validate file size (max 50MB)
-        contents = await file.read()
-        if len(contents) > 50 * 1024 * 1024:  # 50MB
-            return JSONResponse(
-                status_code=400,
-                content={"error": "File too large. Maximum size is 50MB."}
-            )
-            
-        # Process the image
-        result = analyzer.analyze_image(contents, 'brain_tumor')
-        
-        # Check for errors in the analysis
-        if "error" in result:
-            return JSONResponse(
-                status_code=500,
-                content={"error": f"Analysis failed: {result['error']}"}
-            )
-            
-        return JSONResponse(content=result)
-        
-    except Exception as e:
-        import traceback
-        print(f"Error processing image: {str(e)}\n{traceback.format_exc()}")
-        return JSONResponse(
-            status_code=500,
-            content={"error": f"Failed to process image: {str(e)}"}
-        )
+    return await run_analysis(request, upload, 'brain_tumor', overlay)
 
 @router.post("/analyze/retinal")
-async def analyze_retinal(file: UploadFile = File(...)):
+async def analyze_retinal(request: Request, upload: Upload = Depends(RETINAL_UPLOAD),
+                          overlay: Optional[str] = OVERLAY_QUERY):
     """
     Analyze a retinal image for diseases.
     """
-    try:
-        # Validate file type
-        allowed_types = ["image/jpeg", "image/png", "application/octet-stream"]
-        if file.content_type not in allowed_types:
-            return JSONResponse(
-                status_code=400,
-                content={"error": f"Unsupported file type: {file.content_type}. Supported types: {', '.join(allowed_types)}"}
-            )
-            
-        # Read and validate file size (max 20MB for retinal images)
-        contents = await file.read()
-        if len(contents) > 20 * 1024 * 1024:  # 20MB
-            return JSONResponse(
-                status_code=400,
-                content={"error": "File too large. Maximum size is 20MB for retinal images."}
-            )
-            
-        # Process the image
-        result = analyzer.analyze_image(contents, 'retinal')
-        
-        # Check for errors in the analysis
-        if "error" in result:
-            return JSONResponse(
-                status_code=500,
-                content={"error": f"Analysis failed: {result['error']}"}
-            )
-            
-        return JSONResponse(content=result)
-        
-    except Exception as e:
-        import traceback
-        print(f"Error processing retinal image: {str(e)}\n{traceback.format_exc()}")
-        return JSONResponse(
-            status_code=500,
-            content={"error": f"Failed to process retinal image: {str(e)}"}
-        )
+    return await run_analysis(request, upload, 'retinal', overlay)
 
 @router.post("/analyze/organ")
-async def analyze_organ(file: UploadFile = File(...)):
+async def analyze_organ(request: Request, upload: Upload = Depends(ANALYSIS_UPLOAD),
+                        overlay: Optional[str] = OVERLAY_QUERY):
     """
     Analyze an organ image for abnormalities.
     """
-    try:
-        # Validate file type
-        allowed_types = ["image/jpeg", "image/png", "image/dicom", "application/dicom", "application/octet-stream"]
-        if file.content_type not in allowed_types:
-            return JSONResponse(
-                status_code=400,
-                content={"error": f"Unsupported file type: {file.content_type}. Supported types: {', '.join(allowed_types)}"}
-            )
-            
-        # Read and validate file size (max 50MB)
-        contents = await file.read()
-        if len(contents) > 50 * 1024 * 1024:  # 50MB
-            return JSONResponse(
-                status_code=400,
-                content={"error": "File too large. Maximum size is 50MB."}
-            )
-            
-        # Process the image
-        result = analyzer.analyze_image(contents, 'organ')
-        
-        # Check for errors in the analysis
-        if "error" in result:
-            return JSONResponse(
-                status_code=500,
-                content={"error": f"Analysis failed: {result['error']}"}
-            )
-            
-        return JSONResponse(content=result)
-        
-    except Exception as e:
-        import traceback
-        print(f"Error processing organ image: {str(e)}\n{traceback.format_exc()}")
-        return JSONResponse(
-            status_code=500,
-            content={"error": f"Failed to process organ image: {str(e)}"}
-        )
+    return await run_analysis(request, upload, 'organ', overlay)
@@ -1,106 +1,326 @@
+import base64
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
 from typing import Dict, List, Tuple, Optional
 import torch
-from torchvision import transforms
+from models.preprocessing import ImagePreprocessor, draft_jpeg, is_jpeg
+from services.overlay_store import get_overlay_store, overlay_delivery
+from services.regions import box_iou, component_mask, component_regions, contour_stats, merge_overlapping
 from PIL import Image
 import io
 
+def _refine_enabled() -> bool:
+    return os.getenv("ANALYSIS_REFINE", "1").lower() not in ("0", "false", "no")
+
+def _merge_iou() -> float:
+    """Boxes of one detector overlapping by more than this are reported as one region."""
+    return float(os.getenv("ANALYSIS_MERGE_IOU", "0.3"))
+
+def _as_boxes(boxes) -> List[Tuple[int, int, int, int]]:
+    return [tuple(int(v) for v in box) for box in boxes]
+
+def _merged_regions(boxes, areas, refine=None, mask_fn=None) -> List[Tuple]:
+    """
+    Boxes merged where they overlap. With a pyramid refiner, every box is
+    tightened at full resolution before merging, so a merged region covers
+    all of its members as it would at full resolution (refined boxes stay
+    fractional, in level coordinates).
+    """
+    if refine is None:
+        return _as_boxes(merge_overlapping(boxes, areas, _merge_iou())[0])
+    refined = [refine(box, mask_fn) for box in np.asarray(boxes).reshape(-1, 4).tolist()]
+    return [tuple(box) for box in merge_overlapping(refined, areas, _merge_iou())[0].tolist()]
+
+ANALYSIS_TYPES = ('fracture', 'lung_nodule', 'brain_tumor', 'retinal', 'organ')
+
+_detector_pool = None
+_detector_pool_lock = threading.Lock()
+
+def get_detector_pool() -> ThreadPoolExecutor:
+    """
+    Threads that run the detectors of one multi-analysis request side by
+    side (ANALYSIS_WORKERS, default up to 4); OpenCV releases the GIL.
+    """
+    global _detector_pool
+    with _detector_pool_lock:
+        if _detector_pool is None:
+            workers = int(os.getenv("ANALYSIS_WORKERS", str(min(4, os.cpu_count() or 1))))
+            _detector_pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="analysis")
+        return _detector_pool
+
+
+class ImageFeatures:
+    """
+    Per-request cache of the intermediates the detectors share for one
+    working image: grayscale, HSV and Canny edge maps. Each is computed on
+    first use and only once, even when detectors ask for it concurrently.
+    Detectors must treat them as read-only.
+    """
+
+    def __init__(self, image: np.ndarray):
+        self.image = image
+        self._values = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key, compute):
+        with self._lock:
+            if key in self._values:
+                return self._values[key]
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._values:
+                self._values[key] = compute()
+            return self._values[key]
+
+    @property
+    def gray(self) -> np.ndarray:
+        return self._get('gray', lambda: cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY))
+
+    @property
+    def hsv(self) -> np.ndarray:
+        return self._get('hsv', lambda: cv2.cvtColor(self.image, cv2.COLOR_BGR2HSV))
+
+    def edges(self, low: float, high: float) -> np.ndarray:
+        return self._get(('edges', low, high), lambda: cv2.Canny(self.gray, low, high, apertureSize=3))
+
 class MedicalImageAnalyzer:
     def __init__(self):
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.transform = transforms.Compose([
-            transforms.Resize((256, 256)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-        ])
+        self.transform = ImagePreprocessor((256, 256))
         
-    def analyze_image(self, image_data: bytes, analysis_type: str) -> Dict:
+    def analyze_image(self, image_data: bytes, analysis_type: str, overlay: Optional[str] = None) -> Dict:
         """
         Main method to analyze medical images based on the specified analysis type.
         
         Args:
             image_data: Binary image data
             analysis_type: Type of analysis to perform (fracture, lung_nodule, brain_tumor, retinal, organ)
+            overlay: 'inline' embeds the overlay as a base64 PNG; 'url' keeps it in the
+                overlay store and returns its `overlay_id` (encoded only when fetched).
+                Defaults to OVERLAY_DELIVERY.
             
         Returns:
             Dictionary containing analysis results
         """
         try:
-            # Convert bytes to numpy array
-            nparr = np.frombuffer(image_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if analysis_type == 'fracture':
-                return self._detect_fractures(img)
-            elif analysis_type == 'lung_nodule':
-                return self._detect_lung_nodules(img)
-            elif analysis_type == 'brain_tumor':
-                return self._detect_brain_tumors(img)
-            elif analysis_type == 'retinal':
-                return self._analyze_retinal(img)
-            elif analysis_type == 'organ':
-                return self._detect_organ_abnormalities(img)
-            else:
+            if analysis_type not in ANALYSIS_TYPES:
                 raise ValueError(f"Unsupported analysis type: {analysis_type}")
+            return self._run(self._prepare(image_data), analysis_type, overlay)
                 
         except Exception as e:
             return {"error": str(e), "status": "error"}
+
+    def analyze_many(self, image_data: bytes, analysis_types: List[str], overlay: Optional[str] = None) -> Dict:
+        """
+        Run several analyses on one image: it is decoded once, the detectors
+        share its grayscale/HSV/edge maps through one ImageFeatures, and they
+        run concurrently on the detector pool.
+
+        Returns {analysis_type: result}, in the order asked for; a detector
+        that fails gets an error result without affecting the others.
+        Raises ValueError for unknown types or an undecodable image.
+        """
+        unknown = [t for t in analysis_types if t not in ANALYSIS_TYPES]
+        if unknown:
+            raise ValueError(f"Unsupported analysis type: {', '.join(unknown)}")
+        prepared = self._prepare(image_data)
+        types = list(dict.fromkeys(analysis_types))
+        runs = [get_detector_pool().submit(self._run, prepared, t, overlay) for t in types]
+        results = {}
+        for analysis_type, run in zip(types, runs):
+            try:
+                results[analysis_type] = run.result()
+            except Exception as e:
+                results[analysis_type] = {"error": str(e), "status": "error"}
+        return results
+
+    def _prepare(self, image_data: bytes) -> Dict:
+        """Decode, pick the working level and set up the shared features for the detectors."""
+        # Target working size: the short side detection runs at (0 = full resolution)
+        min_side = int(os.getenv("ANALYSIS_MIN_SIDE", "1024"))
+        img, scale, original_size = self._decode(image_data, min_side)
+        if img is None:
+            raise ValueError("Could not decode image")
+
+        level, level_scale = self._working_level(img, min_side)
+        return {
+            "features": ImageFeatures(level),
+            # Size limits in the detectors are in the upload's pixels
+            "pixel_scale": scale * level_scale,
+            "refine": self._box_refiner(img, level_scale) if level is not img and _refine_enabled() else None,
+            "original_size": original_size,
+        }
+
+    def _run(self, prepared: Dict, analysis_type: str, overlay: Optional[str]) -> Dict:
+        features, pixel_scale, refine = prepared["features"], prepared["pixel_scale"], prepared["refine"]
+        if analysis_type == 'fracture':
+            result = self._detect_fractures(features, pixel_scale, refine)
+        elif analysis_type == 'lung_nodule':
+            result = self._detect_lung_nodules(features, pixel_scale)
+        elif analysis_type == 'brain_tumor':
+            result = self._detect_brain_tumors(features, pixel_scale, refine)
+        elif analysis_type == 'retinal':
+            result = self._analyze_retinal(features)
+        elif analysis_type == 'organ':
+            result = self._detect_organ_abnormalities(features)
+        else:
+            raise ValueError(f"Unsupported analysis type: {analysis_type}")
+        result = self._to_original_coordinates(result, pixel_scale, prepared["original_size"])
+        return self._deliver_overlay(result, overlay or overlay_delivery())
     
-    def _detect_fractures(self, image: np.ndarray) -> Dict:
+    def _decode(self, image_data: bytes, min_side: int):
+        """
+        Decode to a BGR image for the detectors. Large JPEGs are decoded at a
+        reduced DCT scale that keeps the short side at least `min_side`
+        pixels (0 disables this); other formats are decoded in full.
+
+        Returns (image, scale, original (height, width)), where scale maps
+        image coordinates back to the upload's pixels.
+        """
+        if min_side > 0 and is_jpeg(image_data):
+            drafted = draft_jpeg(image_data, (min_side, min_side))
+            if drafted is not None:
+                image, scale = drafted
+                pixels = np.asarray(image)
+                code = cv2.COLOR_GRAY2BGR if pixels.ndim == 2 else cv2.COLOR_RGB2BGR
+                height, width = pixels.shape[:2]
+                return cv2.cvtColor(pixels, code), scale, (round(height * scale), round(width * scale))
+
+        img = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+        return img, 1.0, (img.shape[:2] if img is not None else None)
+
+    @staticmethod
+    def _working_level(image: np.ndarray, min_side: int):
+        """
+        The pyramid level detection runs on: the smallest pyrDown level whose
+        short side is still at least `min_side` (the image itself if it is
+        already small enough or min_side is 0). Returns (level, image pixels
+        per level pixel).
+        """
+        level = image
+        while min_side > 0 and (min(level.shape[:2]) + 1) // 2 >= min_side:
+            level = cv2.pyrDown(level)
+        return level, image.shape[1] / level.shape[1]
+
+    @staticmethod
+    def _box_refiner(detail: np.ndarray, level_scale: float):
+        """
+        Returns refine(box, mask_fn): a level (x, y, w, h) box tightened on
+        the full-resolution `detail` image. Only the box's region (plus a
+        couple of level pixels) is cropped; mask_fn(crop) is the detector's
+        binary map there, whose contour best overlapping the box replaces it.
+        The result stays in level coordinates, but fractional, so it keeps
+        full-resolution precision.
+        """
+        height, width = detail.shape[:2]
+        margin = 2 * int(np.ceil(level_scale))
+
+        def refine(box, mask_fn):
+            x, y, w, h = box
+            x0, y0 = max(0, int(x * level_scale) - margin), max(0, int(y * level_scale) - margin)
+            x1 = min(width, int(np.ceil((x + w) * level_scale)) + margin)
+            y1 = min(height, int(np.ceil((y + h) * level_scale)) + margin)
+            contours, _ = cv2.findContours(mask_fn(detail[y0:y1, x0:x1]), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            target = (x * level_scale - x0, y * level_scale - y0, w * level_scale, h * level_scale)
+            best = max(contour_stats(contours)[1].tolist(), key=lambda b: box_iou(b, target), default=None)
+            if best is None or box_iou(best, target) == 0:
+                return box
+            rx, ry, rw, rh = best
+            return ((x0 + rx) / level_scale, (y0 + ry) / level_scale, rw / level_scale, rh / level_scale)
+        return refine
+
+    @staticmethod
+    def _to_original_coordinates(result: Dict, scale: float, original_size) -> Dict:
+        """Report sizes and locations in the upload's pixels, whatever resolution was analyzed."""
+        visualization = result.get("visualization")
+        if visualization is None:
+            return result
+        visualization["original_size"] = tuple(original_size)
+        if scale == 1.0:
+            return result
+        for key in ("bounding_boxes", "tumor_regions"):
+            if key in visualization:
+                visualization[key] = [tuple(int(round(v * scale)) for v in box) for box in visualization[key]]
+        for location in visualization.get("nodule_locations", []):
+            location["x"] = int(round(location["x"] * scale))
+            location["y"] = int(round(location["y"] * scale))
+            location["size"] = location["size"] * scale
+        findings = result.get("findings", {})
+        if "average_size" in findings:
+            findings["average_size"] = findings["average_size"] * scale
+        return result
+
+    @staticmethod
+    def _deliver_overlay(result: Dict, delivery: str) -> Dict:
+        visualization = result.get("visualization")
+        if visualization is None or visualization.get("overlay") is None:
+            return result
+        overlay = visualization.pop("overlay")
+        if delivery not in ("url", "inline"):
+            raise ValueError(f"Unsupported overlay delivery: {delivery}")
+        overlay_id = get_overlay_store().put(overlay) if delivery == "url" else None
+        if overlay_id is not None:
+            reference = {"overlay_id": overlay_id}
+        else:  # inline, or too large for the overlay store
+            _, buffer = cv2.imencode('.png', overlay)
+            reference = {"overlay": f"data:image/png;base64,{base64.b64encode(buffer).decode('utf-8')}"}
+        result["visualization"] = {**reference, **visualization}
+        return result
+
+    def _detect_fractures(self, features: ImageFeatures, pixel_scale: float = 1.0, refine=None) -> Dict:
         """Detect bone fractures using edge detection and segmentation."""
-        # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        image = features.image
         
-        # Edge detection
-        edges = cv2.Canny(gray, 50, 150, apertureSize=3)
+        # Edge detection (on the grayscale image)
+        edges = features.edges(50, 150)
         
-        # Find contours
-        contours, _ = cv2.findContours(edges, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+        # Find contours (outer ones only; the hierarchy is not used)
+        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         
         # Filter contours to find potential fractures
-        fracture_contours = []
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            if 100 < area < 5000:  # Adjust these values based on your needs
-                fracture_contours.append(contour)
+        areas, boxes = contour_stats(contours)
+        area_scale = pixel_scale ** 2
+        keep = np.flatnonzero((areas > 100 / area_scale) & (areas < 5000 / area_scale))  # Adjust these values based on your needs
+        fracture_contours = [contours[i] for i in keep]
+        edges_at = lambda crop: cv2.Canny(cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY), 50, 150, apertureSize=3)
+        boxes = _merged_regions(boxes[keep], areas[keep], refine, edges_at)
         
         # Create overlay
         overlay = image.copy()
         cv2.drawContours(overlay, fracture_contours, -1, (0, 0, 255), 2)
         
-        # Convert overlay to base64 for frontend
-        _, buffer = cv2.imencode('.png', overlay)
-        overlay_base64 = base64.b64encode(buffer).decode('utf-8')
-        
         return {
             "status": "success",
             "analysis_type": "fracture_detection",
             "findings": {
-                "fracture_detected": len(fracture_contours) > 0,
-                "number_of_fractures": len(fracture_contours),
-                "confidence": min(99, len(fracture_contours) * 20)  # Simple confidence metric
+                "fracture_detected": len(boxes) > 0,
+                "number_of_fractures": len(boxes),
+                "confidence": min(99, len(boxes) * 20)  # Simple confidence metric
             },
             "visualization": {
-                "overlay": f"data:image/png;base64,{overlay_base64}",
+                "overlay": overlay,
                 "original_size": image.shape[:2],
-                "bounding_boxes": [cv2.boundingRect(c) for c in fracture_contours]
+                "bounding_boxes": boxes
             }
         }
     
-    def _detect_lung_nodules(self, image: np.ndarray) -> Dict:
+    def _detect_lung_nodules(self, features: ImageFeatures, pixel_scale: float = 1.0) -> Dict:
         """Detect lung nodules in chest CT scans."""
         # Placeholder for actual model inference
         # In a real implementation, you would load a pre-trained model here
         
         # For demonstration, we'll use simple blob detection
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        image, gray = features.image, features.gray
         
         # Simple blob detector
         params = cv2.SimpleBlobDetector_Params()
         params.filterByArea = True
-        params.minArea = 10
-        params.maxArea = 1000
+        params.minArea = 10 / pixel_scale ** 2
+        params.maxArea = 1000 / pixel_scale ** 2
         detector = cv2.SimpleBlobDetector_create(params)
         keypoints = detector.detect(gray)
         
@@ -108,9 +328,6 @@ class MedicalImageAnalyzer:
         overlay = cv2.drawKeypoints(image, keypoints, np.array([]), (0, 0, 255),
                                   cv2.DRAW_MATCHES_FLAGS_DRAW_RICH_KEYPOINTS)
         
-        _, buffer = cv2.imencode('.png', overlay)
-        overlay_base64 = base64.b64encode(buffer).decode('utf-8')
-        
         return {
             "status": "success",
             "analysis_type": "lung_nodule_detection",
@@ -121,63 +338,62 @@ class MedicalImageAnalyzer:
                 "confidence": min(95, len(keypoints) * 15)  # Simple confidence metric
             },
             "visualization": {
-                "overlay": f"data:image/png;base64,{overlay_base64}",
+                "overlay": overlay,
                 "original_size": image.shape[:2],
                 "nodule_locations": [{'x': int(k.pt[0]), 'y': int(k.pt[1]), 'size': k.size} 
                                    for k in keypoints]
             }
         }
     
-    def _detect_brain_tumors(self, image: np.ndarray) -> Dict:
+    def _detect_brain_tumors(self, features: ImageFeatures, pixel_scale: float = 1.0, refine=None) -> Dict:
         """Detect and segment brain tumors in MRI scans."""
         # Placeholder for actual model inference
         # In a real implementation, you would use a pre-trained segmentation model
         
         # Simple thresholding for demonstration
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        image, gray = features.image, features.gray
+        otsu, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
         
-        # Find contours
-        contours, _ = cv2.findContours(thresh, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+        # Connected regions, filtered by size
+        area_scale = pixel_scale ** 2
+        labels, ids, boxes, areas = component_regions(thresh, 50 / area_scale, 10000 / area_scale)
+        # With refinement: the same Otsu level, applied to the full-resolution pixels of each region
+        above_level = lambda crop: (cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) > otsu).astype(np.uint8)
+        regions = _merged_regions(boxes, areas, refine, above_level)
         
-        # Filter contours by size
-        tumor_contours = [c for c in contours if 50 < cv2.contourArea(c) < 10000]
-        
-        # Create overlay
+        # Create overlay (outlines of the kept regions)
         overlay = image.copy()
+        tumor_contours, _ = cv2.findContours(component_mask(labels, ids), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         cv2.drawContours(overlay, tumor_contours, -1, (0, 255, 0), 2)
         
         # Calculate tumor area percentage
         total_area = image.shape[0] * image.shape[1]
-        tumor_area = sum(cv2.contourArea(c) for c in tumor_contours)
+        tumor_area = int(areas.sum())
         tumor_percentage = (tumor_area / total_area) * 100
         
-        _, buffer = cv2.imencode('.png', overlay)
-        overlay_base64 = base64.b64encode(buffer).decode('utf-8')
-        
         return {
             "status": "success",
             "analysis_type": "brain_tumor_detection",
             "findings": {
-                "tumor_detected": len(tumor_contours) > 0,
-                "number_of_tumors": len(tumor_contours),
+                "tumor_detected": len(regions) > 0,
+                "number_of_tumors": len(regions),
                 "tumor_area_percentage": round(tumor_percentage, 2),
-                "confidence": min(95, len(tumor_contours) * 20)  # Simple confidence metric
+                "confidence": min(95, len(regions) * 20)  # Simple confidence metric
             },
             "visualization": {
-                "overlay": f"data:image/png;base64,{overlay_base64}",
+                "overlay": overlay,
                 "original_size": image.shape[:2],
-                "tumor_regions": [cv2.boundingRect(c) for c in tumor_contours]
+                "tumor_regions": regions
             }
         }
     
-    def _analyze_retinal(self, image: np.ndarray) -> Dict:
+    def _analyze_retinal(self, features: ImageFeatures) -> Dict:
         """Analyze retinal images for diseases like diabetic retinopathy."""
         # Placeholder for actual model inference
         # In a real implementation, you would use a pre-trained model
         
         # Simple color-based analysis for demonstration
-        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+        image, hsv = features.image, features.hsv
         
         # Define color ranges for different retinal features
         # These are just example ranges and would need to be calibrated
@@ -196,9 +412,6 @@ class MedicalImageAnalyzer:
         overlay = image.copy()
         overlay[red_mask > 0] = [0, 0, 255]  # Highlight in red
         
-        _, buffer = cv2.imencode('.png', overlay)
-        overlay_base64 = base64.b64encode(buffer).decode('utf-8')
-        
         return {
             "status": "success",
             "analysis_type": "retinal_analysis",
@@ -208,19 +421,18 @@ class MedicalImageAnalyzer:
                 "confidence": min(95, red_percentage * 5)  # Simple confidence metric
             },
             "visualization": {
-                "overlay": f"data:image/png;base64,{overlay_base64}",
+                "overlay": overlay,
                 "original_size": image.shape[:2]
             }
         }
     
-    def _detect_organ_abnormalities(self, image: np.ndarray) -> Dict:
+    def _detect_organ_abnormalities(self, features: ImageFeatures) -> Dict:
         """Detect abnormalities in organ images (liver, kidney, etc.)."""
         # Placeholder for actual model inference
         # In a real implementation, you would use organ-specific models
         
         # Simple edge detection for demonstration
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        edges = cv2.Canny(gray, 100, 200)
+        image, edges = features.image, features.edges(100, 200)
         
         # Count edge pixels as a simple abnormality indicator
         edge_pixels = cv2.countNonZero(edges)
@@ -231,9 +443,6 @@ class MedicalImageAnalyzer:
         overlay = cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR)
         overlay = cv2.addWeighted(image, 0.7, overlay, 0.3, 0)
         
-        _, buffer = cv2.imencode('.png', overlay)
-        overlay_base64 = base64.b64encode(buffer).decode('utf-8')
-        
         return {
             "status": "success",
             "analysis_type": "organ_abnormality_detection",
@@ -243,7 +452,7 @@ class MedicalImageAnalyzer:
                 "confidence": min(95, edge_percentage)  # Simple confidence metric
             },
             "visualization": {
-                "overlay": f"data:image/png;base64,{overlay_base64}",
+                "overlay": overlay,
                 "original_size": image.shape[:2]
             }
         }
@@ -0,0 +1,117 @@
+# backend/services/batch_prediction.py
+
+import io
+import os
+import zipfile
+from contextlib import ExitStack
+from functools import partial
+import torch
+from fastapi import HTTPException
+from models.image_io import get_decode_pool
+from models.dicom_io import is_zip
+from services.prediction_cache import cached_predictions
+from services.uploads import sniff_content_type
+
+IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/bmp')
+
+
+def image_mime_type(data) -> str:
+    """MIME type from the file's magic bytes (not its name or declared type); None if not an image we read."""
+    content_type = sniff_content_type(data)
+    return content_type if content_type in IMAGE_TYPES else None
+
+def batch_limit() -> int:
+    """Images per forward pass (BATCH_PREDICT_MAX_SIZE, default 8)."""
+    return max(1, int(os.getenv("BATCH_PREDICT_MAX_SIZE", "8")))
+
+def max_batch_files() -> int:
+    """Most images one batch request may carry, zip members included (BATCH_PREDICT_MAX_FILES)."""
+    return int(os.getenv("BATCH_PREDICT_MAX_FILES", "256"))
+
+def max_batch_bytes() -> int:
+    """
+    Most bytes one batch request may carry (BATCH_PREDICT_MAX_MB, default
+    200): the uploads as sent, and again their images once unzipped.
+    """
+    return int(float(os.getenv("BATCH_PREDICT_MAX_MB", "200")) * 2**20)
+
+def max_image_bytes() -> int:
+    """Largest single image in a batch, zip members included (BATCH_PREDICT_MAX_IMAGE_MB, default 20)."""
+    return int(float(os.getenv("BATCH_PREDICT_MAX_IMAGE_MB", "20")) * 2**20)
+
+
+class BatchTooLarge(HTTPException):
+    """Raised when a batch request exceeds the file count or size limits."""
+
+    def __init__(self, detail: str):
+        super().__init__(status_code=413, detail=detail)
+
+
+def expand_uploads(uploads) -> list:
+    """
+    (filename, bytes) for every file in `uploads`, a list of (filename, bytes)
+    where each upload is an image or a zip of them. Zip members keep their
+    archive path as filename, in archive order; folders are skipped.
+
+    Raises BatchTooLarge past max_batch_files(), max_image_bytes() or
+    max_batch_bytes(). Zip members are checked against the sizes in the
+    archive's directory before any is decompressed (zipfile stops reading a
+    member at its declared size, so the directory cannot understate it).
+    """
+    max_files, max_image, max_total = max_batch_files(), max_image_bytes(), max_batch_bytes()
+
+    # Every limit is checked across all uploads before anything is decompressed
+    entries, total = [], 0
+    with ExitStack() as stack:
+        for name, data in uploads:
+            if is_zip(data):
+                archive = stack.enter_context(zipfile.ZipFile(io.BytesIO(data)))
+                members = [(f"{name}/{info.filename}", info.file_size, partial(archive.read, info))
+                           for info in archive.infolist() if not info.is_dir()]
+            else:
+                members = [(name, len(data), lambda data=data: data)]
+            if len(entries) + len(members) > max_files:
+                raise BatchTooLarge(f"At most {max_files} images per batch.")
+            for member, size, _ in members:
+                if size > max_image:
+                    raise BatchTooLarge(f"{member} is too large. Maximum size is {max_image // 2**20}MB per image.")
+                total += size
+            if total > max_total:
+                raise BatchTooLarge(f"Batch too large. Maximum size is {max_total // 2**20}MB of images.")
+            entries += members
+        return [(name, read()) for name, _, read in entries]
+
+
+def _prepare(preprocess, data):
+    if image_mime_type(data) is None:
+        return None
+    try:
+        return preprocess.prepare(data)
+    except Exception:  # truncated or corrupt image: report it for this file only
+        return None
+
+def predict_images(modality: str, mode: str, images, preprocess, run_batch, **params) -> list:
+    """
+    Predictions for many encoded images, in order; None for an image that
+    is not a JPEG/PNG/BMP or cannot be decoded.
+
+    Images already in the prediction cache (keyed with `params`, as the
+    single-image route keys them) skip the model. The rest are decoded and
+    resized in parallel on the shared decode pool, then normalized into one
+    reused (N, 3, H, W) buffer and passed to `run_batch(batch)` at most
+    batch_limit() at a time; it returns one prediction list per row.
+    """
+    def compute_many(sources):
+        prepared = list(get_decode_pool().map(lambda data: _prepare(preprocess, data), sources))
+        results = [None] * len(sources)
+        decoded = [i for i, pixels in enumerate(prepared) if pixels is not None]
+        limit = batch_limit()
+        buffer = torch.empty((min(limit, len(decoded)), 3, *preprocess.size), dtype=torch.float32)
+        for start in range(0, len(decoded), limit):
+            chunk = decoded[start:start + limit]
+            batch = preprocess.batch([prepared[i] for i in chunk], out=buffer)
+            for i, preds in zip(chunk, run_batch(batch)):
+                results[i] = preds
+        return results
+
+    return cached_predictions(modality, mode, images, compute_many, **params)
@@ -1,29 +1,45 @@
 import os
 import torch
 from pathlib import Path
-from models.ct_model import load_ct_model, predict_ct
+from models.ct_model import (load_ct_model, predict_ct, predict_ct_2d_batch, ct_transforms_2d,
+                             CT_2D_WEIGHTS_PATH, CT_3D_WEIGHTS_PATH)
+from services.prediction_cache import cached_prediction
+from services.batch_prediction import predict_images
+from models.runtime import load_for_serving, serving_variant
+from models.sliding_window import volume_variant
+from services.model_registry import get_model_registry, register_model, dummy_forward
 
-# Cache
-_ct_models = {}
+# Loaded lazily on first use (or at startup via MODEL_WARMUP)
+CT_MODES = ('2d', '3d')
+CT_WEIGHTS = {'2d': CT_2D_WEIGHTS_PATH, '3d': CT_3D_WEIGHTS_PATH}
+
+def _load_ct_model(mode: str, device: str = "cpu"):
+    return load_for_serving(f'ct{mode}', lambda: load_ct_model(mode=mode, device=device), CT_WEIGHTS[mode], device)
+
+register_model('ct2d', 'ct', lambda: _load_ct_model('2d'),
+               warmup=dummy_forward(1, 3, 224, 224),
+               weight_paths=[CT_2D_WEIGHTS_PATH])
+register_model('ct3d', 'ct', lambda: _load_ct_model('3d'),
+               warmup=dummy_forward(1, 1, 64, 224, 224),
+               weight_paths=[CT_3D_WEIGHTS_PATH])
 
 # Initialize
 def init_ct_models(device: str = "cpu") -> None:
     """
-    Load and cache both 2D and 3D CT models into memory.
-    Call this once at application startup.
+    Load both 2D and 3D CT models now instead of on their first request.
+    Safe to call repeatedly and from several threads; only the first call loads.
     """
-    # Load 2D model
-    _ct_models['2d'] = load_ct_model(mode='2d', device=device)
-    # Load 3D model
-    _ct_models['3d'] = load_ct_model(mode='3d', device=device)
+    for mode in CT_MODES:
+        get_model_registry().get(f"ct{mode}", loader=lambda mode=mode: _load_ct_model(mode, device))
 
 # Process
-def process_ct(image_path: str, mode: str = '2d', device: str = "cpu"):
+def process_ct(image, mode: str = '2d', device: str = "cpu"):
     """
     Process a CT image or volume and return predictions.
 
     Args:
-        image_path: Path to the CT image file (2D slice) or NIfTI/DICOM volume.
+        image: 2D slice as a path, raw bytes, file-like object or PIL image;
+            for '3d', a path to a NIfTI volume or an opened NiftiVolume.
         mode: '2d' for slice classification, '3d' for volume analysis.
         device: Device to run inference on ('cpu' or 'cuda').
 
@@ -31,15 +47,31 @@ def process_ct(image_path: str, mode: str = '2d', device: str = "cpu"):
         For '2d': List of (class, probability) tuples sorted by probability.
         For '3d': Raw model output array (e.g., segmentation map or logits).
     """
-    if mode not in _ct_models:
+    if mode not in CT_MODES:
         raise ValueError(f"Unsupported mode '{mode}'. Choose '2d' or '3d'.")
 
-    model = _ct_models[mode]
-    # Run prediction
-    results = predict_ct(model, image_path, mode=mode, device=device)
+    # Run prediction (served from the content-hash cache for repeat uploads)
+    results = cached_prediction(
+        'ct', mode, image,
+        lambda: predict_ct(get_model_registry().get(f"ct{mode}"), image, mode=mode, device=device),
+        variant=serving_variant(f"ct{mode}", CT_WEIGHTS[mode]),
+        # Volumes resampled or patched differently give different inputs
+        **({'resample': volume_variant()} if mode == '3d' else {}),
+    )
     return results
 
+def process_ct_batch(images, device: str = "cpu") -> list:
+    """
+    2D CT classification of many encoded slices in batched forward passes.
+    One [(class, probability)] per image, in order; None where an image could not be read.
+    """
+    return predict_images(
+        'ct', '2d', images, ct_transforms_2d,
+        lambda batch: predict_ct_2d_batch(get_model_registry().get("ct2d"), batch, device=device),
+        variant=serving_variant("ct2d", CT_WEIGHTS['2d']),
+    )
+
 # Validator
 def is_supported_ct_file(fn, mode):
     ext = Path(fn).suffix.lower()
-    return ext in (['.png','.jpg','.jpeg'] if mode=='2d' else ['.nii','.nii.gz','.dcm'])
\ No newline at end of file
+    return ext in (['.png','.jpg','.jpeg'] if mode=='2d' else ['.nii','.nii.gz','.dcm','.zip'])
\ No newline at end of file
@@ -0,0 +1,162 @@
+# backend/services/executor.py
+
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+
+
+class PoolSaturated(HTTPException):
+    """Raised when a pool's worker and queue capacity are both exhausted."""
+
+    def __init__(self, pool_name: str, retry_after: int):
+        super().__init__(
+            status_code=503,
+            detail=f"Server busy: {pool_name} pool is at capacity. Please retry shortly.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class BoundedPool:
+    """
+    Thread pool with a hard cap on in-flight work.
+
+    At most `max_workers` calls run at once and at most `max_queue` more may
+    wait for a worker. Anything beyond that is rejected immediately with
+    PoolSaturated so the event loop never piles up unbounded work.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, retry_after: int = 2):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-pool")
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+
+        # Metrics
+        self._in_flight = 0
+        self._active = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._busy_seconds = 0.0
+        self._queue_wait_seconds = 0.0
+        self._peak_in_flight = 0
+
+    def _acquire(self) -> None:
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise PoolSaturated(self.name, self.retry_after)
+            self._in_flight += 1
+            self._submitted += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+
+    def _run(self, fn, enqueued_at: float):
+        started = time.monotonic()
+        with self._lock:
+            self._active += 1
+            self._queue_wait_seconds += started - enqueued_at
+        ok = False
+        try:
+            result = fn()
+            ok = True
+            return result
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._in_flight -= 1
+                self._busy_seconds += time.monotonic() - started
+                if ok:
+                    self._completed += 1
+                else:
+                    self._failed += 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Run a blocking callable on this pool and await its result."""
+        self._acquire()
+        call = functools.partial(fn, *args, **kwargs)
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self._executor, self._run, call, time.monotonic())
+        except RuntimeError:
+            # Executor already shut down; release the slot taken above
+            with self._lock:
+                self._in_flight -= 1
+            raise
+        return await future
+
+    def stats(self) -> dict:
+        with self._lock:
+            uptime = max(time.monotonic() - self._started_at, 1e-9)
+            finished = self._completed + self._failed
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "queued": self._in_flight - self._active,
+                "peak_in_flight": self._peak_in_flight,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "utilisation": round(self._busy_seconds / (uptime * self.max_workers), 4),
+                "avg_run_ms": round(self._busy_seconds * 1000.0 / finished, 3) if finished else 0.0,
+                "avg_queue_wait_ms": round(self._queue_wait_seconds * 1000.0 / self._submitted, 3) if self._submitted else 0.0,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+def get_pool(name: str) -> BoundedPool:
+    """
+    Return the named pool, creating it on first use.
+
+    'inference' is for CPU-bound model work and defaults to one worker per core
+    (INFERENCE_WORKERS / INFERENCE_QUEUE_SIZE). 'io' is for blocking network and
+    disk calls such as Gemini requests (IO_WORKERS / IO_QUEUE_SIZE).
+    """
+    with _pools_lock:
+        if name not in _pools:
+            retry_after = _env_int("POOL_RETRY_AFTER", 2)
+            if name == "inference":
+                workers = _env_int("INFERENCE_WORKERS", os.cpu_count() or 1)
+                _pools[name] = BoundedPool(name, workers, _env_int("INFERENCE_QUEUE_SIZE", workers * 4), retry_after)
+            elif name == "io":
+                workers = _env_int("IO_WORKERS", 16)
+                _pools[name] = BoundedPool(name, workers, _env_int("IO_QUEUE_SIZE", workers * 4), retry_after)
+            else:
+                raise ValueError(f"Unknown pool '{name}'. Choose 'inference' or 'io'.")
+        return _pools[name]
+
+async def run_inference(fn, *args, **kwargs):
+    """Run CPU-bound model inference off the event loop."""
+    return await get_pool("inference").run(fn, *args, **kwargs)
+
+async def run_blocking_io(fn, *args, **kwargs):
+    """Run blocking I/O (e.g. Gemini calls) off the event loop."""
+    return await get_pool("io").run(fn, *args, **kwargs)
+
+def get_pool_stats() -> dict:
+    with _pools_lock:
+        return {name: pool.stats() for name, pool in _pools.items()}
+
+def shutdown_pools() -> None:
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown()
+        _pools.clear()
@@ -0,0 +1,376 @@
+# backend/services/model_registry.py
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from fastapi import HTTPException
+from models.weight_cache import recording_reads
+from services.prediction_cache import forget_model_version
+
+# Modalities a deployment can serve; MEDINSIGHT_MODALITIES picks a subset
+MODALITIES = ('xray', 'ct', 'mri', 'ultrasound')
+
+
+class ModelDisabled(HTTPException):
+    """Raised when a model's modality is not enabled on this deployment."""
+
+    def __init__(self, name: str, modality: str):
+        super().__init__(
+            status_code=404,
+            detail=f"Modality '{modality}' is not enabled on this server (model '{name}').",
+        )
+
+
+def parameter_bytes(model) -> int:
+    """Bytes held by a module's weights, read from its state dict so packed
+    (e.g. quantized) parameters are counted too. Exported models that hide
+    their weights report them as `weight_bytes`."""
+    if hasattr(model, "weight_bytes"):
+        return model.weight_bytes
+    def size(value):
+        if isinstance(value, (tuple, list)):
+            return sum(size(v) for v in value)
+        if hasattr(value, "numel") and hasattr(value, "element_size"):
+            return value.numel() * value.element_size()
+        return 0
+    return sum(size(v) for v in model.state_dict().values())
+
+
+def dummy_forward(*shape):
+    """Warm-up hook running one no-grad forward pass on zeros of `shape`."""
+    def warmup(model):
+        import torch
+        with torch.no_grad():
+            model(torch.zeros(*shape))
+    return warmup
+
+
+def files_size(paths) -> int:
+    """Total size of the files in `paths` that exist."""
+    return sum(os.path.getsize(p) for p in paths if os.path.isfile(p))
+
+
+class _Entry:
+    __slots__ = ("name", "modality", "loader", "warmup", "weight_paths", "lock", "model", "bytes",
+                 "loads", "last_load_ms", "bytes_read")
+
+    def __init__(self, name, modality, loader, warmup, weight_paths):
+        self.name = name
+        self.modality = modality
+        self.loader = loader
+        self.warmup = warmup
+        self.weight_paths = tuple(weight_paths)
+        self.lock = threading.Lock()
+        self.model = None
+        self.bytes = 0
+        self.loads = 0
+        self.last_load_ms = 0.0
+        self.bytes_read = 0
+
+
+class ModelRegistry:
+    """
+    Loads models on first use and keeps them under a memory budget.
+
+    Each model is registered with a zero-argument loader. `get` loads it the
+    first time it is asked for (concurrent first requests share one load) and
+    marks it most recently used. When the parameter memory of the loaded
+    models exceeds `memory_budget_bytes`, the least recently used ones are
+    dropped; they are reloaded on their next use. A budget of 0 never evicts.
+
+    Models whose modality is not in `enabled` are never loaded; asking for
+    them raises ModelDisabled.
+
+    The registry is the only owner of model lifecycle: loads are serialized
+    per model, so a model is deserialized once however many callers (startup
+    warm-up, init_* helpers, requests) ask for it. Every load is recorded in
+    `load_log` with its duration and the bytes of weights it read.
+    """
+
+    def __init__(self, memory_budget_bytes: int = 0, enabled=MODALITIES):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.enabled = set(enabled)
+        self._entries = {}
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "loads": 0, "evictions": 0, "load_failures": 0}
+        self.load_log = deque(maxlen=100)
+
+    def register(self, name: str, modality: str, loader, warmup=None, weight_paths=()) -> None:
+        """
+        Register `loader` under `name`. `warmup(model)` is optional and runs
+        once after each load, e.g. a dummy forward pass. `weight_paths` are the
+        files the loader reads, for the bytes-read figure in `load_log`.
+        """
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = _Entry(name, modality, loader, warmup, weight_paths)
+
+    def is_enabled(self, name: str) -> bool:
+        entry = self._entries.get(name)
+        return entry is not None and entry.modality in self.enabled
+
+    def _entry(self, name: str) -> _Entry:
+        entry = self._entries.get(name)
+        if entry is None:
+            raise KeyError(f"Unknown model '{name}'. Registered: {sorted(self._entries)}")
+        if entry.modality not in self.enabled:
+            raise ModelDisabled(name, entry.modality)
+        return entry
+
+    def get(self, name: str, loader=None, run_warmup: bool = True):
+        """
+        Return the loaded model for `name`, loading it if needed.
+
+        `loader` overrides the registered loader for this load only (e.g. a
+        different device); it is not called if the model is already loaded.
+        `run_warmup=False` skips the warm-up hook (e.g. before forking workers).
+        """
+        entry = self._entry(name)
+        with self._lock:
+            if entry.model is not None:
+                self._loaded.move_to_end(name)
+                self._counters["hits"] += 1
+                return entry.model
+
+        # Per-model lock: one thread loads, the others wait for it
+        with entry.lock:
+            if entry.model is not None:
+                with self._lock:
+                    self._loaded.move_to_end(name)
+                    self._counters["hits"] += 1
+                return entry.model
+
+            started = time.perf_counter()
+            try:
+                with recording_reads() as opened:
+                    model = (loader or entry.loader)()
+                if run_warmup and entry.warmup is not None:
+                    entry.warmup(model)
+            except Exception as e:
+                with self._lock:
+                    self._counters["load_failures"] += 1
+                    self.load_log.append({
+                        "model": name, "ok": False, "error": str(e), "at": time.time(),
+                        "load_ms": round((time.perf_counter() - started) * 1000.0, 3),
+                    })
+                raise
+            # What the loader opened (e.g. a mapped converted copy, not the original pickle); loaders
+            # outside weight_cache and the runtime record nothing and are assumed to read their weight files
+            bytes_read = files_size(dict.fromkeys(opened)) if opened else files_size(entry.weight_paths)
+            self._install(entry, model, (time.perf_counter() - started) * 1000.0, bytes_read)
+            return model
+
+    def put(self, name: str, model) -> None:
+        """Install an already-built model (tests, benchmarks), bypassing its loader."""
+        entry = self._entry(name)
+        with entry.lock:
+            self._install(entry, model, 0.0, 0)
+
+    def _install(self, entry: _Entry, model, load_ms: float, bytes_read: int) -> None:
+        with self._lock:
+            entry.model = model
+            entry.bytes = parameter_bytes(model)
+            entry.loads += 1
+            entry.last_load_ms = load_ms
+            entry.bytes_read = bytes_read
+            self._counters["loads"] += 1
+            self.load_log.append({
+                "model": entry.name, "ok": True, "at": time.time(),
+                "load_ms": round(load_ms, 3), "bytes_read": bytes_read, "parameter_bytes": entry.bytes,
+            })
+            self._loaded[entry.name] = entry
+            self._loaded.move_to_end(entry.name)
+            self._evict(keep=entry.name)
+        # The weights may have changed on disk since the last load
+        forget_model_version(entry.modality)
+
+    def _evict(self, keep: str) -> None:
+        if self.memory_budget_bytes <= 0:
+            return
+        while self._resident_bytes() > self.memory_budget_bytes and len(self._loaded) > 1:
+            name = next(iter(self._loaded))
+            if name == keep:
+                break
+            self._drop(name)
+            self._counters["evictions"] += 1
+
+    def _drop(self, name: str) -> None:
+        entry = self._loaded.pop(name)
+        entry.model = None
+        entry.bytes = 0
+
+    def _resident_bytes(self) -> int:
+        return sum(entry.bytes for entry in self._loaded.values())
+
+    def unload(self, name: str) -> None:
+        with self._lock:
+            if name in self._loaded:
+                self._drop(name)
+
+    def warm(self, names=None, run_warmup: bool = True) -> dict:
+        """
+        Load `names` (default: every enabled model) ahead of traffic.
+        Returns {name: error message} for models that failed to load.
+        """
+        if names is None:
+            names = [n for n in self._entries if self.is_enabled(n)]
+        errors = {}
+        for name in names:
+            if not self.is_enabled(name):
+                continue
+            try:
+                self.get(name, run_warmup=run_warmup)
+            except Exception as e:
+                errors[name] = str(e)
+        return errors
+
+    def loaded_models(self) -> dict:
+        with self._lock:
+            return {name: entry.model for name, entry in self._loaded.items()}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._counters,
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "resident_bytes": self._resident_bytes(),
+                "enabled_modalities": sorted(self.enabled),
+                "models": {
+                    name: {
+                        "modality": entry.modality,
+                        "enabled": entry.modality in self.enabled,
+                        "loaded": entry.model is not None,
+                        "parameter_bytes": entry.bytes,
+                        "loads": entry.loads,
+                        "last_load_ms": round(entry.last_load_ms, 3),
+                        "bytes_read": entry.bytes_read,
+                    }
+                    for name, entry in self._entries.items()
+                },
+                "lru_order": list(self._loaded),
+            }
+
+
+def _enabled_modalities():
+    raw = os.getenv("MEDINSIGHT_MODALITIES", "")
+    if not raw.strip() or raw.strip().lower() == "all":
+        return MODALITIES
+    names = [m.strip().lower() for m in raw.split(",") if m.strip()]
+    unknown = set(names) - set(MODALITIES)
+    if unknown:
+        raise ValueError(f"Unknown modalities in MEDINSIGHT_MODALITIES: {sorted(unknown)}")
+    return names
+
+
+_registry = None
+_registry_lock = threading.Lock()
+_registrations = {}
+
+def register_model(name: str, modality: str, loader, warmup=None, weight_paths=()) -> None:
+    """
+    Declare a model for the process-wide registry. Services call this at
+    import; nothing is loaded until the model is first used.
+    """
+    with _registry_lock:
+        _registrations[name] = (modality, loader, warmup, weight_paths)
+        if _registry is not None:
+            _registry.register(name, modality, loader, warmup, weight_paths)
+
+def get_model_registry() -> ModelRegistry:
+    """
+    Process-wide model registry, created on first use so settings from .env
+    apply. MEDINSIGHT_MODALITIES (comma-separated, default all) chooses which
+    modalities this deployment serves and MODEL_MEMORY_BUDGET_MB caps resident
+    parameter memory (0 or unset: no cap).
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            budget_mb = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0") or 0)
+            _registry = ModelRegistry(
+                memory_budget_bytes=int(budget_mb * 1024 * 1024),
+                enabled=_enabled_modalities(),
+            )
+            for name, (modality, loader, warmup, weight_paths) in _registrations.items():
+                _registry.register(name, modality, loader, warmup, weight_paths)
+        return _registry
+
+def get_model(name: str):
+    return get_model_registry().get(name)
+
+_startup = {}
+
+def warm_up_models() -> dict:
+    """
+    Load the models named in MODEL_WARMUP at startup: a comma-separated list
+    of model names, 'all' for every enabled model, or unset for none (lazy).
+    Timings are kept for `get_startup_report`.
+    """
+    started_at = time.time()
+    started = time.perf_counter()
+    raw = os.getenv("MODEL_WARMUP", "").strip().lower()
+    registry = get_model_registry()
+    if not raw or raw in ("0", "none", "false", "no"):
+        names, errors = [], {}
+    else:
+        names = list(registry.stats()["models"]) if raw == "all" else [n.strip() for n in raw.split(",") if n.strip()]
+        names = [n for n in names if registry.is_enabled(n)]
+        errors = registry.warm(names)
+    for name, error in errors.items():
+        print(f"Warning: could not warm up model '{name}': {error}")
+
+    _startup.update({
+        "started_at": started_at,
+        "warmup_ms": round((time.perf_counter() - started) * 1000.0, 3),
+        "warmup": names,
+        "errors": errors,
+    })
+    return errors
+
+def preload_for_fork(share_memory: bool = False) -> dict:
+    """
+    Load every enabled model in a parent process that is about to fork
+    workers, so the workers inherit the weights instead of loading their own.
+
+    Warm-up forward passes are skipped: running a parallel region before
+    fork can leave the workers' OpenMP thread pool unusable. Forked workers
+    share the weight pages copy-on-write; with `share_memory`, the tensors
+    are moved into shared memory instead, so nothing can duplicate them.
+    """
+    started = time.perf_counter()
+    registry = get_model_registry()
+    errors = registry.warm(run_warmup=False)
+    for name, error in errors.items():
+        print(f"Warning: could not preload model '{name}': {error}")
+    if share_memory:
+        for model in registry.loaded_models().values():
+            model.share_memory()
+
+    _startup.update({
+        "preloaded_in_parent": sorted(registry.loaded_models()),
+        "preload_ms": round((time.perf_counter() - started) * 1000.0, 3),
+        "shared_memory": share_memory,
+    })
+    return errors
+
+def get_startup_report() -> dict:
+    """
+    Boot timing: how long warm-up took and, per model, every load so far
+    (milliseconds and bytes of weights read). A model appearing more than
+    once in `loads` was deserialized more than once.
+    """
+    registry = get_model_registry()
+    loads = {}
+    for event in list(registry.load_log):
+        loads.setdefault(event["model"], []).append(event)
+    return {
+        **_startup,
+        "total_load_ms": round(sum(e["load_ms"] for e in registry.load_log if e["ok"]), 3),
+        "total_bytes_read": sum(e.get("bytes_read", 0) for e in registry.load_log),
+        "loads": loads,
+    }
+
+def get_model_registry_stats() -> dict:
+    return get_model_registry().stats()
@@ -1,27 +1,42 @@
 from pathlib import Path
-from models.mri_model import load_mri_model, predict_mri
+from models.mri_model import load_mri_model, predict_mri, WEIGHT_MRI_2D, WEIGHT_MRI_3D
+from services.prediction_cache import cached_prediction
+from models.runtime import load_for_serving, serving_variant
+from models.sliding_window import volume_variant
+from services.model_registry import get_model_registry, register_model, dummy_forward
 
 # Resolve backend root (one level up from services/)
 BACKEND_ROOT = Path(__file__).resolve().parents[1]
 
-# Cache
-_cache_mri = {}
+# Only 3D is served by default; register '2d' here too if needed.
+# Loaded lazily on first use (or at startup via MODEL_WARMUP)
+MRI_MODES = ('3d',)
+MRI_WEIGHTS = {'2d': WEIGHT_MRI_2D, '3d': WEIGHT_MRI_3D}
 
-def init_mri_models(device='cpu'):
-    # Load only 3D by default; uncomment 2D if needed
-    _cache_mri['3d'] = load_mri_model('3d', device)
+def _load_mri_model(mode: str, device: str = 'cpu'):
+    return load_for_serving(f'mri{mode}', lambda: load_mri_model(mode, device), MRI_WEIGHTS[mode], device)
+
+register_model('mri3d', 'mri', lambda: _load_mri_model('3d'),
+               warmup=dummy_forward(1, 1, 64, 224, 224),
+               weight_paths=[WEIGHT_MRI_3D])
 
-try:
-    init_mri_models()
-except FileNotFoundError as e:
-    # Print a clear warning but allow app to continue
-    print(f"Warning: {e}")
+def init_mri_models(device='cpu'):
+    # Safe to call repeatedly and from several threads; only the first call loads
+    for mode in MRI_MODES:
+        get_model_registry().get(f"mri{mode}", loader=lambda mode=mode: _load_mri_model(mode, device))
 
-def process_mri(path: str, mode: str = '3d', device: str = 'cpu', top_k: int = 2):
-    if mode not in _cache_mri:
+def process_mri(path, mode: str = '3d', device: str = 'cpu', top_k: int = 2):
+    """
+    `path` is a NIfTI path (or an opened NiftiVolume) for '3d'; '2d' also accepts raw bytes, a file-like object or a PIL image.
+    """
+    if mode not in MRI_MODES:
         raise ValueError(f"Unsupported mode '{mode}'. Choose '2d' or '3d'.")
-    return predict_mri(_cache_mri[mode], path, mode, device, top_k)
+    return cached_prediction(
+        'mri', mode, path,
+        lambda: predict_mri(get_model_registry().get(f"mri{mode}"), path, mode, device, top_k),
+        top_k=top_k, variant=serving_variant(f"mri{mode}", WEIGHT_MRI_3D), resample=volume_variant(),
+    )
 
 def is_supported_mri_file(filename: str, mode: str) -> bool:
     ext = Path(filename).suffix.lower()
-    return ext in (['.png', '.jpg', '.jpeg'] if mode == '2d' else ['.nii', '.nii.gz', '.dcm'])
+    return ext in (['.png', '.jpg', '.jpeg'] if mode == '2d' else ['.nii', '.nii.gz', '.dcm', '.zip'])
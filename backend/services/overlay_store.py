@@ -0,0 +1,162 @@
+# backend/services/overlay_store.py
+
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+import cv2
+import numpy as np
+
+OVERLAY_FORMATS = {
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+    "png": (".png", "image/png", None),
+}
+
+
+def _downscale(image: np.ndarray, max_dim: int) -> np.ndarray:
+    height, width = image.shape[:2]
+    if max_dim is None or max(height, width) <= max_dim:
+        return image
+    factor = max_dim / max(height, width)
+    size = (max(1, round(width * factor)), max(1, round(height * factor)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+def encode_overlay(image: np.ndarray, fmt: str = "webp", max_dim: int = None, quality: int = 80) -> bytes:
+    """Encode a BGR overlay, shrunk so its longer side is at most `max_dim`."""
+    ext, _, quality_flag = OVERLAY_FORMATS[fmt]
+    params = [quality_flag, int(quality)] if quality_flag is not None else []
+    ok, buffer = cv2.imencode(ext, _downscale(image, max_dim), params)
+    if not ok:
+        raise ValueError(f"Could not encode overlay as {fmt}")
+    return buffer.tobytes()
+
+
+class OverlayStore:
+    """
+    Analysis overlays kept as raw pixels under random IDs, so a result can
+    reference its overlay instead of inlining it. Nothing is encoded until
+    the overlay is fetched; each (format, max_dim, quality) rendering is
+    then kept with its overlay for repeat fetches.
+
+    The store is an LRU bounded by total bytes (pixels plus renderings);
+    entries also expire after `ttl_seconds`.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 2**20, ttl_seconds: float = 600.0):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # id -> [created, pixels, {rendering key: bytes}, size]
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"stored": 0, "rejected": 0, "renders": 0, "render_hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    def _drop(self, overlay_id: str, counter: str) -> None:
+        entry = self._entries.pop(overlay_id)
+        self._bytes -= entry[3]
+        self._counters[counter] += 1
+
+    def _evict(self) -> None:
+        now = time.time()
+        while self._entries:
+            overlay_id, entry = next(iter(self._entries.items()))
+            if self._bytes > self.max_bytes:
+                self._drop(overlay_id, "evictions")
+            elif self.ttl_seconds > 0 and now - entry[0] > self.ttl_seconds:
+                self._drop(overlay_id, "expired")
+            else:
+                break
+
+    def put(self, image: np.ndarray) -> Optional[str]:
+        """
+        Keep `image` (BGR uint8) and return its ID; None if it is larger
+        than the whole store, which could only evict it (and everything
+        else) at once.
+        """
+        pixels = np.ascontiguousarray(image)
+        if pixels.nbytes > self.max_bytes:
+            with self._lock:
+                self._counters["rejected"] += 1
+            return None
+        overlay_id = secrets.token_urlsafe(16)
+        with self._lock:
+            self._entries[overlay_id] = [time.time(), pixels, {}, pixels.nbytes]
+            self._bytes += pixels.nbytes
+            self._counters["stored"] += 1
+            self._evict()
+        return overlay_id
+
+    def _lookup(self, overlay_id: str):
+        entry = self._entries.get(overlay_id)
+        if entry is None:
+            self._counters["misses"] += 1
+            return None
+        if self.ttl_seconds > 0 and time.time() - entry[0] > self.ttl_seconds:
+            self._drop(overlay_id, "expired")
+            self._counters["misses"] += 1
+            return None
+        self._entries.move_to_end(overlay_id)
+        return entry
+
+    def get(self, overlay_id: str):
+        """The raw overlay pixels, or None if unknown, evicted or expired."""
+        with self._lock:
+            entry = self._lookup(overlay_id)
+            return None if entry is None else entry[1]
+
+    def render(self, overlay_id: str, fmt: str = "webp", max_dim: int = None, quality: int = 80):
+        """Encoded overlay bytes (see encode_overlay), or None if the overlay is gone."""
+        key = (fmt, max_dim, quality)
+        with self._lock:
+            entry = self._lookup(overlay_id)
+            if entry is None:
+                return None
+            if key in entry[2]:
+                self._counters["render_hits"] += 1
+                return entry[2][key]
+            pixels = entry[1]
+
+        # Encode outside the lock; two concurrent first fetches may both encode
+        data = encode_overlay(pixels, fmt, max_dim, quality)
+        with self._lock:
+            self._counters["renders"] += 1
+            if self._entries.get(overlay_id) is entry and key not in entry[2]:
+                entry[2][key] = data
+                entry[3] += len(data)
+                self._bytes += len(data)
+                self._evict()
+        return data
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._counters,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def overlay_delivery() -> str:
+    """Default overlay delivery for analysis results: 'inline' (base64 PNG) or 'url' (OVERLAY_DELIVERY)."""
+    return os.getenv("OVERLAY_DELIVERY", "inline").lower()
+
+def get_overlay_store() -> OverlayStore:
+    """
+    Return the process-wide overlay store, sized by OVERLAY_STORE_MAX_MB
+    and OVERLAY_STORE_TTL (seconds).
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = OverlayStore(
+                max_bytes=int(float(os.getenv("OVERLAY_STORE_MAX_MB", "256")) * 2**20),
+                ttl_seconds=float(os.getenv("OVERLAY_STORE_TTL", "600")),
+            )
+        return _store
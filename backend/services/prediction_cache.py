@@ -0,0 +1,305 @@
+# backend/services/prediction_cache.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from models.weight_cache import is_derived_file
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+MODEL_ASSETS_DIR = BACKEND_ROOT / 'model_assests'
+
+
+def weights_fingerprint(*paths: Path) -> str:
+    """
+    Cheap version tag for model weights: hashes the relative path, size and
+    mtime of every file under the given files/directories. Replacing a weight
+    file changes the tag, which changes every cache key built from it.
+    """
+    h = hashlib.sha256()
+    for root in paths:
+        root = Path(root)
+        # Converted copies and manifests are derived from the originals, so they don't count
+        files = [root] if root.is_file() else sorted(
+            p for p in root.rglob('*') if p.is_file() and not is_derived_file(p)
+        )
+        for f in files:
+            st = f.stat()
+            name = f.relative_to(MODEL_ASSETS_DIR) if f.is_relative_to(MODEL_ASSETS_DIR) else f
+            h.update(f"{name}|{st.st_size}|{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()[:16]
+
+
+_versions = {}
+_versions_lock = threading.Lock()
+
+def model_version(modality: str) -> str:
+    """
+    weights_fingerprint of the modality's weights under model_assests/,
+    computed on first use and again only after one of its models is
+    (re)loaded (see forget_model_version), not on every request.
+    """
+    with _versions_lock:
+        version = _versions.get(modality)
+    if version is None:
+        version = weights_fingerprint(MODEL_ASSETS_DIR / modality)
+        with _versions_lock:
+            _versions[modality] = version
+    return version
+
+def forget_model_version(modality: str) -> None:
+    """Called by the model registry whenever it loads a model of `modality`."""
+    with _versions_lock:
+        _versions.pop(modality, None)
+
+
+def digest_source(source):
+    """
+    SHA-256 of raw upload bytes or a file (a path, or an os.PathLike such as
+    an opened NiftiVolume); None for anything else (e.g. decoded images).
+    Sources that already carry a digest (bytes from read_upload, volumes
+    assembled in memory or opened with their upload's digest) are not hashed again.
+    """
+    if getattr(source, 'digest', None) is not None:
+        return source.digest
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(source).hexdigest()
+    if isinstance(source, (str, os.PathLike)):
+        h = hashlib.sha256()
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        return h.hexdigest()
+    return None
+
+
+def _to_tuples(value):
+    # JSON round-trips (label, prob) tuples as lists
+    return [tuple(item) if isinstance(item, list) else item for item in value]
+
+
+class PredictionCache:
+    """
+    Two-tier cache for model predictions.
+
+    The memory tier is a bounded LRU; the optional disk tier is a sqlite file
+    that survives restarts. Both tiers drop entries older than `ttl_seconds`.
+    Entries are tagged with the model version they were computed with, and
+    any entry whose version no longer matches is discarded on lookup.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 86400.0, disk_path=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = str(disk_path) if disk_path else None
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if self.disk_path:
+            Path(self.disk_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(self.disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "key TEXT PRIMARY KEY, version TEXT, created REAL, value TEXT)"
+            )
+            self._db.commit()
+
+        self._counters = {
+            "memory_hits": 0, "disk_hits": 0, "misses": 0,
+            "evictions": 0, "expired": 0, "invalidated": 0,
+        }
+
+    @staticmethod
+    def make_key(digest: str, modality: str, mode: str, **params) -> str:
+        extra = ",".join(f"{k}={params[k]}" for k in sorted(params))
+        return f"{modality}:{mode}:{digest}:{extra}"
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - created > self.ttl_seconds
+
+    def get(self, key: str, version: str):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                entry_version, created, value = entry
+                if entry_version != version:
+                    del self._memory[key]
+                    self._counters["invalidated"] += 1
+                elif self._expired(created):
+                    del self._memory[key]
+                    self._counters["expired"] += 1
+                else:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return value
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT version, created, value FROM predictions WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    entry_version, created, raw = row
+                    if entry_version == version and not self._expired(created):
+                        value = _to_tuples(json.loads(raw))
+                        self._store_memory(key, version, created, value)
+                        self._counters["disk_hits"] += 1
+                        return value
+                    self._db.execute("DELETE FROM predictions WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._counters["invalidated" if entry_version != version else "expired"] += 1
+
+            self._counters["misses"] += 1
+            return None
+
+    def _store_memory(self, key, version, created, value) -> None:
+        self._memory[key] = (version, created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def put(self, key: str, version: str, value) -> None:
+        created = time.time()
+        with self._lock:
+            self._store_memory(key, version, created, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO predictions (key, version, created, value) VALUES (?, ?, ?, ?)",
+                    (key, version, created, json.dumps(value)),
+                )
+                self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM predictions")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self._counters["memory_hits"] + self._counters["disk_hits"]
+            lookups = hits + self._counters["misses"]
+            return {
+                **self._counters,
+                "hits": hits,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "disk_path": self.disk_path,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def cache_enabled() -> bool:
+    return os.getenv("PREDICTION_CACHE", "1").lower() not in ("0", "false", "no")
+
+def get_prediction_cache() -> PredictionCache:
+    """
+    Return the process-wide prediction cache, configured from
+    PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL and PREDICTION_CACHE_DB
+    (a sqlite path; unset keeps the cache in memory only).
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PredictionCache(
+                max_entries=int(os.getenv("PREDICTION_CACHE_SIZE", "1024")),
+                ttl_seconds=float(os.getenv("PREDICTION_CACHE_TTL", "86400")),
+                disk_path=os.getenv("PREDICTION_CACHE_DB") or None,
+            )
+        return _cache
+
+def cached_prediction(modality: str, mode: str, source, compute, **params):
+    """
+    Return predictions for `source` from the cache, or run `compute()` and store them.
+
+    The key is the SHA-256 of the raw bytes plus modality, mode and extra
+    params; entries are versioned with model_version(modality).
+    Decoded images (no raw bytes to hash) bypass the cache.
+    """
+    if not cache_enabled():
+        return compute()
+    digest = digest_source(source)
+    if digest is None:
+        return compute()
+
+    cache = get_prediction_cache()
+    version = model_version(modality)
+    key = PredictionCache.make_key(digest, modality, mode, **params)
+    value = cache.get(key, version)
+    if value is not None:
+        return value
+    value = compute()
+    cache.put(key, version, value)
+    return value
+
+def cached_prediction_future(modality: str, mode: str, source, submit, **params) -> Future:
+    """
+    cached_prediction for work that finishes on another thread (e.g. the
+    X-ray micro-batcher): returns a Future instead of waiting. A hit comes
+    back already resolved; on a miss `submit()` returns the Future, and its
+    result is stored once it completes.
+    """
+    digest = digest_source(source) if cache_enabled() else None
+    if digest is None:
+        return submit()
+
+    cache = get_prediction_cache()
+    version = model_version(modality)
+    key = PredictionCache.make_key(digest, modality, mode, **params)
+    value = cache.get(key, version)
+    if value is not None:
+        done = Future()
+        done.set_result(value)
+        return done
+
+    def store(future):
+        if not future.cancelled() and future.exception() is None:
+            cache.put(key, version, future.result())
+
+    future = submit()
+    future.add_done_callback(store)
+    return future
+
+def cached_predictions(modality: str, mode: str, sources, compute_many, **params) -> list:
+    """
+    Batch form of cached_prediction: one result per source, in order.
+
+    Cache hits are answered directly; every miss is passed to a single
+    `compute_many(missing_sources)` call, which returns their results in
+    the same order. None results (inputs that could not be read) are not stored.
+    """
+    sources = list(sources)
+    if not cache_enabled():
+        return compute_many(sources)
+
+    cache = get_prediction_cache()
+    version = model_version(modality)
+    keys, results = [], []
+    for source in sources:
+        digest = digest_source(source)
+        key = PredictionCache.make_key(digest, modality, mode, **params) if digest is not None else None
+        keys.append(key)
+        results.append(cache.get(key, version) if key is not None else None)
+
+    missing = [i for i, value in enumerate(results) if value is None]
+    if missing:
+        for i, value in zip(missing, compute_many([sources[i] for i in missing])):
+            results[i] = value
+            if value is not None and keys[i] is not None:
+                cache.put(keys[i], version, value)
+    return results
+
+def get_prediction_cache_stats() -> dict:
+    if _cache is None:
+        return {"enabled": cache_enabled()}
+    return {"enabled": cache_enabled(), **_cache.stats()}
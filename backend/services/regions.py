@@ -0,0 +1,86 @@
+# backend/services/regions.py
+
+import cv2
+import numpy as np
+
+
+def box_iou(a, b) -> float:
+    """Intersection over union of two (x, y, w, h) boxes."""
+    w = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    h = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = w * h
+    return inter / (a[2] * a[3] + b[2] * b[3] - inter)
+
+
+def component_regions(mask: np.ndarray, min_area: float, max_area: float, connectivity: int = 8):
+    """
+    Connected components of a binary mask whose pixel count lies strictly
+    between min_area and max_area, from one connectedComponentsWithStats
+    pass. Returns (labels, ids, boxes, areas): the label image, the kept
+    labels, their (x, y, w, h) boxes as an (N, 4) array and their areas.
+    """
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=connectivity, ltype=cv2.CV_32S)
+    areas = stats[1:, cv2.CC_STAT_AREA]  # label 0 is the background
+    ids = np.flatnonzero((areas > min_area) & (areas < max_area)) + 1
+    return labels, ids, stats[ids, :4], stats[ids, cv2.CC_STAT_AREA]
+
+
+def component_mask(labels: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """uint8 mask (255) of the given labels of a label image."""
+    lookup = np.zeros(int(labels.max()) + 1, np.uint8)
+    lookup[ids] = 255
+    return lookup[labels]
+
+
+def contour_stats(contours):
+    """
+    Enclosed areas (as cv2.contourArea) and bounding boxes (as
+    cv2.boundingRect) of many contours at once: the points are concatenated
+    and reduced per contour in NumPy instead of two OpenCV calls each.
+    Returns (areas, boxes) with boxes an (N, 4) array.
+    """
+    if len(contours) == 0:
+        return np.zeros(0), np.zeros((0, 4), np.int64)
+    lengths = np.fromiter((len(c) for c in contours), np.intp, len(contours))
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    points = np.concatenate(contours).reshape(-1, 2).astype(np.int64)
+    x, y = points[:, 0], points[:, 1]
+    # Shoelace formula; each contour's last point wraps to its first
+    following = np.arange(1, len(points) + 1)
+    following[ends - 1] = starts
+    cross = x * y[following] - x[following] * y
+    areas = np.abs(np.add.reduceat(cross, starts)) / 2.0
+    low = np.minimum.reduceat(points, starts)
+    high = np.maximum.reduceat(points, starts)
+    return areas, np.hstack([low, high - low + 1])
+
+
+def merge_overlapping(boxes, scores, iou_threshold: float):
+    """
+    Non-maximum suppression that merges rather than drops: boxes are taken
+    by descending score, and every remaining box overlapping the taken one
+    by more than iou_threshold is absorbed into it (the kept box grows to
+    cover them). Returns (boxes, kept), the merged (x, y, w, h) boxes and
+    the index of the box each one started from.
+    """
+    boxes = np.asarray(boxes, np.float64).reshape(-1, 4)
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+    area = boxes[:, 2] * boxes[:, 3]
+    order = np.argsort(-np.asarray(scores, np.float64), kind="stable")
+    merged, kept = [], []
+    while order.size:
+        top, rest = order[0], order[1:]
+        w = np.minimum(x1[top], x1[rest]) - np.maximum(x0[top], x0[rest])
+        h = np.minimum(y1[top], y1[rest]) - np.maximum(y0[top], y0[rest])
+        inter = np.clip(w, 0, None) * np.clip(h, 0, None)
+        overlapping = inter > iou_threshold * (area[top] + area[rest] - inter)
+        group = np.append(rest[overlapping], top)
+        left, top_edge = x0[group].min(), y0[group].min()
+        merged.append((left, top_edge, x1[group].max() - left, y1[group].max() - top_edge))
+        kept.append(top)
+        order = rest[~overlapping]
+    return np.array(merged, np.float64).reshape(-1, 4), np.array(kept, np.intp)
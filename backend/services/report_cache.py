@@ -0,0 +1,168 @@
+# backend/services/report_cache.py
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+def report_cache_key(modality: str, template: str, symptoms, image_digest=None) -> str:
+    """
+    Build the cache key for a generated report.
+
+    The report only depends on the prompt template, the symptoms filled into
+    it and the image sent alongside, so those (plus the modality) are the key.
+    """
+    template_hash = hashlib.sha256(template.encode('utf-8')).hexdigest()[:16]
+    return "|".join([modality, template_hash, ",".join(symptoms), image_digest or "-"])
+
+
+class ReportCache:
+    """
+    TTL + LRU cache for generated reports with single-flight deduplication.
+
+    When several threads (or coroutines, via `aget_or_generate`) ask for the
+    same key at once, only the first one calls `generate`; the rest wait for
+    and share its result (or exception). Empty results are returned but never
+    stored.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._ainflight = {}
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "expired": 0, "errors": 0}
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        created, value = entry
+        if self.ttl_seconds > 0 and time.time() - created > self.ttl_seconds:
+            del self._entries[key]
+            self._counters["expired"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _store(self, key, value) -> None:
+        self._entries[key] = (time.time(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def get(self, key: str):
+        """Return the cached report for `key`, or None."""
+        with self._lock:
+            value = self._lookup(key)
+            self._counters["hits" if value is not None else "misses"] += 1
+            return value
+
+    def put(self, key: str, value) -> None:
+        """Store a report produced outside `get_or_generate` (e.g. assembled from a stream)."""
+        if not value:
+            return
+        with self._lock:
+            self._store(key, value)
+
+    def get_or_generate(self, key: str, generate):
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                self._counters["hits"] += 1
+                return value
+            future = self._inflight.get(key)
+            if future is not None:
+                self._counters["coalesced"] += 1
+                leader = False
+            else:
+                future = Future()
+                self._inflight[key] = future
+                self._counters["misses"] += 1
+                leader = True
+
+        if not leader:
+            return future.result()
+
+        try:
+            value = generate()
+        except BaseException as e:
+            with self._lock:
+                self._counters["errors"] += 1
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            if value:
+                self._store(key, value)
+            del self._inflight[key]
+        future.set_result(value)
+        return value
+
+    async def aget_or_generate(self, key: str, generate):
+        """Async variant: `generate` is a zero-argument coroutine function."""
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                self._counters["hits"] += 1
+                return value
+            task = self._ainflight.get(key)
+            if task is not None:
+                self._counters["coalesced"] += 1
+            else:
+                self._counters["misses"] += 1
+                task = asyncio.ensure_future(self._arun(key, generate))
+                self._ainflight[key] = task
+        # Shield the shared task so one caller disconnecting doesn't cancel it for the rest
+        return await asyncio.shield(task)
+
+    async def _arun(self, key: str, generate):
+        try:
+            value = await generate()
+        except BaseException:
+            with self._lock:
+                self._counters["errors"] += 1
+                del self._ainflight[key]
+            raise
+        with self._lock:
+            if value:
+                self._store(key, value)
+            del self._ainflight[key]
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._counters,
+                "entries": len(self._entries),
+                "in_flight": len(self._inflight) + len(self._ainflight),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+_report_cache = None
+_report_cache_lock = threading.Lock()
+
+def get_report_cache() -> ReportCache:
+    """Process-wide report cache, sized by REPORT_CACHE_SIZE and REPORT_CACHE_TTL (seconds)."""
+    global _report_cache
+    with _report_cache_lock:
+        if _report_cache is None:
+            _report_cache = ReportCache(
+                max_entries=int(os.getenv("REPORT_CACHE_SIZE", "256")),
+                ttl_seconds=float(os.getenv("REPORT_CACHE_TTL", "3600")),
+            )
+        return _report_cache
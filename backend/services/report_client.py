@@ -0,0 +1,432 @@
+# backend/services/report_client.py
+
+import asyncio
+import base64
+import json
+import os
+import random
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import httpx
+
+GEMINI_MODEL = "models/gemini-2.0-flash"
+
+
+class ReportUnavailable(RuntimeError):
+    """Raised when a report could not be generated upstream."""
+
+
+class CircuitOpen(ReportUnavailable):
+    """Raised without calling upstream while the circuit breaker is open."""
+
+
+# Backends
+
+class GenaiBackend:
+    """Google GenAI (Gemini) backend using the SDK's native async client."""
+
+    def __init__(self, api_key: Optional[str] = None, model: str = GEMINI_MODEL):
+        self.api_key = api_key
+        self.model = model
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google import genai
+            self._client = genai.Client(api_key=self.api_key or os.getenv("GEMINI_API_KEY"))
+        return self._client
+
+    async def generate(self, contents: list) -> Optional[str]:
+        response = await self.client.aio.models.generate_content(model=self.model, contents=contents)
+        return response.text if response is not None else None
+
+    async def stream(self, contents: list):
+        """Yield report text chunks as the model produces them."""
+        response = await self.client.aio.models.generate_content_stream(model=self.model, contents=contents)
+        async for chunk in response:
+            if chunk is not None and chunk.text:
+                yield chunk.text
+
+
+def serialize_contents(contents: list) -> list:
+    """Convert prompt strings and genai Parts into JSON for HTTP backends."""
+    items = []
+    for item in contents:
+        if isinstance(item, str):
+            items.append({"text": item})
+        elif getattr(item, "inline_data", None) is not None:
+            blob = item.inline_data
+            items.append({
+                "mime_type": blob.mime_type,
+                "data": base64.b64encode(blob.data).decode("ascii"),
+            })
+        elif getattr(item, "text", None) is not None:
+            items.append({"text": item.text})
+        else:
+            raise TypeError(f"Cannot serialize content item of type {type(item).__name__}")
+    return items
+
+
+class HttpBackend:
+    """
+    Backend that POSTs {"contents": [...]} to `<base_url>/generate` and reads
+    {"text": ...} back, or to `<base_url>/generate/stream` and reads one
+    {"text": ...} object per line. Used with stub_report_server.py for tests
+    and benchmarks.
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=None)
+        return self._client
+
+    async def generate(self, contents: list) -> Optional[str]:
+        res = await self.client.post("/generate", json={"contents": serialize_contents(contents)})
+        res.raise_for_status()
+        return res.json().get("text")
+
+    async def stream(self, contents: list):
+        async with self.client.stream("POST", "/generate/stream",
+                                      json={"contents": serialize_contents(contents)}) as res:
+            res.raise_for_status()
+            async for line in res.aiter_lines():
+                if line.strip():
+                    text = json.loads(line).get("text")
+                    if text:
+                        yield text
+
+
+# Resilience
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_seconds`. After that a single trial call is let through (half-open);
+    its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def acquire(self) -> Optional[str]:
+        """
+        Let a call through: returns "call" when closed, "trial" for the single
+        half-open trial, or None while rejecting calls.
+        """
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return "call"
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return "trial"
+            return None
+
+    def allow(self) -> bool:
+        return self.acquire() is not None
+
+    def release_trial(self) -> None:
+        """
+        End a trial that produced no outcome (the caller went away), so the
+        next call can try again; the breaker stays half-open.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError, httpx.TransportError)):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in (429, 500, 502, 503, 504)
+    code = getattr(exc, "code", None)
+    if isinstance(code, int):
+        return code in (429, 500, 502, 503, 504)
+    return isinstance(exc, ReportUnavailable)
+
+
+class ReportClient:
+    """
+    Async report-generation client.
+
+    Bounds in-flight upstream calls with a semaphore, applies a per-attempt
+    timeout, retries transient failures with full-jitter exponential backoff
+    and stops calling upstream while the circuit breaker is open.
+    """
+
+    def __init__(self, backend, max_concurrency: int = 8, timeout: float = 30.0,
+                 max_retries: int = 2, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight = 0
+        self._counters = {
+            "calls": 0, "successes": 0, "failures": 0,
+            "retries": 0, "timeouts": 0, "short_circuited": 0,
+        }
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def _attempt(self, contents: list) -> str:
+        async with self._semaphore:
+            self._in_flight += 1
+            try:
+                text = await asyncio.wait_for(self.backend.generate(contents), self.timeout)
+            finally:
+                self._in_flight -= 1
+        if not text:
+            raise ReportUnavailable("Empty response from report backend.")
+        return text
+
+    async def generate(self, contents: list) -> str:
+        """Generate report text, raising ReportUnavailable/CircuitOpen on failure."""
+        self._counters["calls"] += 1
+        permit = self.breaker.acquire()
+        if permit is None:
+            self._counters["short_circuited"] += 1
+            raise CircuitOpen("Report backend circuit is open.")
+
+        attempt = 0
+        settled = False
+        try:
+            while True:
+                try:
+                    text = await self._attempt(contents)
+                except Exception as e:
+                    if isinstance(e, asyncio.TimeoutError):
+                        self._counters["timeouts"] += 1
+                    if attempt < self.max_retries and _is_retryable(e) and self.breaker.state != "open":
+                        attempt += 1
+                        self._counters["retries"] += 1
+                        await asyncio.sleep(self._backoff(attempt))
+                        continue
+                    self._counters["failures"] += 1
+                    settled = True
+                    self.breaker.record_failure()
+                    if isinstance(e, ReportUnavailable):
+                        raise
+                    raise ReportUnavailable(f"Report generation failed: {type(e).__name__}: {e}") from e
+
+                self._counters["successes"] += 1
+                settled = True
+                self.breaker.record_success()
+                return text
+        finally:
+            # Cancelled: neither a success nor a failure of the backend
+            if not settled and permit == "trial":
+                self.breaker.release_trial()
+
+    async def _open_stream(self, contents: list):
+        """Start a stream and wait (bounded by `timeout`) for its first chunk."""
+        stream = self.backend.stream(contents)
+        try:
+            first = await asyncio.wait_for(stream.__anext__(), self.timeout)
+        except StopAsyncIteration:
+            raise ReportUnavailable("Empty response from report backend.")
+        except BaseException:
+            await stream.aclose()
+            raise
+        return first, stream
+
+    async def stream(self, contents: list):
+        """
+        Yield report text as it is generated.
+
+        Failures before the first chunk are retried like `generate`; once text
+        has been yielded a failure is raised as ReportUnavailable, since the
+        caller has already forwarded part of the report. Each chunk must arrive
+        within `timeout` seconds. Backends without `stream` yield their whole
+        `generate` result as one chunk.
+        """
+        if not hasattr(self.backend, "stream"):
+            yield await self.generate(contents)
+            return
+
+        self._counters["calls"] += 1
+        permit = self.breaker.acquire()
+        if permit is None:
+            self._counters["short_circuited"] += 1
+            raise CircuitOpen("Report backend circuit is open.")
+
+        attempt = 0
+        settled = False
+        try:
+            async with self._semaphore:
+                self._in_flight += 1
+                try:
+                    while True:
+                        try:
+                            first, stream = await self._open_stream(contents)
+                            break
+                        except Exception as e:
+                            if isinstance(e, asyncio.TimeoutError):
+                                self._counters["timeouts"] += 1
+                            if attempt < self.max_retries and _is_retryable(e) and self.breaker.state != "open":
+                                attempt += 1
+                                self._counters["retries"] += 1
+                                await asyncio.sleep(self._backoff(attempt))
+                                continue
+                            self._counters["failures"] += 1
+                            settled = True
+                            self.breaker.record_failure()
+                            if isinstance(e, ReportUnavailable):
+                                raise
+                            raise ReportUnavailable(f"Report generation failed: {type(e).__name__}: {e}") from e
+
+                    try:
+                        yield first
+                        while True:
+                            try:
+                                chunk = await asyncio.wait_for(stream.__anext__(), self.timeout)
+                            except StopAsyncIteration:
+                                break
+                            yield chunk
+                    except Exception as e:
+                        if isinstance(e, asyncio.TimeoutError):
+                            self._counters["timeouts"] += 1
+                        self._counters["failures"] += 1
+                        settled = True
+                        self.breaker.record_failure()
+                        raise ReportUnavailable(f"Report stream interrupted: {type(e).__name__}: {e}") from e
+                    finally:
+                        await stream.aclose()
+                finally:
+                    self._in_flight -= 1
+
+            self._counters["successes"] += 1
+            settled = True
+            self.breaker.record_success()
+        finally:
+            # Client disconnected (GeneratorExit) or cancelled: no verdict on the backend
+            if not settled and permit == "trial":
+                self.breaker.release_trial()
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "in_flight": self._in_flight,
+            "max_concurrency": self.max_concurrency,
+            "timeout": self.timeout,
+            "max_retries": self.max_retries,
+            "breaker": self.breaker.state,
+        }
+
+
+# The header line each modality's prompt asks for and its routes parse the finding from
+REPORT_FIELDS = {"xray": "Disease Expected"}
+
+def report_field(modality: str) -> str:
+    """'Disease Expected' for X-ray reports, 'Condition Detected' for every other modality."""
+    return REPORT_FIELDS.get(modality.lower(), "Condition Detected")
+
+def templated_report(modality: str, predictions: List[Tuple[str, float]]) -> str:
+    """
+    Plain report built from model predictions alone, used when the upstream
+    model is unavailable. Opens with the one header line the modality's
+    routes parse (see report_field).
+    """
+    numeric = [(label, prob) for label, prob in predictions if isinstance(prob, (int, float))]
+    if numeric:
+        label, prob = max(numeric, key=lambda x: x[1])
+        finding = f"{label}, with a confidence score of {prob * 100:.2f}%"
+    else:
+        label = predictions[0][0] if predictions else "Unknown"
+        finding = label
+    others = ", ".join(f"{l} ({p * 100:.2f}%)" for l, p in numeric if l != label)
+
+    lines = [
+        f"{report_field(modality)}: {label}",
+        f"The AI model analyzed the {modality} image and the most likely finding is {finding}.",
+    ]
+    if others:
+        lines.append(f"Other findings considered: {others}.")
+    lines.append(
+        "A detailed narrative report is temporarily unavailable, so this summary was generated "
+        "directly from the model scores."
+    )
+    lines.append(
+        "Disclaimer: This is an AI-generated preliminary result and must be verified by a "
+        "certified medical professional."
+    )
+    return "\n".join(lines)
+
+
+_report_client = None
+_report_client_lock = threading.Lock()
+
+def get_report_client() -> ReportClient:
+    """
+    Process-wide report client. REPORT_BACKEND selects 'genai' (default) or
+    'http' (REPORT_BACKEND_URL, e.g. a local stub_report_server.py). Limits come
+    from GEMINI_MAX_CONCURRENCY, GEMINI_TIMEOUT, GEMINI_RETRIES,
+    GEMINI_BREAKER_THRESHOLD and GEMINI_BREAKER_RESET.
+    """
+    global _report_client
+    with _report_client_lock:
+        if _report_client is None:
+            if os.getenv("REPORT_BACKEND", "genai").lower() == "http":
+                backend = HttpBackend(os.getenv("REPORT_BACKEND_URL", "http://127.0.0.1:8100"))
+            else:
+                backend = GenaiBackend()
+            _report_client = ReportClient(
+                backend,
+                max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")),
+                timeout=float(os.getenv("GEMINI_TIMEOUT", "30")),
+                max_retries=int(os.getenv("GEMINI_RETRIES", "2")),
+                breaker=CircuitBreaker(
+                    failure_threshold=int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5")),
+                    reset_seconds=float(os.getenv("GEMINI_BREAKER_RESET", "30")),
+                ),
+            )
+        return _report_client
+
+def set_report_client(client: ReportClient) -> None:
+    """Swap in a client with a different backend (tests, benchmarks)."""
+    global _report_client
+    with _report_client_lock:
+        _report_client = client
@@ -1,28 +1,63 @@
 from pathlib import Path
 import torch
-from models.ultrasound_model import load_ultrasound_model, predict_ultrasound
+from models.image_io import is_path
+from services.prediction_cache import cached_prediction
+from services.batch_prediction import predict_images
+from models.runtime import load_for_serving, serving_variant
+from services.model_registry import get_model_registry, get_model, register_model, dummy_forward
+from models.ultrasound_model import load_ultrasound_model, predict_ultrasound, predict_ultrasound_batch, ultrasound_transforms
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DEFAULT_ULTRASOUND_CHECKPOINT = PROJECT_ROOT / 'model_assests' / 'ultrasound' / 'USFM_latest.pth'
 
-_ultrasound_model = None
+def _load_ultrasound_model(device: str = 'cpu', checkpoint_path: Path = DEFAULT_ULTRASOUND_CHECKPOINT):
+    return load_for_serving(
+        'ultrasound', lambda: load_ultrasound_model(device=device, checkpoint_path=checkpoint_path),
+        checkpoint_path, device,
+    )
+
+# Loaded lazily on first use (or at startup via MODEL_WARMUP)
+register_model(
+    'ultrasound', 'ultrasound',
+    _load_ultrasound_model,
+    warmup=dummy_forward(1, 3, 224, 224),
+    weight_paths=[DEFAULT_ULTRASOUND_CHECKPOINT],
+)
 
 def init_ultrasound_model(device: str = 'cpu', checkpoint_path: Path = DEFAULT_ULTRASOUND_CHECKPOINT) -> None:
-    global _ultrasound_model
-    if not checkpoint_path.is_file():
-        raise FileNotFoundError(f"Ultrasound weights not found at {checkpoint_path}")
-    _ultrasound_model = load_ultrasound_model(device=device, checkpoint_path=(checkpoint_path))
+    """
+    Load the ultrasound model now instead of on its first request.
+    Safe to call repeatedly and from several threads; only the first call loads.
+    """
+    get_model_registry().get(
+        'ultrasound', loader=lambda: _load_ultrasound_model(device=device, checkpoint_path=checkpoint_path)
+    )
+
+def process_ultrasound(image, device: str = 'cpu', top_k: int = 2):
+    """
+    Run ultrasound classification on a path, raw bytes, file-like object or PIL image.
+    """
+    if is_path(image):
+        ext = Path(image).suffix.lower()
+        if ext not in ['.png', '.jpg', '.jpeg', '.bmp']:
+            raise ValueError(f"Unsupported file type: {ext}")
+    def compute():
+        model = get_model('ultrasound').to(device).eval()
+        return predict_ultrasound(model, image, device, top_k)
 
-try:
-    init_ultrasound_model()
-except Exception as e:
-    print(f"Warning: could not load ultrasound model: {e}")
+    return cached_prediction(
+        'ultrasound', '2d', image,
+        compute,
+        top_k=top_k, variant=serving_variant('ultrasound', DEFAULT_ULTRASOUND_CHECKPOINT),
+    )
 
-def process_ultrasound(image_path: str, device: str = 'cpu', top_k: int = 2):
-    if _ultrasound_model is None:
-        raise RuntimeError("Ultrasound model not initialized.")
-    ext = Path(image_path).suffix.lower()
-    if ext not in ['.png', '.jpg', '.jpeg', '.bmp']:
-        raise ValueError(f"Unsupported file type: {ext}")
-    _ultrasound_model.to(device).eval()
-    return predict_ultrasound(_ultrasound_model, image_path, device, top_k)
\ No newline at end of file
+def process_ultrasound_batch(images, device: str = 'cpu', top_k: int = 2) -> list:
+    """
+    Ultrasound classification of many encoded images in batched forward passes.
+    One top-k list per image, in order; None where an image could not be read.
+    """
+    return predict_images(
+        'ultrasound', '2d', images, ultrasound_transforms,
+        lambda batch: predict_ultrasound_batch(get_model('ultrasound').to(device).eval(), batch, device, top_k),
+        top_k=top_k, variant=serving_variant('ultrasound', DEFAULT_ULTRASOUND_CHECKPOINT),
+    )
@@ -0,0 +1,135 @@
+# backend/services/uploads.py
+
+import hashlib
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from fastapi import HTTPException, UploadFile
+
+# libmagic recognises far more formats; without it, the signatures below cover what we accept
+try:
+    import magic
+except ImportError:
+    magic = None
+
+# NIfTI volumes still have to be handed to nibabel as files; everything else
+# stays in memory. Override the location with MEDINSIGHT_SCRATCH_DIR.
+SCRATCH_DIR = Path(os.getenv("MEDINSIGHT_SCRATCH_DIR", Path(tempfile.gettempdir()) / "medinsight"))
+
+VOLUME_SUFFIXES = ('.nii.gz', '.nii', '.dcm')
+
+
+def volume_suffix(filename: str) -> str:
+    """Return the volume extension of `filename`, keeping double suffixes like '.nii.gz'."""
+    name = (filename or "").lower()
+    for suffix in VOLUME_SUFFIXES:
+        if name.endswith(suffix):
+            return suffix
+    return Path(name).suffix
+
+
+@contextmanager
+def scratch_file(data: bytes, filename: str):
+    """
+    Write `data` to a uniquely named file under SCRATCH_DIR and yield its path.
+
+    The file keeps the upload's extension so nibabel can detect the format,
+    and is removed when the context exits.
+    """
+    SCRATCH_DIR.mkdir(parents=True, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=volume_suffix(filename), prefix="upload_", dir=SCRATCH_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        yield path
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+UPLOAD_CHUNK_SIZE = 1 << 20
+SNIFF_BYTES = 2048
+FILE_SIGNATURES = (
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'BM', 'image/bmp'),
+    (128, b'DICM', 'application/dicom'),
+    (0, b'PK\x03\x04', 'application/zip'),
+    (0, b'PK\x05\x06', 'application/zip'),
+)
+# Older libmagic builds report the pre-registration names
+MIME_ALIASES = {'image/x-ms-bmp': 'image/bmp', 'application/x-zip-compressed': 'application/zip'}
+
+
+def sniff_content_type(head: bytes) -> str:
+    """MIME type from the first bytes of a file, never from its name or declared type."""
+    if magic is not None:
+        content_type = magic.from_buffer(bytes(head[:SNIFF_BYTES]), mime=True)
+        return MIME_ALIASES.get(content_type, content_type)
+    for offset, signature, content_type in FILE_SIGNATURES:
+        if bytes(head[offset:offset + len(signature)]) == signature:
+            return content_type
+    return 'application/octet-stream'
+
+
+class UploadBytes(bytes):
+    """
+    The bytes of an upload, carrying the SHA-256 `read_upload` computed
+    while reading them. digest_source uses it, so the prediction and report
+    caches key on an upload without hashing it again.
+    """
+
+    def __new__(cls, data, digest: str):
+        self = super().__new__(cls, data)
+        self.digest = digest
+        return self
+
+
+class Upload:
+    """An upload read through `read_upload`: its bytes, the content type sniffed from them and their SHA-256."""
+
+    def __init__(self, filename: str, data: UploadBytes, content_type: str):
+        self.filename = filename
+        self.data = data
+        self.content_type = content_type
+        self.digest = data.digest
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+async def read_upload(file: UploadFile, max_bytes: int, allowed_types=None) -> Upload:
+    """
+    Read `file` in chunks, hashing as it goes. Fails with 413 as soon as
+    more than `max_bytes` have arrived (or at once, when the size is already
+    known) and with 400 once the first bytes show a type outside
+    `allowed_types`, so rejected uploads are never held in memory whole.
+    """
+    too_large = HTTPException(status_code=413, detail=f"File too large. Maximum size is {max_bytes // 2**20}MB.")
+    if file.size is not None and file.size > max_bytes:
+        raise too_large
+
+    data, sha256, content_type = bytearray(), hashlib.sha256(), None
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        if len(data) + len(chunk) > max_bytes:
+            raise too_large
+        data += chunk
+        sha256.update(chunk)
+        if content_type is None and len(data) >= SNIFF_BYTES:
+            content_type = _check_type(data, allowed_types)
+    if content_type is None:
+        content_type = _check_type(data, allowed_types)
+    return Upload(file.filename, UploadBytes(data, sha256.hexdigest()), content_type)
+
+def _check_type(head, allowed_types) -> str:
+    content_type = sniff_content_type(head)
+    if allowed_types is not None and content_type not in allowed_types:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported file type: {content_type}. Supported types: {', '.join(allowed_types)}",
+        )
+    return content_type
@@ -1,41 +1,279 @@
 # backend/services/xray_service.py
 
+import asyncio
 import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
 from pathlib import Path
 import torch
-from models.xray_model import load_chexnet_model, predict_xray
+from models.image_io import is_path
+from services.prediction_cache import cached_prediction, cached_prediction_future
+from services.batch_prediction import predict_images
+from services.executor import run_inference
+from services.model_registry import get_model_registry, get_model, register_model, dummy_forward
+from models.weight_cache import has_weights
+from models.runtime import load_for_serving, serving_variant
+from models.xray_model import load_chexnet_model, predict_xray, predict_xray_batch, xray_transforms
 
 # Resolve project root and weight path
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DEFAULT_WEIGHT_PATH = PROJECT_ROOT / 'model_assests' / 'xray' / 'xray.pth.tar'
 
-_xray_model = None
+def _load_xray_model(weight_path: Path = DEFAULT_WEIGHT_PATH, device: str = 'cpu'):
+    weight_path = Path(weight_path)
+
+    def load_eager():
+        if not has_weights(weight_path):
+            raise FileNotFoundError(f"X-ray weights not found at {weight_path}")
+        return load_chexnet_model(str(weight_path), device=device)
+
+    # INFERENCE_BACKEND picks the execution backend; QUANTIZE=xray opts eager into INT8
+    return load_for_serving('xray', load_eager, weight_path, device)
+
+# Loaded lazily on first use (or at startup via MODEL_WARMUP)
+register_model('xray', 'xray', _load_xray_model, warmup=dummy_forward(1, 3, 224, 224),
+               weight_paths=[DEFAULT_WEIGHT_PATH])
 
 def init_xray_model(weight_path: Path = DEFAULT_WEIGHT_PATH, device: str = 'cpu') -> None:
     """
-    Load and cache the CheXNet X-ray model.
+    Load the CheXNet X-ray model now instead of on its first request.
+    Safe to call repeatedly and from several threads; only the first call loads.
     """
-    global _xray_model
+    get_model_registry().get('xray', loader=lambda: _load_xray_model(weight_path, device))
 
-    weight_path = Path(weight_path)
-    if not weight_path.is_file():
-        raise FileNotFoundError(f"X-ray weights not found at {weight_path}")
 
-    _xray_model = load_chexnet_model(str(weight_path), device=device)
+class BatchQueueFull(RuntimeError):
+    """Raised when the X-ray batching queue cannot accept more requests."""
+
+
+class XrayBatcher:
+    """
+    Dynamic micro-batching scheduler for X-ray inference.
+
+    Concurrent callers submit preprocessed tensors; a single worker thread
+    collects them into a batch and flushes either when `max_batch_size`
+    requests are queued or when the oldest request has waited `max_wait_ms`.
+    Each caller gets back its own top-k predictions through a Future.
+    """
+
+    def __init__(self, run_batch, max_batch_size: int = 16, max_wait_ms: float = 10.0,
+                 max_queue_size: int = 256):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_queue_size = max_queue_size
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+        # Metrics
+        self._batches = 0
+        self._items = 0
+        self._max_queue_depth = 0
+        self._rejected = 0
+        self._batch_size_counts = {}
+        self._last_batch_size = 0
+        self._total_wait_ms = 0.0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._worker, name="xray-batcher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, input_tensor, top_k: int = 3) -> Future:
+        """Queue one preprocessed tensor and return a Future for its top-k predictions."""
+        self.start()
+        future = Future()
+        try:
+            self._queue.put_nowait((input_tensor, top_k, future, time.perf_counter()))
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            raise BatchQueueFull(f"X-ray batch queue is full ({self.max_queue_size} pending requests)")
+        depth = self._queue.qsize()
+        with self._lock:
+            self._max_queue_depth = max(self._max_queue_depth, depth)
+        return future
+
+    def _collect(self):
+        # Block until the first request arrives, then wait at most max_wait_ms for more
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = first[3] + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self) -> None:
+        while not self._stopped.is_set():
+            # Requests whose caller has gone (a cancelled Future) are dropped before the forward pass
+            batch = [item for item in self._collect() if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            flushed_at = time.perf_counter()
+            try:
+                results = self.run_batch([item[0] for item in batch])
+            except Exception as e:
+                for _, _, future, _ in batch:
+                    future.set_exception(e)
+                results = None
+
+            if results is not None:
+                for (_, top_k, future, _), preds in zip(batch, results):
+                    future.set_result(preds[:top_k])
+
+            with self._lock:
+                size = len(batch)
+                self._batches += 1
+                self._items += size
+                self._last_batch_size = size
+                self._batch_size_counts[size] = self._batch_size_counts.get(size, 0) + 1
+                self._total_wait_ms += sum((flushed_at - item[3]) * 1000.0 for item in batch)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "max_queue_size": self.max_queue_size,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "batches": self._batches,
+                "requests": self._items,
+                "rejected": self._rejected,
+                "last_batch_size": self._last_batch_size,
+                "avg_batch_size": round(self._items / self._batches, 3) if self._batches else 0.0,
+                "avg_queue_wait_ms": round(self._total_wait_ms / self._items, 3) if self._items else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_size_counts.items())),
+            }
 
-# Try initializing on import
-try:
-    init_xray_model()
-except Exception as e:
-    print(f"Warning: could not load X-ray model: {e}")
 
+_xray_batcher = None
+_xray_batcher_lock = threading.Lock()
 
-def process_xray(image_path: str, device: str = 'cpu', top_k: int = 3) -> list:
-    if _xray_model is None:
-        raise RuntimeError("X-ray model not initialized. Call init_xray_model() first.")
+def _batching_enabled() -> bool:
+    return os.getenv("XRAY_BATCHING", "1").lower() not in ("0", "false", "no")
 
-    ext = os.path.splitext(image_path)[1].lower()
+def get_xray_batcher(device: str = 'cpu') -> XrayBatcher:
+    """
+    Return the process-wide X-ray batcher, creating it on first use.
+
+    Limits are read from XRAY_BATCH_MAX_SIZE, XRAY_BATCH_MAX_WAIT_MS and
+    XRAY_BATCH_QUEUE_SIZE.
+    """
+    global _xray_batcher
+    with _xray_batcher_lock:
+        if _xray_batcher is None:
+            # One float32 batch buffer, reused by every flush (the worker is a single thread)
+            buffer = torch.empty((0, 3, *xray_transforms.size))
+
+            def run_batch(prepared):
+                nonlocal buffer
+                batch = xray_transforms.batch(prepared, out=buffer)
+                if batch.shape[0] > buffer.shape[0]:
+                    buffer = batch
+                return predict_xray_batch(get_model('xray'), batch, top_k=None, device=device)
+
+            _xray_batcher = XrayBatcher(
+                run_batch,
+                max_batch_size=int(os.getenv("XRAY_BATCH_MAX_SIZE", "16")),
+                max_wait_ms=float(os.getenv("XRAY_BATCH_MAX_WAIT_MS", "10")),
+                max_queue_size=int(os.getenv("XRAY_BATCH_QUEUE_SIZE", "256")),
+            )
+        return _xray_batcher
+
+def shutdown_xray_batcher() -> None:
+    if _xray_batcher is not None:
+        _xray_batcher.stop()
+
+def get_xray_batching_stats() -> dict:
+    if _xray_batcher is None:
+        return {"enabled": _batching_enabled(), "running": False}
+    return {"enabled": _batching_enabled(), **_xray_batcher.stats()}
+
+
+def process_xray(image, device: str = 'cpu', top_k: int = 3) -> list:
+    """
+    Run X-ray classification on a path, raw bytes, file-like object or PIL image.
+    """
+    if _batching_enabled():
+        return submit_xray(image, device=device, top_k=top_k).result()
+
+    if is_path(image):
+        _check_extension(image)
+    return cached_prediction(
+        'xray', '2d', image, lambda: predict_xray(get_model('xray'), image, top_k=top_k, device=device),
+        top_k=top_k, variant=serving_variant('xray', DEFAULT_WEIGHT_PATH),
+    )
+
+def submit_xray(image, device: str = 'cpu', top_k: int = 3) -> Future:
+    """
+    The first half of process_xray with batching on: answers from the
+    prediction cache, or decodes the image here and queues it on the
+    micro-batcher. Returns a Future for the predictions without waiting for
+    the batch to fill.
+    """
+    if is_path(image):
+        _check_extension(image)
+    # Decode and resize in the caller's thread; the batcher normalizes into its batch buffer
+    return cached_prediction_future(
+        'xray', '2d', image,
+        lambda: get_xray_batcher(device).submit(xray_transforms.prepare(image), top_k=top_k),
+        top_k=top_k, variant=serving_variant('xray', DEFAULT_WEIGHT_PATH),
+    )
+
+async def aprocess_xray(image, device: str = 'cpu', top_k: int = 3) -> list:
+    """
+    process_xray for async routes. The decode runs on the inference pool,
+    but the wait for the micro-batch happens on the event loop, so a
+    request does not hold a pool worker while the batch fills and
+    concurrent requests can share one forward pass.
+    """
+    if not _batching_enabled():
+        return await run_inference(process_xray, image, device=device, top_k=top_k)
+    future = await run_inference(submit_xray, image, device=device, top_k=top_k)
+    return await asyncio.wrap_future(future)
+
+def _check_extension(path) -> None:
+    ext = os.path.splitext(str(path))[1].lower()
     if ext not in ['.png', '.jpg', '.jpeg', '.bmp']:
         raise ValueError(f"Unsupported file type: {ext}")
 
-    return predict_xray(_xray_model, image_path, top_k=top_k, device=device)
+
+def process_xray_batch(images, device: str = 'cpu', top_k: int = 3) -> list:
+    """
+    X-ray classification of many encoded images in batched forward passes.
+    One top-k list per image, in order; None where an image could not be read.
+    Bypasses the micro-batcher, since the requests here arrive already batched.
+    """
+    return predict_images(
+        'xray', '2d', images, xray_transforms,
+        lambda batch: predict_xray_batch(get_model('xray'), batch, top_k=top_k, device=device),
+        top_k=top_k, variant=serving_variant('xray', DEFAULT_WEIGHT_PATH),
+    )
@@ -1,16 +1,137 @@
 import uvicorn
 import sys
 import os
+import argparse
+import signal
+import socket
+import time
 
 # Add the current directory to the Python path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 
-try:
-    print("Starting server...")
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True, log_level="debug")
-except Exception as e:
-    print(f"Error starting server: {e}")
-    import traceback
-    traceback.print_exc()
-    input("Press Enter to exit...")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Start the MedInsight backend.")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")),
+                        help="worker processes; more than 1 forks workers from a parent that holds the models")
+    parser.add_argument("--share-memory", action="store_true",
+                        default=os.getenv("SHARE_MODEL_MEMORY", "0").lower() in ("1", "true", "yes"),
+                        help="move preloaded weights into shared memory instead of relying on copy-on-write")
+    parser.add_argument("--no-preload", action="store_true",
+                        help="with --workers > 1, let each worker load its own models (for comparison)")
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args()
+
+
+def serve_prefork(args):
+    """
+    Load the models once in this process, then fork `args.workers` uvicorn
+    workers that all accept on one inherited socket. The workers find the
+    models already in the registry, so their weights stay shared with the
+    parent (copy-on-write, or shared memory with --share-memory).
+    """
+    import torch
+    import main
+    from services.model_registry import preload_for_fork
+
+    if not args.no_preload:
+        preload_for_fork(share_memory=args.share_memory)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    # Split the cores between workers instead of each one using all of them
+    threads_per_worker = max(1, (os.cpu_count() or 1) // args.workers)
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            code = 0
+            try:
+                torch.set_num_threads(threads_per_worker)
+                config = uvicorn.Config(main.app, log_level=args.log_level)
+                uvicorn.Server(config).run(sockets=[sock])
+            except BaseException as e:
+                print(f"Worker {os.getpid()} failed: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        return pid
+
+    # A worker that dies within WORKER_HEALTHY_SECONDS of starting counts as
+    # a failed start; each one doubles the wait before the next respawn, and
+    # after WORKER_MAX_RESTARTS in a row the parent gives up.
+    healthy_seconds = float(os.getenv("WORKER_HEALTHY_SECONDS", "30"))
+    max_restarts = int(os.getenv("WORKER_MAX_RESTARTS", "5"))
+    backoff_base = float(os.getenv("WORKER_RESTART_BACKOFF", "1"))
+    backoff_max = float(os.getenv("WORKER_RESTART_BACKOFF_MAX", "30"))
+
+    workers = {spawn(): time.monotonic() for _ in range(args.workers)}
+    print(f"Parent {os.getpid()} serving on {args.host}:{args.port} with workers {sorted(workers)}")
+
+    stopping = False
+    failures = 0
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started = workers.pop(pid, None)
+        if stopping or started is None:
+            continue
+        if time.monotonic() - started < healthy_seconds:
+            failures += 1
+        else:
+            failures = 0
+        if failures > max_restarts:
+            print(f"Worker {pid} exited with status {status}; "
+                  f"{failures} failed starts in a row, shutting down")
+            stop(None, None)
+            continue
+        delay = min(backoff_max, backoff_base * 2 ** (failures - 1)) if failures else 0
+        print(f"Worker {pid} exited with status {status}; restarting in {delay:g}s")
+        deadline = time.monotonic() + delay
+        while not stopping and time.monotonic() < deadline:
+            time.sleep(0.1)
+        if not stopping:
+            workers[spawn()] = time.monotonic()
+    sock.close()
+    if failures > max_restarts:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        print("Starting server...")
+        if args.workers > 1:
+            serve_prefork(args)
+        else:
+            uvicorn.run("main:app", host=args.host, port=args.port, reload=True, log_level="debug")
+    except Exception as e:
+        print(f"Error starting server: {e}")
+        import traceback
+        traceback.print_exc()
+        input("Press Enter to exit...")
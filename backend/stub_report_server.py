@@ -0,0 +1,68 @@
+"""
+Local stand-in for the Gemini API, for tests and benchmarks.
+
+Run it, then start the backend with REPORT_BACKEND=http and
+REPORT_BACKEND_URL=http://127.0.0.1:8100 so report generation never leaves
+the machine. STUB_LATENCY_MS and STUB_FAILURE_RATE shape its behaviour.
+"""
+import asyncio
+import json
+import os
+import random
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import List, Optional
+import uvicorn
+
+app = FastAPI()
+
+LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "800"))
+FAILURE_RATE = float(os.getenv("STUB_FAILURE_RATE", "0"))
+
+class ContentItem(BaseModel):
+    text: Optional[str] = None
+    mime_type: Optional[str] = None
+    data: Optional[str] = None
+
+class GenerateRequest(BaseModel):
+    contents: List[ContentItem]
+
+REPORT = (
+    "Condition Detected: {label}\n"
+    "Disease Expected: {label}\n"
+    "This is a stub report generated locally from {images} image part(s) and a "
+    "{chars}-character prompt. It stands in for the upstream model during tests and benchmarks.\n"
+    "Disclaimer: This is an AI-generated summary. Please consult a certified doctor."
+)
+
+@app.post("/generate")
+async def generate(req: GenerateRequest):
+    await asyncio.sleep(LATENCY_MS / 1000.0)
+    if random.random() < FAILURE_RATE:
+        raise HTTPException(status_code=503, detail="Stub upstream failure")
+    prompt = " ".join(item.text for item in req.contents if item.text)
+    images = sum(1 for item in req.contents if item.data)
+    return {"text": REPORT.format(label="Stub Finding", images=images, chars=len(prompt))}
+
+@app.post("/generate/stream")
+async def generate_stream(req: GenerateRequest):
+    # Time to first token is LATENCY_MS; the rest trickles out word by word
+    await asyncio.sleep(LATENCY_MS / 1000.0)
+    if random.random() < FAILURE_RATE:
+        raise HTTPException(status_code=503, detail="Stub upstream failure")
+    prompt = " ".join(item.text for item in req.contents if item.text)
+    images = sum(1 for item in req.contents if item.data)
+    text = REPORT.format(label="Stub Finding", images=images, chars=len(prompt))
+
+    async def chunks():
+        for word in text.split(" "):
+            yield json.dumps({"text": word + " "}) + "\n"
+            await asyncio.sleep(0.005)
+
+    return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+if __name__ == "__main__":
+    print("Starting stub report server on port 8100...")
+    uvicorn.run(app, host="127.0.0.1", port=int(os.getenv("STUB_PORT", "8100")))
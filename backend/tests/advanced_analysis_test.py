@@ -0,0 +1,124 @@
+# test_advanced_analysis.py
+
+import os
+import sys
+import threading
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import cv2
+import numpy as np
+from services.advanced_analysis import ImageFeatures, MedicalImageAnalyzer
+
+def film(height=2400, width=2000):
+    image = np.full((height, width, 3), 30, np.uint8)
+    # Features no finer than the 1/4-scale working level can resolve
+    cv2.circle(image, (1501, 1203), 30, (200, 200, 200), -1)                    # solid region
+    cv2.rectangle(image, (901, 1899), (1014, 1962), (250, 250, 250), 9)         # outline, with a hole contour
+    cv2.rectangle(image, (301, 611), (347, 646), (250, 250, 250), 7)            # small loop
+    return cv2.imencode('.png', image)[1].tobytes()
+
+def analyze(data, analysis_type, min_side, refine="1"):
+    os.environ["ANALYSIS_MIN_SIDE"], os.environ["ANALYSIS_REFINE"] = str(min_side), refine
+    try:
+        return MedicalImageAnalyzer().analyze_image(data, analysis_type)
+    finally:
+        del os.environ["ANALYSIS_MIN_SIDE"], os.environ["ANALYSIS_REFINE"]
+
+
+def test_working_level_keeps_min_side():
+    image = np.zeros((2400, 2000, 3), np.uint8)
+    level, level_scale = MedicalImageAnalyzer._working_level(image, 600)
+    assert level.shape[:2] == (1200, 1000) and level_scale == 2.0
+    assert MedicalImageAnalyzer._working_level(image, 0)[0] is image
+    assert MedicalImageAnalyzer._working_level(image, 1024)[0] is image
+
+def test_pyramid_matches_full_resolution():
+    data = film()
+    for analysis_type, key in [("brain_tumor", "tumor_regions"), ("fracture", "bounding_boxes")]:
+        full = analyze(data, analysis_type, 0)
+        pyramid = analyze(data, analysis_type, 500)  # detection at 1/4 scale
+        for name, value in full["findings"].items():
+            assert abs(pyramid["findings"][name] - value) <= 0.05  # area percentages come from the working level
+        assert pyramid["visualization"]["original_size"] == (2400, 2000)
+        # Refined at full resolution: same boxes, in the upload's pixels
+        assert sorted(pyramid["visualization"][key]) == sorted(full["visualization"][key])
+        assert len(full["visualization"][key]) > 0
+
+    # Without refinement, boxes are only as precise as the working level
+    coarse = analyze(data, "brain_tumor", 500, refine="0")["visualization"]["tumor_regions"]
+    exact = analyze(data, "brain_tumor", 0)["visualization"]["tumor_regions"]
+    for a, b in zip(sorted(coarse), sorted(exact)):
+        assert max(abs(u - v) for u, v in zip(a, b)) <= 5
+
+def test_nodule_sizes_in_upload_pixels():
+    image = np.full((2000, 2000, 3), 220, np.uint8)
+    for x in (500, 1000, 1500):
+        cv2.circle(image, (x, 1000), 12, (20, 20, 20), -1)
+    data = cv2.imencode('.png', image)[1].tobytes()
+    full, pyramid = analyze(data, "lung_nodule", 0), analyze(data, "lung_nodule", 500)
+    assert pyramid["findings"]["number_of_nodules"] == full["findings"]["number_of_nodules"] == 3
+    assert abs(pyramid["findings"]["average_size"] - full["findings"]["average_size"]) < 4
+    for a, b in zip(pyramid["visualization"]["nodule_locations"], full["visualization"]["nodule_locations"]):
+        assert abs(a["x"] - b["x"]) <= 4 and abs(a["y"] - b["y"]) <= 4
+
+def test_overlapping_regions_reported_once():
+    image = np.full((600, 600, 3), 30, np.uint8)
+    cv2.line(image, (100, 100), (200, 200), (250, 250, 250), 4)          # two separate strokes ...
+    cv2.line(image, (112, 100), (212, 200), (250, 250, 250), 4)          # ... with overlapping boxes
+    cv2.rectangle(image, (400, 400), (440, 430), (250, 250, 250), -1)
+    data = cv2.imencode('.png', image)[1].tobytes()
+    result = analyze(data, "brain_tumor", 0)
+    assert result["findings"]["number_of_tumors"] == 2
+    assert sorted(result["visualization"]["tumor_regions"]) == [(98, 98, 117, 105), (400, 400, 41, 31)]
+
+def test_overlapping_regions_merged_on_the_pyramid():
+    image = np.full((2400, 2400, 3), 30, np.uint8)
+    cv2.line(image, (400, 400), (600, 600), (250, 250, 250), 12)         # overlapping strokes, merged ...
+    cv2.line(image, (440, 400), (640, 600), (250, 250, 250), 12)         # ... before and after refinement
+    data = cv2.imencode('.png', image)[1].tobytes()
+    for analysis_type, key in [("brain_tumor", "tumor_regions"), ("fracture", "bounding_boxes")]:
+        full = analyze(data, analysis_type, 0)["visualization"][key]
+        assert full == [(394, 394, 253, 213)]
+        assert analyze(data, analysis_type, 600)["visualization"][key] == full
+
+def test_features_computed_once_across_threads():
+    features = ImageFeatures(np.zeros((64, 64, 3), np.uint8))
+    calls = []
+    def slow_gray():
+        calls.append(1)
+        threading.Event().wait(0.05)
+        return np.zeros((64, 64), np.uint8)
+    threads = [threading.Thread(target=features._get, args=('gray', slow_gray)) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert features.edges(50, 150) is features.edges(50, 150)
+
+def test_analyze_many_matches_single_analyses():
+    data = film()
+    analyzer = MedicalImageAnalyzer()
+    types = ['fracture', 'organ', 'lung_nodule', 'brain_tumor', 'retinal']
+    combined = analyzer.analyze_many(data, types + ['organ'], overlay='url')
+    assert list(combined) == types
+    for analysis_type in types:
+        single = analyzer.analyze_image(data, analysis_type, overlay='url')
+        assert combined[analysis_type]["findings"] == single["findings"]
+        assert combined[analysis_type]["visualization"].keys() == single["visualization"].keys()
+    try:
+        analyzer.analyze_many(data, ['fracture', 'xray'])
+        assert False, "unknown analysis type accepted"
+    except ValueError:
+        pass
+
+
+if __name__ == "__main__":
+    test_working_level_keeps_min_side()
+    test_pyramid_matches_full_resolution()
+    test_nodule_sizes_in_upload_pixels()
+    test_overlapping_regions_reported_once()
+    test_overlapping_regions_merged_on_the_pyramid()
+    test_features_computed_once_across_threads()
+    test_analyze_many_matches_single_analyses()
+    print("Advanced analysis tests passed")
@@ -0,0 +1,112 @@
+# test_batch_prediction.py
+
+import io
+import os
+import sys
+import zipfile
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import torch
+from PIL import Image
+from models.ct_model import CTNet2D, ct_transforms_2d, predict_ct, predict_ct_2d_batch
+from models.preprocessing import ImagePreprocessor
+from services.batch_prediction import BatchTooLarge, expand_uploads, image_mime_type, predict_images
+
+def encoded(seed, fmt='PNG', size=(48, 40)):
+    pixels = np.random.default_rng(seed).integers(0, 256, size=(*size, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format=fmt)
+    return buf.getvalue()
+
+def mean_per_image(batch):
+    # A stand-in model whose "prediction" identifies the image it was given
+    return [[("mean", float(row.mean()))] for row in batch]
+
+
+def test_results_in_order_with_unreadable_files():
+    os.environ["BATCH_PREDICT_MAX_SIZE"] = "2"  # several forward passes through one buffer
+    try:
+        preprocess = ImagePreprocessor((16, 16))
+        images = [encoded(0), b"not an image", encoded(1, 'JPEG'), encoded(2, 'BMP'), encoded(3)[:60], encoded(4)]
+        calls = []
+        def run_batch(batch):
+            calls.append(batch.shape[0])
+            return mean_per_image(batch)
+
+        results = predict_images('batch-test', '2d', images, preprocess, run_batch, probe=1)
+    finally:
+        del os.environ["BATCH_PREDICT_MAX_SIZE"]
+
+    assert results[1] is None and results[4] is None  # wrong type, truncated
+    assert calls == [2, 2]
+    for i in (0, 2, 3, 5):
+        expected = float(preprocess(images[i]).mean())
+        assert abs(results[i][0][1] - expected) < 1e-5
+
+    # Repeats are answered from the prediction cache; unreadable files are retried
+    calls.clear()
+    assert predict_images('batch-test', '2d', images, preprocess, run_batch, probe=1) == results
+    assert calls == []
+
+def test_batched_ct_matches_single_image():
+    model = CTNet2D().eval()
+    images = [encoded(seed) for seed in range(3)]
+    batch = torch.stack([ct_transforms_2d(image) for image in images])
+    for image, preds in zip(images, predict_ct_2d_batch(model, batch)):
+        (label, prob), = predict_ct(model, image, mode="2d")
+        assert preds[0][0] == label and abs(preds[0][1] - prob) < 1e-5
+
+def test_zip_members_and_magic_bytes():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as archive:
+        archive.writestr("scans/", b"")
+        archive.writestr("scans/a.jpg", encoded(0, 'JPEG'))
+        archive.writestr("scans/b.png", encoded(1))
+    files = expand_uploads([("first.bmp", encoded(2, 'BMP')), ("batch.zip", buf.getvalue())])
+    assert [name for name, _ in files] == ["first.bmp", "batch.zip/scans/a.jpg", "batch.zip/scans/b.png"]
+    assert [image_mime_type(data) for _, data in files] == ["image/bmp", "image/jpeg", "image/png"]
+    assert image_mime_type(b"GIF89a") is None
+
+def test_limits_checked_before_unzipping():
+    def archive(count, size):
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as z:
+            for i in range(count):
+                z.writestr(f"{i}.png", bytes(size))
+        return buf.getvalue()
+
+    reads = []
+    original = zipfile.ZipFile.read
+    zipfile.ZipFile.read = lambda self, name, pwd=None: reads.append(name) or original(self, name, pwd)
+    os.environ["BATCH_PREDICT_MAX_FILES"] = "4"
+    try:
+        bomb = archive(1, 64 * 2**20)  # 64 MB of zeros in ~64 KB
+        assert len(bomb) < 2**20
+        for uploads in ([("bomb.zip", bomb)],                                        # one huge member
+                        [("many.zip", archive(5, 10))],                              # too many members
+                        [("x.png", encoded(0))] * 5):
+            try:
+                expand_uploads(uploads)
+                assert False, "oversized batch accepted"
+            except BatchTooLarge as e:
+                assert e.status_code == 413
+        os.environ["BATCH_PREDICT_MAX_MB"] = "50"  # each member fits; the 60 MB total does not
+        try:
+            expand_uploads([("a.zip", archive(3, 15 * 2**20)), ("b.zip", archive(1, 15 * 2**20))])
+            assert False, "oversized batch accepted"
+        except BatchTooLarge as e:
+            assert "50MB" in e.detail
+        assert reads == []
+    finally:
+        zipfile.ZipFile.read = original
+        del os.environ["BATCH_PREDICT_MAX_FILES"]
+        os.environ.pop("BATCH_PREDICT_MAX_MB", None)
+
+
+if __name__ == "__main__":
+    test_results_in_order_with_unreadable_files()
+    test_batched_ct_matches_single_image()
+    test_zip_members_and_magic_bytes()
+    test_limits_checked_before_unzipping()
+    print("Batch prediction tests passed")
@@ -0,0 +1,146 @@
+# test_dicom_io.py
+
+import io
+import os
+import random
+import sys
+import zipfile
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import nibabel as nib
+import numpy as np
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import CTImageStorage, ExplicitVRLittleEndian, generate_uid
+from models.ct_model import CTNet3D, predict_ct
+from models.dicom_io import SeriesTooLarge, is_dicom_series, load_dicom_series
+from models.volume_io import NiftiVolume
+from services.prediction_cache import digest_source
+
+def dicom_slice(pixels, z, series_uid, instance, slope=1.0, intercept=-1024.0):
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = CTImageStorage
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.SOPClassUID = CTImageStorage
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.SeriesInstanceUID = series_uid
+    ds.Modality = 'CT'
+    ds.InstanceNumber = instance
+    ds.Rows, ds.Columns = pixels.shape
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = 'MONOCHROME2'
+    ds.BitsAllocated, ds.BitsStored, ds.HighBit, ds.PixelRepresentation = 16, 16, 15, 0
+    ds.ImagePositionPatient = [0.0, 0.0, float(z)]
+    ds.ImageOrientationPatient = [1.0, 0.0, 0.0, 0.0, 1.0, 0.0]
+    ds.PixelSpacing = [0.7, 0.6]  # row spacing, column spacing
+    ds.SliceThickness = 2.5
+    ds.RescaleSlope, ds.RescaleIntercept = slope, intercept
+    ds.PixelData = pixels.astype(np.uint16).tobytes()
+    buf = io.BytesIO()
+    ds.save_as(buf, enforce_file_format=True)
+    return buf.getvalue()
+
+def synthetic_series(count=12, shape=(40, 48)):
+    rng = np.random.default_rng(0)
+    series_uid = generate_uid()
+    stored = rng.integers(0, 3000, size=(count, *shape), dtype=np.uint16)
+    # Every other slice uses different rescaling, as scanners may do per slice
+    slopes = [1.0 if i % 2 else 0.5 for i in range(count)]
+    files = [dicom_slice(stored[i], -100 + 2.5 * i, series_uid, i + 1, slope=slopes[i]) for i in range(count)]
+    hu = stored.astype(np.float32) * np.array(slopes, np.float32)[:, None, None] - 1024
+    return files, hu.transpose(2, 1, 0)  # NIfTI order: columns, rows, slices
+
+def zipped(files, extra=None):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as archive:
+        for i, data in enumerate(files):
+            archive.writestr(f"series/IM{i:04d}.dcm", data)
+        for name, data in (extra or {}).items():
+            archive.writestr(name, data)
+    return buf.getvalue()
+
+
+def test_assembles_sorted_volume_in_hu():
+    files, hu = synthetic_series()
+    shuffled = files[:]
+    random.Random(1).shuffle(shuffled)
+    assert is_dicom_series(shuffled)
+
+    volume = load_dicom_series(shuffled)
+    data = volume.data()
+    assert data.dtype == np.float32 and data.shape == hu.shape
+    assert np.array_equal(data, hu)  # sorted by position, slope/intercept applied per slice
+    assert np.allclose(volume.zooms, (0.6, 0.7, 2.5))
+
+def test_matches_the_same_study_as_nifti(tmp_path=None):
+    files, hu = synthetic_series()
+    path = os.path.join(tmp_path or os.path.dirname(__file__), "series_as_nifti.nii")
+    nib.save(nib.Nifti1Image(hu, np.diag([0.6, 0.7, 2.5, 1.0])), path)
+    try:
+        nifti, dicom = NiftiVolume(path), load_dicom_series(files)
+        assert dicom.shape == nifti.shape and np.allclose(dicom.zooms, nifti.zooms)
+        assert np.array_equal(dicom.data(), nifti.data())
+        for view, plane in nifti.mid_slices().items():
+            assert np.array_equal(dicom.mid_slices()[view], plane)
+    finally:
+        os.remove(path)
+
+def test_zip_upload_picks_the_image_series():
+    files, hu = synthetic_series()
+    scout, _ = synthetic_series(count=3, shape=(16, 16))
+    archive = zipped(files + scout, extra={"README.txt": b"not an image", "series/": b""})
+    assert is_dicom_series([archive]) and not is_dicom_series([b"\x89PNG\r\n\x1a\n"])
+
+    volume = load_dicom_series([archive])
+    assert np.array_equal(volume.data(), hu)
+    # Zipped or not, in any order, the series hashes the same
+    assert volume.digest == load_dicom_series(files[::-1]).digest == digest_source(volume)
+
+def test_volume_feeds_3d_predictor():
+    files, _ = synthetic_series()
+    result = predict_ct(CTNet3D().eval(), load_dicom_series(files), mode="3d")
+    (_, prob_no), (_, prob_tumor), (_, label) = result
+    assert abs(prob_no + prob_tumor - 1.0) < 1e-5
+
+def test_limits_checked_before_unzipping():
+    files, _ = synthetic_series(count=6)
+    bomb = io.BytesIO()
+    with zipfile.ZipFile(bomb, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("series/IM0000.dcm", bytes(128 * 2**20))  # 128 MB of zeros in ~128 KB
+    assert len(bomb.getvalue()) < 2**20
+
+    reads = []
+    original = zipfile.ZipFile.read
+    zipfile.ZipFile.read = lambda self, name, pwd=None: reads.append(name) or original(self, name, pwd)
+    os.environ["DICOM_MAX_FILES"] = "5"
+    try:
+        for uploads in ([bomb.getvalue()],         # one huge member
+                        [zipped(files)],            # too many members
+                        files):                     # too many slice files
+            try:
+                load_dicom_series(uploads)
+                assert False, "oversized series accepted"
+            except SeriesTooLarge:
+                pass
+        os.environ["DICOM_MAX_FILES"], os.environ["VOLUME_UPLOAD_MAX_MB"] = "100", "0.02"
+        try:
+            load_dicom_series([zipped(files[:3]), zipped(files[3:])])  # each archive fits; both do not
+            assert False, "oversized series accepted"
+        except SeriesTooLarge as e:
+            assert "unzipped" in str(e)
+        assert reads == []
+    finally:
+        zipfile.ZipFile.read = original
+        del os.environ["DICOM_MAX_FILES"]
+        os.environ.pop("VOLUME_UPLOAD_MAX_MB", None)
+
+
+if __name__ == "__main__":
+    test_assembles_sorted_volume_in_hu()
+    test_matches_the_same_study_as_nifti()
+    test_zip_upload_picks_the_image_series()
+    test_volume_feeds_3d_predictor()
+    test_limits_checked_before_unzipping()
+    print("DICOM I/O tests passed")
@@ -0,0 +1,53 @@
+# test_executor.py
+
+import asyncio
+import os
+import sys
+import threading
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.executor import BoundedPool, PoolSaturated
+
+def test_rejects_when_workers_and_queue_are_full():
+    async def scenario():
+        pool = BoundedPool("test", max_workers=1, max_queue=1, retry_after=7)
+        release = threading.Event()
+        running = [asyncio.ensure_future(pool.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        try:
+            await pool.run(lambda: None)
+            assert False, "expected PoolSaturated"
+        except PoolSaturated as e:
+            assert e.status_code == 503
+            assert e.headers["Retry-After"] == "7"
+        release.set()
+        await asyncio.gather(*running)
+        stats = pool.stats()
+        pool.shutdown()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert stats["completed"] == 2
+    assert stats["rejected"] == 1
+    assert stats["active"] == 0 and stats["queued"] == 0
+
+def test_failures_release_capacity():
+    async def scenario():
+        pool = BoundedPool("test", max_workers=1, max_queue=0)
+        for _ in range(3):
+            try:
+                await pool.run(int, "not a number")
+            except ValueError:
+                pass
+        stats = pool.stats()
+        pool.shutdown()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert stats["failed"] == 3
+    assert stats["rejected"] == 0
+
+if __name__ == "__main__":
+    test_rejects_when_workers_and_queue_are_full()
+    test_failures_release_capacity()
+    print("Executor tests passed")
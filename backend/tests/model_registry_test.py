@@ -0,0 +1,166 @@
+# test_model_registry.py
+
+import os
+import sys
+import tempfile
+import threading
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import torch
+import torch.nn as nn
+from services.model_registry import ModelRegistry, ModelDisabled, parameter_bytes
+
+
+def counting_loader(calls, name, size=256, delay=0.0):
+    def load():
+        time.sleep(delay)
+        calls.append(name)
+        return nn.Linear(size, size)
+    return load
+
+
+def test_loads_once_on_first_use():
+    calls = []
+    registry = ModelRegistry()
+    registry.register('xray', 'xray', counting_loader(calls, 'xray', delay=0.05))
+    assert registry.stats()["models"]["xray"]["loaded"] is False
+
+    threads = [threading.Thread(target=registry.get, args=('xray',)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert calls == ['xray']
+    stats = registry.stats()
+    assert stats["models"]["xray"]["parameter_bytes"] == parameter_bytes(registry.get('xray'))
+    assert stats["resident_bytes"] > 0
+
+def test_evicts_least_recently_used_over_budget():
+    calls = []
+    one_model = parameter_bytes(nn.Linear(256, 256))
+    registry = ModelRegistry(memory_budget_bytes=2 * one_model)
+    for name in ('a', 'b', 'c'):
+        registry.register(name, 'ct', counting_loader(calls, name))
+
+    registry.get('a')
+    registry.get('b')
+    registry.get('a')          # 'b' is now least recently used
+    registry.get('c')          # over budget: 'b' goes
+
+    stats = registry.stats()
+    assert stats["lru_order"] == ['a', 'c']
+    assert stats["evictions"] == 1
+    assert stats["resident_bytes"] <= registry.memory_budget_bytes
+
+    registry.get('b')          # reloaded on demand, 'a' evicted
+    assert calls == ['a', 'b', 'c', 'b']
+    assert registry.stats()["lru_order"] == ['c', 'b']
+
+def test_disabled_modality_is_never_loaded():
+    calls = []
+    registry = ModelRegistry(enabled=['xray'])
+    registry.register('ultrasound', 'ultrasound', counting_loader(calls, 'ultrasound'))
+    try:
+        registry.get('ultrasound')
+        assert False, "expected ModelDisabled"
+    except ModelDisabled as e:
+        assert e.status_code == 404
+    assert registry.warm() == {} and calls == []
+
+def test_warm_reports_failures():
+    registry = ModelRegistry()
+    registry.register('ok', 'xray', lambda: nn.Linear(4, 4), warmup=lambda m: m.eval())
+
+    def broken():
+        raise FileNotFoundError("weights missing")
+    registry.register('broken', 'ct', broken)
+
+    errors = registry.warm()
+    assert list(errors) == ['broken']
+    assert registry.stats()["models"]["ok"]["loaded"] is True
+    assert registry.stats()["load_failures"] == 1
+
+def test_repeated_init_loads_once_and_logs_bytes_read():
+    calls = []
+    with tempfile.NamedTemporaryFile(suffix='.pth') as weights:
+        weights.write(b'\0' * 4096)
+        weights.flush()
+        registry = ModelRegistry()
+        registry.register('ct2d', 'ct', counting_loader(calls, 'registered'), weight_paths=[weights.name])
+
+        # init helpers pass their own loader; it only runs if nothing is loaded yet
+        init = lambda: registry.get('ct2d', loader=counting_loader(calls, 'init', delay=0.02))
+        threads = [threading.Thread(target=init) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        registry.get('ct2d')
+
+    assert calls == ['init']
+    assert len(registry.load_log) == 1
+    event = registry.load_log[0]
+    assert event["model"] == 'ct2d' and event["bytes_read"] == 4096 and event["load_ms"] > 0
+
+def test_bytes_read_counts_the_file_opened():
+    from models.weight_cache import load_state_dict
+    with tempfile.TemporaryDirectory() as tmp:
+        weights = os.path.join(tmp, 'model.pth')
+        # The pickle also carries optimizer state the converted copy leaves out
+        torch.save({"state_dict": nn.Linear(64, 64).state_dict(), "optimizer": torch.zeros(100000)}, weights)
+
+        def load():
+            model = nn.Linear(64, 64)
+            model.load_state_dict(load_state_dict(weights, lambda checkpoint: checkpoint["state_dict"]))
+            return model
+
+        for _ in range(2):
+            registry = ModelRegistry()
+            registry.register('ct2d', 'ct', load, weight_paths=[weights])
+            registry.get('ct2d')
+        converted = [os.path.join(tmp, f) for f in os.listdir(tmp) if '.converted.' in f]
+        assert len(converted) == 1
+        # Loaded again, only the memory-mapped copy is opened, not the pickle
+        assert registry.load_log[0]["bytes_read"] == os.path.getsize(converted[0]) < os.path.getsize(weights)
+
+def test_init_helpers_load_for_serving():
+    # INFERENCE_BACKEND and QUANTIZE must apply however a model gets loaded
+    from models.runtime import load_for_serving
+    from services import ct_service, mri_service, ultrasound_service
+    from services.model_registry import get_model_registry
+    served = []
+    def fake_load_for_serving(name, load_eager, weights_path=None, device='cpu'):
+        served.append((name, weights_path))
+        return nn.Identity()
+
+    modules = (ct_service, mri_service, ultrasound_service)
+    names = ('ct2d', 'ct3d', 'mri3d', 'ultrasound')
+    registry = get_model_registry()
+    for name in names:
+        registry.unload(name)
+    for module in modules:
+        module.load_for_serving = fake_load_for_serving
+    try:
+        ct_service.init_ct_models()
+        mri_service.init_mri_models()
+        ultrasound_service.init_ultrasound_model()
+    finally:
+        for module in modules:
+            module.load_for_serving = load_for_serving
+        for name in names:
+            registry.unload(name)
+    assert served == [('ct2d', ct_service.CT_2D_WEIGHTS_PATH), ('ct3d', ct_service.CT_3D_WEIGHTS_PATH),
+                      ('mri3d', mri_service.WEIGHT_MRI_3D),
+                      ('ultrasound', ultrasound_service.DEFAULT_ULTRASOUND_CHECKPOINT)]
+
+if __name__ == "__main__":
+    test_loads_once_on_first_use()
+    test_evicts_least_recently_used_over_budget()
+    test_disabled_modality_is_never_loaded()
+    test_warm_reports_failures()
+    test_repeated_init_loads_once_and_logs_bytes_read()
+    test_bytes_read_counts_the_file_opened()
+    test_init_helpers_load_for_serving()
+    print("Model registry tests passed")
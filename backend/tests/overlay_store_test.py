@@ -0,0 +1,77 @@
+# test_overlay_store.py
+
+import os
+import sys
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import cv2
+import numpy as np
+from services.advanced_analysis import MedicalImageAnalyzer
+from services import overlay_store
+from services.overlay_store import OverlayStore, get_overlay_store
+
+def overlay(height=300, width=200, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+
+
+def test_lazy_render_and_downscale():
+    store = OverlayStore()
+    image = overlay()
+    overlay_id = store.put(image)
+    assert store.stats()["renders"] == 0  # nothing encoded until fetched
+
+    png = store.render(overlay_id, "png")
+    assert np.array_equal(cv2.imdecode(np.frombuffer(png, np.uint8), cv2.IMREAD_COLOR), image)
+    small = cv2.imdecode(np.frombuffer(store.render(overlay_id, "webp", max_dim=60), np.uint8), cv2.IMREAD_COLOR)
+    assert small.shape == (60, 40, 3)
+
+    assert store.render(overlay_id, "png") == png
+    stats = store.stats()
+    assert stats["renders"] == 2 and stats["render_hits"] == 1
+    assert store.render("unknown") is None
+
+def test_bounded_by_bytes_and_ttl():
+    one = overlay().nbytes
+    store = OverlayStore(max_bytes=2 * one + 10)
+    ids = [store.put(overlay(seed=i)) for i in range(3)]
+    assert store.get(ids[0]) is None and store.get(ids[2]) is not None
+    assert store.stats()["evictions"] == 1 and store.stats()["bytes"] <= store.max_bytes
+
+    # Larger than the whole store: refused, instead of evicting everything and leaving a dangling ID
+    assert store.put(overlay(height=900)) is None
+    assert store.get(ids[2]) is not None and store.stats()["rejected"] == 1
+
+    store = OverlayStore(ttl_seconds=0.05)
+    overlay_id = store.put(overlay())
+    time.sleep(0.1)
+    assert store.render(overlay_id) is None
+    assert store.stats()["expired"] == 1
+
+def test_analyzer_overlay_delivery():
+    image = np.zeros((200, 240, 3), dtype=np.uint8)
+    cv2.rectangle(image, (40, 40), (120, 150), (255, 255, 255), -1)
+    data = cv2.imencode('.png', image)[1].tobytes()
+    analyzer = MedicalImageAnalyzer()
+
+    inline = analyzer.analyze_image(data, 'brain_tumor')["visualization"]
+    assert inline["overlay"].startswith("data:image/png;base64,")
+
+    by_id = analyzer.analyze_image(data, 'brain_tumor', overlay='url')["visualization"]
+    assert "overlay" not in by_id and by_id["tumor_regions"] == inline["tumor_regions"]
+    assert get_overlay_store().get(by_id["overlay_id"]).shape == image.shape
+
+    # An overlay the store cannot hold is sent inline rather than as an ID that points at nothing
+    original, overlay_store._store = overlay_store._store, OverlayStore(max_bytes=image.nbytes - 1)
+    try:
+        fallback = analyzer.analyze_image(data, 'brain_tumor', overlay='url')["visualization"]
+    finally:
+        overlay_store._store = original
+    assert "overlay_id" not in fallback and fallback["overlay"] == inline["overlay"]
+
+
+if __name__ == "__main__":
+    test_lazy_render_and_downscale()
+    test_bounded_by_bytes_and_ttl()
+    test_analyzer_overlay_delivery()
+    print("Overlay store tests passed")
@@ -0,0 +1,99 @@
+# test_prediction_cache.py
+
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import nibabel as nib
+import numpy as np
+import torch.nn as nn
+from models.volume_io import NiftiVolume
+from services import prediction_cache
+from services.model_registry import ModelRegistry
+from services.prediction_cache import PredictionCache, digest_source, model_version, weights_fingerprint
+
+PREDS = [("Mass", 0.9), ("Nodule", 0.4)]
+
+def test_lru_eviction_and_counters():
+    cache = PredictionCache(max_entries=2, ttl_seconds=0)
+    for name in ("a", "b", "c"):
+        cache.put(name, "v1", PREDS)
+    assert cache.get("a", "v1") is None
+    assert cache.get("c", "v1") == PREDS
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["memory_hits"] == 1 and stats["misses"] == 1
+
+def test_ttl_expiry():
+    cache = PredictionCache(ttl_seconds=0.05)
+    cache.put("k", "v1", PREDS)
+    time.sleep(0.1)
+    assert cache.get("k", "v1") is None
+    assert cache.stats()["expired"] == 1
+
+def test_model_version_change_invalidates():
+    cache = PredictionCache()
+    cache.put("k", "v1", PREDS)
+    assert cache.get("k", "v2") is None
+    assert cache.stats()["invalidated"] == 1
+
+def test_disk_tier_survives_restart():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "cache.sqlite")
+        PredictionCache(disk_path=db).put("k", "v1", PREDS)
+        reopened = PredictionCache(disk_path=db)
+        assert reopened.get("k", "v1") == PREDS
+        assert reopened.stats()["disk_hits"] == 1
+
+def test_key_and_fingerprint():
+    assert digest_source(b"abc") == digest_source(bytearray(b"abc"))
+    assert digest_source(object()) is None
+    key = PredictionCache.make_key(digest_source(b"abc"), "xray", "2d", top_k=3)
+    assert key.startswith("xray:2d:") and key.endswith("top_k=3")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        weights = os.path.join(tmp, "model.pth")
+        with open(weights, "wb") as f:
+            f.write(b"1")
+        before = weights_fingerprint(tmp)
+        with open(weights, "wb") as f:
+            f.write(b"22")
+        assert weights_fingerprint(tmp) != before
+
+def test_version_and_digest_computed_once():
+    with tempfile.TemporaryDirectory() as tmp:
+        original = prediction_cache.MODEL_ASSETS_DIR
+        prediction_cache.MODEL_ASSETS_DIR = type(original)(tmp)
+        weights = os.path.join(tmp, "xray", "model.pth")
+        os.makedirs(os.path.dirname(weights))
+        try:
+            with open(weights, "wb") as f:
+                f.write(b"1")
+            before = model_version("xray")
+            with open(weights, "wb") as f:
+                f.write(b"22")
+            assert model_version("xray") == before  # no rescan per request
+            registry = ModelRegistry()
+            registry.register("xray", "xray", lambda: None)
+            registry.put("xray", nn.Identity())      # a load picks up the new weights
+            assert model_version("xray") != before
+        finally:
+            prediction_cache.MODEL_ASSETS_DIR = original
+            prediction_cache.forget_model_version("xray")
+
+        # An upload hashed on arrival is not hashed again from disk
+        path = os.path.join(tmp, "volume.nii")
+        nib.save(nib.Nifti1Image(np.zeros((4, 4, 4), np.float32), np.eye(4)), path)
+        assert digest_source(NiftiVolume(path, digest="abc")) == "abc"
+        assert digest_source(NiftiVolume(path)) == digest_source(path)
+
+if __name__ == "__main__":
+    test_lru_eviction_and_counters()
+    test_ttl_expiry()
+    test_model_version_change_invalidates()
+    test_disk_tier_survives_restart()
+    test_key_and_fingerprint()
+    test_version_and_digest_computed_once()
+    print("Prediction cache tests passed")
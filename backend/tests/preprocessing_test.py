@@ -0,0 +1,85 @@
+# test_preprocessing.py
+
+import io
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import torch
+from PIL import Image
+from torchvision import transforms
+from models.preprocessing import ImagePreprocessor, decode_pixels
+
+TORCHVISION = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
+])
+
+def smooth_image(width, height, mode='RGB'):
+    # Gradients and a soft blob: resizing differences stay small away from hard edges
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    blob = 255 * np.exp(-((x - width / 2) ** 2 + (y - height / 2) ** 2) / (2 * (width / 6) ** 2))
+    rgb = np.stack([255 * x / width, 255 * y / height, blob], axis=-1).astype(np.uint8)
+    return Image.fromarray(rgb).convert(mode)
+
+def png_bytes(image):
+    buf = io.BytesIO()
+    image.save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def test_matches_torchvision_pipeline():
+    preprocess = ImagePreprocessor((224, 224))
+    for size in [(1024, 1024), (644, 569), (160, 120)]:  # shrink a lot, shrink a little, enlarge
+        for mode in ('RGB', 'L'):
+            image = smooth_image(*size, mode=mode)
+            expected = TORCHVISION(image.convert('RGB'))
+            actual = preprocess(png_bytes(image))
+            assert actual.shape == (3, 224, 224) and actual.dtype == torch.float32
+            assert (actual - expected).abs().mean() < 0.02
+
+def test_grayscale_stays_single_channel_until_normalized():
+    gray = smooth_image(300, 200, mode='L')
+    assert decode_pixels(png_bytes(gray)).ndim == 2
+    assert decode_pixels(png_bytes(gray.convert('LA'))).ndim == 2
+
+    preprocess = ImagePreprocessor((224, 224))
+    assert torch.allclose(preprocess(gray), preprocess(gray.convert('RGB')), atol=1e-6)
+
+def test_batch_reuses_buffer():
+    preprocess = ImagePreprocessor((224, 224))
+    images = [smooth_image(300 + 10 * i, 200, mode='RGB' if i % 2 else 'L') for i in range(3)]
+    prepared = [preprocess.prepare(image) for image in images]
+    assert all(p.dtype == np.uint8 for p in prepared)
+
+    buffer = torch.empty((8, 3, 224, 224))
+    batch = preprocess.batch(prepared, out=buffer)
+    assert batch.shape == (3, 3, 224, 224)
+    assert batch.data_ptr() == buffer.data_ptr()
+    for slot, image in zip(batch, images):
+        assert torch.equal(slot, preprocess(image))
+
+    # Too small a buffer is replaced, not overrun
+    assert preprocess.batch(prepared, out=torch.empty((2, 3, 224, 224))).shape[0] == 3
+def test_large_jpeg_decoded_at_reduced_scale():
+    buf = io.BytesIO()
+    smooth_image(2000, 1200, mode='L').save(buf, format='JPEG', quality=95)
+    data = buf.getvalue()
+
+    pixels = decode_pixels(data, min_size=(224, 224))
+    assert pixels.shape == (300, 500)  # 1/4 scale: still covers 224x224, 1/8 would not
+    assert decode_pixels(data, min_size=(800, 800)).shape == (1200, 2000)  # nothing smaller covers it
+
+    preprocess = ImagePreprocessor((224, 224))
+    reference = TORCHVISION(Image.open(io.BytesIO(data)).convert('RGB'))
+    assert (preprocess(data) - reference).abs().mean() < 0.02
+
+
+if __name__ == "__main__":
+    test_matches_torchvision_pipeline()
+    test_grayscale_stays_single_channel_until_normalized()
+    test_batch_reuses_buffer()
+    test_large_jpeg_decoded_at_reduced_scale()
+    print("Preprocessing tests passed")
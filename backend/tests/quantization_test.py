@@ -0,0 +1,69 @@
+# test_quantization.py
+
+import os
+import sys
+import tempfile
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import torch
+import torch.nn as nn
+from pathlib import Path
+from models import quantization
+
+SHAPE = (1, 3, 32, 32)
+
+
+class SmallConvNet(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.features = nn.Sequential(nn.Conv2d(3, 8, 3), nn.BatchNorm2d(8), nn.ReLU(), nn.AdaptiveAvgPool2d(1))
+        self.fc = nn.Linear(8, 4)
+
+    def forward(self, x):
+        return self.fc(torch.flatten(self.features(x), 1))
+
+
+def test_static_roundtrip_matches_calibrated_model():
+    torch.manual_seed(0)
+    model = SmallConvNet().eval()
+    batches = [torch.randn(*SHAPE) for _ in range(8)]
+    calibrated = quantization.calibrate_static(model, batches, example_shape=SHAPE)
+
+    with tempfile.TemporaryDirectory() as d:
+        path = Path(d) / "model.pth.int8.pt"
+        torch.save(calibrated.state_dict(), path)
+        reloaded = quantization.load_static(model, path, example_shape=SHAPE)
+
+    x = torch.randn(*SHAPE)
+    with torch.no_grad():
+        assert torch.equal(calibrated(x), reloaded(x))
+        assert (model(x) - reloaded(x)).abs().max() < 0.1
+
+def test_dynamic_quantizes_linear_layers():
+    model = nn.Sequential(nn.Linear(16, 16), nn.ReLU(), nn.Linear(16, 2)).eval()
+    quantized = quantization.quantize_dynamic(model)
+    assert isinstance(quantized[0], torch.ao.nn.quantized.dynamic.Linear)
+    assert isinstance(model[0], nn.Linear)  # original left untouched
+
+def test_opt_in_and_fp32_fallback():
+    model = SmallConvNet().eval()
+    with tempfile.TemporaryDirectory() as d:
+        weights = Path(d) / "ResNet50.pt"
+        os.environ.pop("QUANTIZE", None)
+        assert quantization.maybe_quantize('ct2d', model, weights) is model
+
+        os.environ["QUANTIZE"] = "ct2d,ultrasound"
+        try:
+            # No calibrated weights yet: still fp32
+            assert quantization.quantization_variant('ct2d', weights) == 'fp32'
+            assert quantization.maybe_quantize('ct2d', model, weights) is model
+            assert quantization.quantization_variant('ultrasound') == 'int8'
+            assert quantization.quantization_variant('xray') == 'fp32'
+        finally:
+            del os.environ["QUANTIZE"]
+
+if __name__ == "__main__":
+    test_static_roundtrip_matches_calibrated_model()
+    test_dynamic_quantizes_linear_layers()
+    test_opt_in_and_fp32_fallback()
+    print("Quantization tests passed")
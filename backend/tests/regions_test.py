@@ -0,0 +1,49 @@
+# test_regions.py
+
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import cv2
+import numpy as np
+from services.regions import component_mask, component_regions, contour_stats, merge_overlapping
+
+def noisy_edges(size=600):
+    rng = np.random.default_rng(1)
+    gray = np.clip(120 + rng.normal(0, 30, (size, size)), 0, 255).astype(np.uint8)
+    return cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 50, 150)
+
+
+def test_contour_stats_match_opencv():
+    contours, _ = cv2.findContours(noisy_edges(), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    assert len(contours) > 500
+    areas, boxes = contour_stats(contours)
+    assert np.array_equal(areas, [cv2.contourArea(c) for c in contours])
+    assert np.array_equal(boxes, [cv2.boundingRect(c) for c in contours])
+    assert contour_stats(())[1].shape == (0, 4)
+
+def test_component_regions_filter_by_area():
+    mask = np.zeros((200, 200), np.uint8)
+    mask[10:20, 10:20] = 255      # 100 px
+    mask[50:90, 50:100] = 255     # 2000 px
+    mask[150, 150] = 255          # 1 px
+    labels, ids, boxes, areas = component_regions(mask, 50, 1000)
+    assert boxes.tolist() == [[10, 10, 10, 10]] and areas.tolist() == [100]
+    kept = component_mask(labels, ids)
+    assert kept[15, 15] == 255 and kept[60, 60] == 0 and kept[150, 150] == 0
+
+def test_merge_overlapping():
+    boxes = [(0, 0, 10, 10), (1, 1, 10, 10), (50, 50, 5, 5), (52, 50, 5, 5)]
+    merged, kept = merge_overlapping(boxes, [1, 2, 4, 3], 0.3)
+    assert merged.tolist() == [[50, 50, 7, 5], [0, 0, 11, 11]]
+    assert kept.tolist() == [2, 1]
+    # Below the threshold nothing is merged
+    assert len(merge_overlapping(boxes, [1, 2, 4, 3], 0.9)[0]) == 4
+    assert merge_overlapping([], [], 0.3)[0].shape == (0, 4)
+
+
+if __name__ == "__main__":
+    test_contour_stats_match_opencv()
+    test_component_regions_filter_by_area()
+    test_merge_overlapping()
+    print("Region tests passed")
@@ -0,0 +1,105 @@
+# test_report_cache.py
+
+import os
+import sys
+import threading
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.report_cache import ReportCache, report_cache_key
+
+
+class FakeGenaiClient:
+    """Stands in for google.genai.Client: counts calls and answers slowly."""
+
+    class _Response:
+        def __init__(self, text):
+            self.text = text
+
+    class _Models:
+        def __init__(self, outer):
+            self.outer = outer
+
+        def generate_content(self, model, contents):
+            with self.outer.lock:
+                self.outer.calls += 1
+            time.sleep(self.outer.delay)
+            return FakeGenaiClient._Response(f"Condition Detected: Cyst ({contents[-1]})")
+
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.models = FakeGenaiClient._Models(self)
+
+
+def generate_with(client, prompt):
+    return lambda: client.models.generate_content(model="fake", contents=[prompt]).text
+
+def test_repeat_requests_hit_the_cache():
+    client = FakeGenaiClient()
+    cache = ReportCache()
+    key = report_cache_key("ultrasound", "template {symptoms}", ["Cyst", "Mass"], "abc")
+    first = cache.get_or_generate(key, generate_with(client, "p"))
+    second = cache.get_or_generate(key, generate_with(client, "p"))
+    assert first == second
+    assert client.calls == 1
+    assert cache.stats()["hits"] == 1
+
+def test_key_depends_on_template_symptoms_and_image():
+    base = report_cache_key("xray", "t1", ["Mass"], "img1")
+    assert base != report_cache_key("xray", "t2", ["Mass"], "img1")
+    assert base != report_cache_key("xray", "t1", ["Nodule"], "img1")
+    assert base != report_cache_key("xray", "t1", ["Mass"], "img2")
+    assert base != report_cache_key("ct", "t1", ["Mass"], "img1")
+
+def test_concurrent_identical_requests_share_one_call():
+    client = FakeGenaiClient(delay=0.2)
+    cache = ReportCache()
+    key = report_cache_key("xray", "t", ["Mass"], "img")
+    results = []
+
+    def call():
+        results.append(cache.get_or_generate(key, generate_with(client, "p")))
+
+    threads = [threading.Thread(target=call) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert client.calls == 1
+    assert len(set(results)) == 1 and len(results) == 5
+    assert cache.stats()["coalesced"] == 4
+
+def test_ttl_and_size_limits():
+    client = FakeGenaiClient()
+    cache = ReportCache(max_entries=1, ttl_seconds=0.05)
+    cache.get_or_generate("a", generate_with(client, "a"))
+    cache.get_or_generate("b", generate_with(client, "b"))
+    assert cache.stats()["evictions"] == 1
+    time.sleep(0.1)
+    cache.get_or_generate("b", generate_with(client, "b"))
+    assert client.calls == 3
+
+def test_errors_are_not_cached():
+    cache = ReportCache()
+
+    def failing():
+        raise RuntimeError("upstream down")
+
+    for _ in range(2):
+        try:
+            cache.get_or_generate("k", failing)
+            assert False, "expected RuntimeError"
+        except RuntimeError:
+            pass
+    assert cache.stats()["errors"] == 2 and cache.stats()["entries"] == 0
+
+if __name__ == "__main__":
+    test_repeat_requests_hit_the_cache()
+    test_key_depends_on_template_symptoms_and_image()
+    test_concurrent_identical_requests_share_one_call()
+    test_ttl_and_size_limits()
+    test_errors_are_not_cached()
+    print("Report cache tests passed")
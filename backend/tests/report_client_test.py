@@ -0,0 +1,191 @@
+# test_report_client.py
+
+import asyncio
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.report_client import (
+    ReportClient, CircuitBreaker, CircuitOpen, ReportUnavailable, templated_report,
+)
+
+
+class StubBackend:
+    """In-process backend: fails the first `failures` calls, then answers."""
+
+    def __init__(self, failures=0, delay=0.0, exc=ConnectionError):
+        self.failures = failures
+        self.delay = delay
+        self.exc = exc
+        self.calls = 0
+        self.peak_concurrency = 0
+        self._active = 0
+
+    async def generate(self, contents):
+        self.calls += 1
+        self._active += 1
+        self.peak_concurrency = max(self.peak_concurrency, self._active)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.calls <= self.failures:
+                raise self.exc("upstream unavailable")
+            return f"Condition Detected: Cyst\n{contents[-1]}"
+        finally:
+            self._active -= 1
+
+
+class StreamingStubBackend(StubBackend):
+    """Streams the report word by word; optionally dies after `break_after` chunks."""
+
+    def __init__(self, break_after=None, **kwargs):
+        super().__init__(**kwargs)
+        self.break_after = break_after
+
+    async def stream(self, contents):
+        text = await self.generate(contents)
+        for i, word in enumerate(text.split(" ")):
+            if self.break_after is not None and i == self.break_after:
+                raise ConnectionError("stream dropped")
+            yield word + " "
+
+
+def test_retries_transient_failures():
+    backend = StubBackend(failures=2)
+    client = ReportClient(backend, max_retries=2, backoff_base=0.001)
+    text = asyncio.run(client.generate(["prompt"]))
+    assert text.startswith("Condition Detected")
+    assert backend.calls == 3 and client.stats()["retries"] == 2
+
+def test_timeout_then_give_up():
+    backend = StubBackend(delay=0.5)
+    client = ReportClient(backend, timeout=0.05, max_retries=1, backoff_base=0.001)
+    try:
+        asyncio.run(client.generate(["prompt"]))
+        assert False, "expected ReportUnavailable"
+    except ReportUnavailable:
+        pass
+    assert client.stats()["timeouts"] == 2
+
+def test_semaphore_caps_in_flight_calls():
+    backend = StubBackend(delay=0.05)
+    client = ReportClient(backend, max_concurrency=2)
+
+    async def burst():
+        await asyncio.gather(*(client.generate([f"p{i}"]) for i in range(6)))
+
+    asyncio.run(burst())
+    assert backend.peak_concurrency == 2
+
+def test_breaker_opens_and_short_circuits():
+    backend = StubBackend(failures=100)
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+    client = ReportClient(backend, max_retries=0, breaker=breaker)
+
+    async def run():
+        for _ in range(2):
+            try:
+                await client.generate(["p"])
+            except ReportUnavailable:
+                pass
+        await client.generate(["p"])
+
+    try:
+        asyncio.run(run())
+        assert False, "expected CircuitOpen"
+    except CircuitOpen:
+        pass
+    assert breaker.state == "open"
+    assert backend.calls == 2 and client.stats()["short_circuited"] == 1
+
+def test_half_open_trial_closes_breaker():
+    backend = StubBackend(failures=1)
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    client = ReportClient(backend, max_retries=0, breaker=breaker)
+
+    async def run():
+        try:
+            await client.generate(["p"])
+        except ReportUnavailable:
+            pass
+        await asyncio.sleep(0.1)
+        return await client.generate(["p"])
+
+    assert asyncio.run(run()).startswith("Condition Detected")
+    assert breaker.state == "closed"
+
+def test_disconnect_during_trial_releases_it():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    stream_client = ReportClient(StreamingStubBackend(), max_retries=0, breaker=breaker)
+    slow_client = ReportClient(StubBackend(delay=1.0), max_retries=0, breaker=breaker)
+
+    async def run():
+        breaker.record_failure()
+        await asyncio.sleep(0.1)
+        stream = stream_client.stream(["a b c"])
+        await stream.__anext__()
+        await stream.aclose()                       # client went away mid-report
+        assert breaker.state == "half_open" and breaker.allow()
+        breaker.release_trial()
+
+        task = asyncio.create_task(slow_client.generate(["p"]))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        assert breaker.state == "half_open" and breaker.allow()
+
+    asyncio.run(run())
+
+def test_stream_retries_before_first_chunk():
+    backend = StreamingStubBackend(failures=1)
+    client = ReportClient(backend, max_retries=1, backoff_base=0.001)
+
+    async def collect():
+        return [chunk async for chunk in client.stream(["a b c"])]
+
+    chunks = asyncio.run(collect())
+    assert len(chunks) > 1
+    assert "".join(chunks).startswith("Condition Detected")
+    assert client.stats()["retries"] == 1 and client.breaker.state == "closed"
+
+def test_stream_failure_midway_is_not_retried():
+    backend = StreamingStubBackend(break_after=2)
+    client = ReportClient(backend, max_retries=2, backoff_base=0.001)
+    received = []
+
+    async def collect():
+        async for chunk in client.stream(["a b c"]):
+            received.append(chunk)
+
+    try:
+        asyncio.run(collect())
+        assert False, "expected ReportUnavailable"
+    except ReportUnavailable:
+        pass
+    assert len(received) == 2 and backend.calls == 1
+    assert client.stats()["failures"] == 1
+
+def test_templated_report_keeps_parsed_headers():
+    report = templated_report("ultrasound", [("Cyst", 0.82), ("Mass", 0.11)])
+    assert report.startswith("Condition Detected: Cyst")
+    assert "Disease Expected" not in report
+    assert "82.00%" in report
+    # Each modality gets only the header its routes parse
+    xray = templated_report("xray", [("Mass", 0.7)])
+    assert xray.startswith("Disease Expected: Mass") and "Condition Detected" not in xray
+    for modality in ("ct", "ct3d", "mri3d"):
+        assert templated_report(modality, [("Tumor", 0.9)]).startswith("Condition Detected: Tumor")
+
+if __name__ == "__main__":
+    test_retries_transient_failures()
+    test_timeout_then_give_up()
+    test_semaphore_caps_in_flight_calls()
+    test_breaker_opens_and_short_circuits()
+    test_half_open_trial_closes_breaker()
+    test_disconnect_during_trial_releases_it()
+    test_stream_retries_before_first_chunk()
+    test_stream_failure_midway_is_not_retried()
+    test_templated_report_keeps_parsed_headers()
+    print("Report client tests passed")
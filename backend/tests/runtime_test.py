@@ -0,0 +1,87 @@
+# test_runtime.py
+
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import torch
+from pathlib import Path
+from models import runtime
+from models.xray_model import CheXNet
+from models.ct_model import CTNet2D, CTNet3D
+from models.mri_model import MRINet2D, MRINet3D
+from models.ultrasound_model import load_ultrasound_model
+
+TOLERANCE = 1e-4
+
+# Small inputs keep the exports fast; the batch of 2 checks the dynamic batch axis
+def parity_cases(workdir: Path):
+    checkpoint = workdir / "USFM_random.pth"
+    torch.save({}, checkpoint)  # leaves the ViT randomly initialised
+    return [
+        ("xray", CheXNet(), (1, 3, 64, 64)),
+        ("ct2d", CTNet2D(), (1, 3, 64, 64)),
+        ("ct3d", CTNet3D(), (1, 1, 8, 32, 32)),
+        ("mri2d", MRINet2D(), (1, 3, 64, 64)),
+        ("mri3d", MRINet3D(), (1, 1, 8, 32, 32)),
+        ("ultrasound", load_ultrasound_model(checkpoint_path=checkpoint), (1, 3, 224, 224)),
+    ]
+
+def assert_parity(model, served, shape):
+    x = torch.randn(2, *shape[1:])
+    with torch.no_grad():
+        expected, actual = model(x), served(x)
+    assert actual.shape == expected.shape
+    assert (actual - expected).abs().max() < TOLERANCE
+
+
+def test_torchscript_and_onnx_match_eager():
+    torch.manual_seed(0)
+    with tempfile.TemporaryDirectory() as d:
+        workdir = Path(d)
+        for name, model, shape in parity_cases(workdir):
+            model.eval()
+            path = runtime.export_torchscript(model, torch.zeros(*shape), workdir / f"{name}.ts")
+            assert_parity(model, runtime.load_torchscript(path), shape)
+            if runtime.ort is not None:
+                path = runtime.export_onnx(model, torch.zeros(*shape), workdir / f"{name}.onnx")
+                assert_parity(model, runtime.load_onnxruntime(path), shape)
+
+def test_inductor_matches_eager():
+    model = CTNet3D().eval()
+    assert_parity(model, runtime.compile_inductor(model), (1, 1, 8, 32, 32))
+
+def test_backend_selection_and_eager_fallback():
+    with tempfile.TemporaryDirectory() as d:
+        weights = Path(d) / "resnet_200.pth"
+        torch.save({}, weights)
+        model = CTNet3D().eval()
+        os.environ["INFERENCE_BACKEND"] = "onnxruntime,ct3d=torchscript"
+        try:
+            assert runtime.requested_backend('xray') == 'onnxruntime'
+            assert runtime.requested_backend('ct3d') == 'torchscript'
+
+            # No artifact yet: served eager, and cached as eager
+            assert runtime.load_for_serving('ct3d', lambda: model, weights) is model
+            assert runtime.serving_variant('ct3d', weights) == 'fp32'
+
+            runtime.export_torchscript(model, torch.zeros(1, 1, 8, 32, 32), runtime.exported_path(weights, 'torchscript'))
+            served = runtime.load_for_serving('ct3d', lambda: model, weights)
+            assert isinstance(served, runtime.ExportedModel) and served.weight_bytes > 0
+            assert runtime.serving_variant('ct3d', weights) == 'torchscript'
+            assert runtime.serving_backend('ct3d', weights, device='cuda') == 'eager'
+
+            # Weights replaced after the export: the stale artifact is ignored
+            future = time.time() + 10
+            os.utime(weights, (future, future))
+            assert runtime.serving_backend('ct3d', weights) == 'eager'
+        finally:
+            del os.environ["INFERENCE_BACKEND"]
+
+if __name__ == "__main__":
+    test_torchscript_and_onnx_match_eager()
+    test_inductor_matches_eager()
+    test_backend_selection_and_eager_fallback()
+    print("Runtime tests passed")
@@ -0,0 +1,83 @@
+# test_sliding_window.py
+
+import os
+import sys
+import tempfile
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import nibabel as nib
+import numpy as np
+import torch
+from models.ct_model import CTNet3D, HU_WINDOW, predict_ct
+from models.sliding_window import blend_weights, patch_settings, patch_starts, sliding_window_logits
+from models.volume_io import NiftiVolume
+
+class DenseIdentity(torch.nn.Module):
+    # "Logits" are the input voxels, so the blended mean must be the volume mean
+    def forward(self, x):
+        return x
+
+class PatchMean(torch.nn.Module):
+    def forward(self, x):
+        return x.mean(dim=(2, 3, 4))
+
+def write_volume(path, shape=(70, 90, 50)):
+    rng = np.random.default_rng(0)
+    voxels = rng.integers(-1000, 1000, size=shape, dtype=np.int16)
+    nib.save(nib.Nifti1Image(voxels, np.eye(4)), path)
+    return nib.load(path).get_fdata()
+
+
+def test_patch_grid_covers_volume():
+    assert patch_starts(100, 64, 0.25) == [0, 36]
+    assert patch_starts(64, 64, 0.25) == [0]
+    starts = patch_starts(600, 64, 0.5)
+    assert starts[0] == 0 and starts[-1] == 600 - 64
+    assert max(np.diff(starts)) <= 32
+
+    # Blending weights of the patches over each voxel add up to 1
+    for length, patch in [(100, 64), (512, 224), (64, 64)]:
+        starts = patch_starts(length, patch, 0.25)
+        coverage = np.zeros(length)
+        for start, weight in zip(starts, blend_weights(length, patch, starts)):
+            coverage[start:start + patch] += weight
+        assert np.allclose(coverage, 1.0)
+
+def test_blended_logits_from_memory_mapped_volume():
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'ct.nii')
+        voxels = write_volume(path)
+        expected = np.clip((voxels - HU_WINDOW[0]) / (HU_WINDOW[1] - HU_WINDOW[0]), 0, 1).mean()
+        volume = NiftiVolume(path)
+        for batch_size in (1, 3):
+            for patch_size in [(32, 40, 64), (16, 16, 16)]:  # one axis shorter than the patch, and many patches
+                logits = sliding_window_logits(DenseIdentity(), volume, HU_WINDOW,
+                                               patch_size=patch_size, batch_size=batch_size)
+                assert abs(float(logits) - expected) < 1e-4
+
+        # A constant patch prediction survives blending unchanged
+        ones = sliding_window_logits(PatchMean(), volume, window=(-2000, -1000), patch_size=(32, 40, 64))
+        assert abs(float(ones) - 1.0) < 1e-5
+
+def test_ct_prediction_with_patches():
+    os.environ["VOLUME_PATCH_SIZE"] = "32,48,48"
+    os.environ["VOLUME_PATCH_OVERLAP"] = "0.5"
+    try:
+        assert patch_settings() == {"patch_size": (32, 48, 48), "overlap": 0.5, "batch_size": 2}
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'ct.nii.gz')
+            write_volume(path)
+            result = predict_ct(CTNet3D().eval(), path, mode="3d")
+        (_, prob_no), (_, prob_tumor), (_, label) = result
+        assert label in ("Tumor", "No Tumor", "Indeterminate")
+        assert abs(prob_no + prob_tumor - 1.0) < 1e-5
+    finally:
+        del os.environ["VOLUME_PATCH_SIZE"], os.environ["VOLUME_PATCH_OVERLAP"]
+    assert patch_settings() is None
+
+
+if __name__ == "__main__":
+    test_patch_grid_covers_volume()
+    test_blended_logits_from_memory_mapped_volume()
+    test_ct_prediction_with_patches()
+    print("Sliding-window tests passed")
@@ -22,7 +22,7 @@ def test_ultrasound():
 
         # Run prediction
         results = process_ultrasound(
-            image_path=image_path,
+            image=image_path,
             device=device,
             top_k=top_k
         )
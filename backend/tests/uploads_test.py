@@ -0,0 +1,78 @@
+# test_uploads.py
+
+import asyncio
+import hashlib
+import io
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import cv2
+import numpy as np
+from fastapi import HTTPException, UploadFile
+from services import uploads
+from services.prediction_cache import digest_source
+from services.uploads import UPLOAD_CHUNK_SIZE, read_upload, sniff_content_type
+
+class CountingFile(io.BytesIO):
+    # Records how much of the upload was actually pulled in
+    bytes_read = 0
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+def png(height=64, width=64):
+    return cv2.imencode('.png', np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8))[1].tobytes()
+
+def read(data, max_bytes, allowed_types=None, size=None):
+    source = CountingFile(data)
+    try:
+        return asyncio.run(read_upload(UploadFile(source, filename="scan.png", size=size), max_bytes, allowed_types)), source
+    except HTTPException as e:
+        return e, source
+
+
+def test_reads_hashes_and_sniffs():
+    data = png(600, 600)
+    upload, _ = read(data, 50 * 2**20, ["image/png"])
+    assert upload.data == data and upload.content_type == "image/png"
+    assert upload.digest == upload.data.digest == hashlib.sha256(data).hexdigest()
+    # The caches key on the digest computed while reading, without a second pass
+    original = hashlib.sha256
+    hashlib.sha256 = None
+    try:
+        assert digest_source(upload.data) == upload.digest
+    finally:
+        hashlib.sha256 = original
+
+def test_rejects_early():
+    data = png(1500, 1500)
+    assert len(data) > 3 * UPLOAD_CHUNK_SIZE
+    error, source = read(data, UPLOAD_CHUNK_SIZE + 10)
+    assert error.status_code == 413 and source.bytes_read <= 2 * UPLOAD_CHUNK_SIZE
+
+    # A declared size over the limit is refused without reading anything
+    error, source = read(data, UPLOAD_CHUNK_SIZE, size=len(data))
+    assert error.status_code == 413 and source.bytes_read == 0
+
+    # The type is known from the first chunk, whatever the file claims to be
+    error, source = read(b"%PDF-1.7\n" + bytes(4 * UPLOAD_CHUNK_SIZE), 50 * 2**20, ["image/png", "image/jpeg"])
+    assert error.status_code == 400 and source.bytes_read == UPLOAD_CHUNK_SIZE
+
+def test_signature_fallback_without_libmagic():
+    jpeg = cv2.imencode('.jpg', np.zeros((32, 32, 3), np.uint8))[1].tobytes()
+    dicom = bytes(128) + b"DICM" + bytes(64)
+    original, uploads.magic = uploads.magic, None
+    try:
+        assert [sniff_content_type(d) for d in (png(), jpeg, dicom, b"hello")] == \
+            ["image/png", "image/jpeg", "application/dicom", "application/octet-stream"]
+    finally:
+        uploads.magic = original
+
+
+if __name__ == "__main__":
+    test_reads_hashes_and_sniffs()
+    test_rejects_early()
+    test_signature_fallback_without_libmagic()
+    print("Upload tests passed")
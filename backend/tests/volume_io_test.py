@@ -0,0 +1,123 @@
+# test_volume_io.py
+
+import os
+import sys
+import tempfile
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import nibabel as nib
+import numpy as np
+from models.ct_model import CT_3D_SHAPE, HU_WINDOW, load_ct_volume, window_and_normalize
+from models.volume_io import NiftiVolume, open_volume, resample_volume
+from services.prediction_cache import digest_source
+
+def write_volume(path, shape=(20, 24, 28)):
+    # int16 voxels with header scaling, the way CT scanners store Hounsfield units
+    rng = np.random.default_rng(0)
+    voxels = rng.integers(0, 4000, size=shape, dtype=np.int16)
+    image = nib.Nifti1Image(voxels, np.diag([0.7, 0.7, 2.5, 1.0]))
+    image.header.set_data_dtype(np.int16)
+    image.header.set_slope_inter(0.5, -1024)
+    nib.save(image, path)
+    return nib.load(path).get_fdata()
+
+
+def test_data_and_slices_match_nibabel():
+    with tempfile.TemporaryDirectory() as d:
+        for name in ('ct.nii', 'ct.nii.gz'):
+            path = os.path.join(d, name)
+            expected = write_volume(path)
+            volume = NiftiVolume(path, chunk_slices=3)  # chunks that do not divide the depth
+
+            data = volume.data()
+            assert data.dtype == np.float32 and data.shape == expected.shape
+            assert np.allclose(data, expected)
+            assert np.allclose(volume.zooms, (0.7, 0.7, 2.5))
+
+            slices = volume.mid_slices()
+            assert np.allclose(slices["axial"], expected[10, :, :])
+            assert np.allclose(slices["coronal"], expected[:, 12, :])
+            assert np.allclose(slices["sagittal"], expected[:, :, 14])
+            assert all(s.dtype == np.float32 for s in slices.values())
+
+def test_uncompressed_volume_is_memory_mapped():
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'ct.nii')
+        write_volume(path)
+        volume = NiftiVolume(path)
+        assert isinstance(volume.raw(), np.memmap)
+        assert volume.raw().dtype == np.int16  # never widened on disk reads
+        assert open_volume(volume) is volume
+
+def test_digest_through_opened_volume():
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'ct.nii.gz')
+        write_volume(path)
+        with open(path, 'rb') as f:
+            raw = f.read()
+        assert digest_source(NiftiVolume(path)) == digest_source(raw) == digest_source(path)
+
+def test_in_place_windowing_matches_copy():
+    volume = np.linspace(-1000, 1000, 2 * 3 * 4, dtype=np.float32).reshape(2, 3, 4)
+    expected = window_and_normalize(volume.astype(np.float64))
+    result = window_and_normalize(volume, out=volume)
+    assert result is volume
+    assert np.allclose(volume, expected, atol=1e-6)
+
+def test_windowing_fused_into_conversion():
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'ct.nii')
+        expected = window_and_normalize(write_volume(path))
+        volume = NiftiVolume(path, chunk_slices=5)
+        assert np.allclose(volume.data(window=HU_WINDOW), expected, atol=1e-6)
+
+        lo, hi = volume.intensity_range()
+        plain = volume.data()
+        assert (lo, hi) == (plain.min(), plain.max())
+        assert np.allclose(volume.data(window=(lo, hi)), (plain - lo) / (hi - lo), atol=1e-6)
+
+def test_resample_keeps_anatomy_in_place():
+    # A ramp along each axis must stay a ramp; np.resize would have tiled/truncated it
+    z, y, x = np.meshgrid(np.linspace(0, 1, 130), np.linspace(0, 1, 450), np.linspace(0, 1, 300), indexing='ij')
+    volume = (z + 2 * y + 4 * x).astype(np.float32)
+    for source in (volume, np.asfortranarray(volume)):
+        resampled = resample_volume(source, CT_3D_SHAPE)
+        assert resampled.shape == CT_3D_SHAPE and resampled.flags.c_contiguous
+        assert abs(resampled[0, 0, 0]) < 0.05 and abs(resampled[-1, -1, -1] - 7) < 0.05
+        profile = resampled[:, 100, 100]
+        assert np.all(np.diff(profile) > 0)
+
+def test_spacing_aware_resampling():
+    # 40 slices of 5 mm on a 1 mm grid: at 2 mm isotropic that is 100 x 50 x 50 voxels
+    volume = np.ones((40, 100, 100), dtype=np.float32)
+    os.environ["VOLUME_SPACING"] = "2"
+    try:
+        resampled = resample_volume(volume, (64, 64, 64), spacing=(5.0, 1.0, 1.0))
+    finally:
+        del os.environ["VOLUME_SPACING"]
+    assert resampled.shape == (64, 64, 64)
+    assert np.allclose(resampled[:, 7:57, 7:57], 1.0)  # centered, in-plane zero padding around it
+    assert resampled[:, :7].max() == 0 and resampled[:, :, 57:].max() == 0
+    # Without VOLUME_SPACING the volume is stretched to fill the input
+    assert np.allclose(resample_volume(volume, (64, 64, 64), spacing=(5.0, 1.0, 1.0)), 1.0)
+
+def test_ct_model_input():
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'ct.nii.gz')
+        expected = window_and_normalize(write_volume(path, shape=(140, 96, 80)))
+        volume = load_ct_volume(path)
+        assert volume.shape == CT_3D_SHAPE and volume.dtype == np.float32
+        assert 0.0 <= volume.min() and volume.max() <= 1.0
+        assert abs(volume.mean() - expected.mean()) < 0.01
+
+
+if __name__ == "__main__":
+    test_data_and_slices_match_nibabel()
+    test_uncompressed_volume_is_memory_mapped()
+    test_digest_through_opened_volume()
+    test_in_place_windowing_matches_copy()
+    test_windowing_fused_into_conversion()
+    test_resample_keeps_anatomy_in_place()
+    test_spacing_aware_resampling()
+    test_ct_model_input()
+    print("Volume I/O tests passed")
@@ -0,0 +1,98 @@
+# test_weight_cache.py
+
+import json
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import torch
+import torch.nn as nn
+from pathlib import Path
+from models import weight_cache
+
+
+def wrapped_checkpoint(model):
+    # Checkpoints saved from DataParallel: prefixed keys inside 'state_dict'
+    return {"epoch": 3, "state_dict": {f"module.{k}": v for k, v in model.state_dict().items()}}
+
+def strip_prefix(ckpt):
+    return {k.replace("module.", ""): v for k, v in ckpt["state_dict"].items()}
+
+
+def test_converts_once_and_loads_converted_copy():
+    with tempfile.TemporaryDirectory() as d:
+        source = Path(d) / "model.pth"
+        model = nn.Sequential(nn.Linear(8, 4), nn.BatchNorm1d(4))
+        torch.save(wrapped_checkpoint(model), source)
+
+        calls = []
+        def prepare(ckpt):
+            calls.append(1)
+            return strip_prefix(ckpt)
+
+        first = weight_cache.load_state_dict(source, prepare)
+        second = weight_cache.load_state_dict(source, prepare)
+        assert len(calls) == 1
+
+        manifest = json.loads((Path(d) / weight_cache.MANIFEST_NAME).read_text())
+        entry = manifest["model.pth"]
+        assert entry["source_sha256"] == weight_cache.file_sha256(source)
+        assert weight_cache.verify(source)
+        assert weight_cache.is_derived_file(Path(d) / entry["converted"])
+
+        restored = nn.Sequential(nn.Linear(8, 4), nn.BatchNorm1d(4))
+        restored.load_state_dict(second, assign=True)
+        for k, v in model.state_dict().items():
+            assert torch.equal(first[k], v) and torch.equal(restored.state_dict()[k], v)
+
+def test_replaced_checkpoint_is_reconverted():
+    with tempfile.TemporaryDirectory() as d:
+        source = Path(d) / "model.pth"
+        torch.save(wrapped_checkpoint(nn.Linear(8, 4)), source)
+        weight_cache.load_state_dict(source, strip_prefix)
+
+        replacement = nn.Linear(8, 4)
+        time.sleep(0.01)
+        torch.save(wrapped_checkpoint(replacement), source)
+        loaded = weight_cache.load_state_dict(source, strip_prefix)
+        assert torch.equal(loaded["weight"], replacement.weight)
+
+def test_touched_checkpoint_is_hashed_once():
+    with tempfile.TemporaryDirectory() as d:
+        source = Path(d) / "model.pth"
+        torch.save(wrapped_checkpoint(nn.Linear(8, 4)), source)
+        weight_cache.load_state_dict(source, strip_prefix)
+        st = source.stat()
+        os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))  # e.g. a fresh checkout
+
+        hashed, original = [], weight_cache.file_sha256
+        weight_cache.file_sha256 = lambda path: hashed.append(Path(path).name) or original(path)
+        try:
+            for _ in range(3):
+                weight_cache.load_state_dict(source, strip_prefix)
+        finally:
+            weight_cache.file_sha256 = original
+        assert hashed == ["model.pth"]
+        entry = json.loads((Path(d) / weight_cache.MANIFEST_NAME).read_text())["model.pth"]
+        assert entry["source_mtime_ns"] == source.stat().st_mtime_ns
+
+def test_converted_copy_serves_without_original():
+    with tempfile.TemporaryDirectory() as d:
+        source = Path(d) / "model.pth"
+        model = nn.Linear(8, 4)
+        torch.save(wrapped_checkpoint(model), source)
+        weight_cache.convert(source, strip_prefix)
+        os.remove(source)
+
+        assert weight_cache.has_weights(source)
+        loaded = weight_cache.load_state_dict(source, strip_prefix)
+        assert torch.equal(loaded["bias"], model.bias)
+
+if __name__ == "__main__":
+    test_converts_once_and_loads_converted_copy()
+    test_replaced_checkpoint_is_reconverted()
+    test_touched_checkpoint_is_hashed_once()
+    test_converted_copy_serves_without_original()
+    print("Weight cache tests passed")
@@ -0,0 +1,105 @@
+# test_xray_batching.py
+
+import asyncio
+import os
+import sys
+import threading
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import cv2
+import numpy as np
+from services import executor, xray_service
+from services.xray_service import XrayBatcher, aprocess_xray
+
+def fake_run_batch(tensors):
+    # Each "tensor" is just an int; return a full sorted prediction list per item
+    return [[(f"class_{t}", 0.9), ("other", 0.5), ("rest", 0.1)] for t in tensors]
+
+def test_concurrent_requests_share_a_batch():
+    batcher = XrayBatcher(fake_run_batch, max_batch_size=8, max_wait_ms=200)
+    results = {}
+
+    def call(i):
+        results[i] = batcher.submit(i, top_k=2).result(timeout=5)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.stop()
+
+    # Every caller receives its own top-k
+    for i in range(8):
+        assert results[i] == [(f"class_{i}", 0.9), ("other", 0.5)]
+
+    stats = batcher.stats()
+    assert stats["requests"] == 8
+    assert stats["batches"] < 8
+
+def test_flushes_on_max_wait():
+    batcher = XrayBatcher(fake_run_batch, max_batch_size=64, max_wait_ms=5)
+    preds = batcher.submit(3, top_k=1).result(timeout=5)
+    batcher.stop()
+    assert preds == [("class_3", 0.9)]
+    assert batcher.stats()["last_batch_size"] == 1
+
+def test_errors_propagate_to_callers():
+    def failing(tensors):
+        raise RuntimeError("boom")
+
+    batcher = XrayBatcher(failing, max_batch_size=4, max_wait_ms=1)
+    future = batcher.submit(0)
+    try:
+        future.result(timeout=5)
+        assert False, "expected RuntimeError"
+    except RuntimeError as e:
+        assert str(e) == "boom"
+    finally:
+        batcher.stop()
+
+def test_async_requests_share_a_batch_on_one_worker():
+    # Waiting for the batch must not hold an inference worker, or one worker means batches of one
+    def labelled(tensors):
+        return [[(f"mean_{int(t.mean())}", 0.9)] for t in tensors]
+
+    images = [cv2.imencode('.png', np.full((64, 64, 3), 40 * i, np.uint8))[1].tobytes() for i in range(6)]
+    batcher = XrayBatcher(labelled, max_batch_size=8, max_wait_ms=500)
+    pools, original = dict(executor._pools), xray_service._xray_batcher
+    executor._pools["inference"] = executor.BoundedPool("inference", 1, 16)
+    xray_service._xray_batcher = batcher
+    os.environ["PREDICTION_CACHE"] = "0"
+
+    async def run_all():
+        return await asyncio.gather(*(aprocess_xray(data, top_k=1) for data in images))
+
+    try:
+        results = asyncio.run(run_all())
+    finally:
+        batcher.stop()
+        executor._pools.clear()
+        executor._pools.update(pools)
+        xray_service._xray_batcher = original
+        del os.environ["PREDICTION_CACHE"]
+
+    assert len({label for (label, _), in results}) == 6  # each caller gets its own image's result
+    assert batcher.stats()["requests"] == 6 and batcher.stats()["batches"] == 1
+
+def test_cancelled_requests_are_skipped():
+    seen = []
+    batcher = XrayBatcher(lambda tensors: seen.extend(tensors) or fake_run_batch(tensors),
+                          max_batch_size=8, max_wait_ms=100)
+    gone = batcher.submit(1)
+    kept = batcher.submit(2)
+    assert gone.cancel()
+    assert kept.result(timeout=5)[0] == ("class_2", 0.9)
+    batcher.stop()
+    assert seen == [2]
+
+if __name__ == "__main__":
+    test_concurrent_requests_share_a_batch()
+    test_flushes_on_max_wait()
+    test_errors_propagate_to_callers()
+    test_async_requests_share_a_batch_on_one_worker()
+    test_cancelled_requests_are_skipped()
+    print("X-ray batching tests passed")
@@ -11,7 +11,7 @@ def test_xray(image_path: str, device: str = "cpu", top_k: int = 3):
         init_xray_model(device=device)
 
         # Run prediction
-        results = process_xray(image_path=image_path, device=device, top_k=top_k)
+        results = process_xray(image=image_path, device=device, top_k=top_k)
 
         # Print results
         print("\nX-Ray Prediction Results:")